@@ -0,0 +1,97 @@
+"""Archive synthetic channels with ArchiveCog.archive_one_channel, downloading their attachments
+from a local server, and report wall time, peak RSS, bytes written and event loop lag.
+
+Every combination of the given message counts, attachment counts and attachment sizes is run,
+each in a fresh process so its peak RSS is its own.
+
+Usage: python -m benchmarks.archive_channel [--messages 10000 ...] [--attachments 500 ...]
+    [--size 262144 ...] [--page-delay 0.0] [--filesize-limit 26214400]
+"""
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from typing import Any, Dict
+
+from benchmarks.fakes import AttachmentServer, make_channel
+from benchmarks.loop_lag import LoopLagMonitor
+
+MEGABYTE = 1_048_576
+
+
+async def archive(
+    messages: int, attachments: int, size: int, page_delay: float, filesize_limit: int
+) -> Dict[str, Any]:
+    # Imported here so the cog's state files end up in the benchmark's directory
+    from modules.archive import archive_utils
+    from modules.archive.archive_downloads import ArchiveStats
+    from modules.archive.cog import ArchiveCog
+
+    cog = ArchiveCog(None)
+    async with AttachmentServer() as server:
+        channel = make_channel(server, messages, attachments, size, page_delay)
+        stats = ArchiveStats()
+        with archive_utils.create_workspace() as workspace:
+            async with LoopLagMonitor() as lag:
+                start = time.perf_counter()
+                zip_files, zip_size, textfile, textfile_size = await cog.archive_one_channel(
+                    channel, workspace, stats, filesize_limit=filesize_limit
+                )
+                elapsed = time.perf_counter() - start
+            for file in [*zip_files, textfile]:
+                file.close()
+    return {
+        "elapsed": elapsed,
+        "volumes": len(zip_files),
+        "zip_bytes": zip_size,
+        "text_log_bytes": textfile_size,
+        "downloaded_bytes": stats.bytes_downloaded,
+        "lag": str(lag),
+    }
+
+
+def run_case(case) -> Dict[str, Any]:
+    """Runs in its own process, in a directory of its own"""
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        result = asyncio.run(archive(*case))
+    # ru_maxrss is in kilobytes on Linux
+    result["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--attachments", type=int, nargs="+", default=[0, 500])
+    parser.add_argument("--size", type=int, nargs="+", default=[256 * 1024])
+    parser.add_argument("--page-delay", type=float, default=0.0)
+    parser.add_argument("--filesize-limit", type=int, default=25 * MEGABYTE)
+    args = parser.parse_args()
+
+    cases = [
+        (messages, attachments, size, args.page_delay, args.filesize_limit)
+        for messages, attachments, size in itertools.product(
+            args.messages, args.attachments, args.size
+        )
+    ]
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_case, (case,))
+        messages, attachments, size = case[:3]
+        print(
+            f"{messages:>7} messages, {attachments:>5} x {size / 1024:.0f}KB attachments: "
+            f"{result['elapsed']:.2f}s, peak RSS {result['peak_rss'] / MEGABYTE:.0f}MB, "
+            f"{result['downloaded_bytes'] / MEGABYTE:.1f}MB downloaded, "
+            f"{result['zip_bytes'] / MEGABYTE:.1f}MB written in {result['volumes']} volumes "
+            f"plus a {result['text_log_bytes'] / MEGABYTE:.1f}MB chat log, {result['lag']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare event loop lag while writing an archive's chat log, exports and search index on the
+event loop, against handing them to the BatchWriter thread.
+
+Usage: python -m benchmarks.archive_writer [messages]
+"""
+import asyncio
+import datetime
+import functools
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.loop_lag import LoopLagMonitor
+from modules.archive import archive_exporters
+from modules.archive.archive_search import SearchIndex
+
+# Messages per page of channel.history(), which is when a real archive yields to the loop
+PAGE_SIZE = 100
+
+
+def make_records(count: int):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return [
+        {
+            "id": n,
+            "created_at": (start + datetime.timedelta(seconds=n)).isoformat(),
+            "edited_at": None,
+            "author": {"id": n % 7, "name": f"user{n % 7}", "display_name": f"User {n % 7}"},
+            "content": f"message number {n} with some words to index and escape <b>",
+            "clean_content": f"message number {n} with some words to index and escape <b>",
+            "reply_to": n - 1 if n % 10 == 0 else None,
+            "pinned": False,
+            "attachments": [],
+            "embeds": [],
+            "reactions": [],
+        }
+        for n in range(count)
+    ]
+
+
+def open_exporters(directory: str, index: SearchIndex):
+    return [
+        functools.partial(archive_exporters.TextExporter, os.path.join(directory, "log.txt")),
+        functools.partial(archive_exporters.JsonlExporter, os.path.join(directory, "m.jsonl")),
+        functools.partial(archive_exporters.HtmlExporter, os.path.join(directory, "m.html")),
+        functools.partial(index.writer, 1, 1, "general"),
+    ]
+
+
+async def write_inline(records, directory: str, index: SearchIndex) -> None:
+    """How archive_one_channel used to write: every exporter, on the event loop"""
+    exporters = [open_exporter() for open_exporter in open_exporters(directory, index)]
+    for n, record in enumerate(records):
+        for exporter in exporters:
+            exporter.write(record)
+        if n % PAGE_SIZE == 0:
+            await asyncio.sleep(0)
+    for exporter in exporters:
+        exporter.close()
+
+
+async def write_batched(records, directory: str, index: SearchIndex) -> None:
+    async with archive_exporters.BatchWriter(open_exporters(directory, index)) as writer:
+        for n, record in enumerate(records):
+            await writer.write(record)
+            if n % PAGE_SIZE == 0:
+                await asyncio.sleep(0)
+
+
+async def main(count: int) -> None:
+    records = make_records(count)
+    for name, write in [("inline", write_inline), ("writer thread", write_batched)]:
+        with tempfile.TemporaryDirectory() as directory:
+            index = SearchIndex(os.path.join(directory, "index.sqlite3"))
+            async with LoopLagMonitor() as lag:
+                start = time.perf_counter()
+                await write(records, directory, index)
+                elapsed = time.perf_counter() - start
+            print(f"{name:>13}: {count} messages in {elapsed:.2f}s, {lag}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000))
@@ -0,0 +1,155 @@
+"""Stand-ins for the Discord objects an archive reads, so archiving can be measured without a
+live server. Attachments are real HTTP downloads from a local AttachmentServer."""
+import asyncio
+import datetime
+import os
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+# Messages per page of channel.history()
+PAGE_SIZE = 100
+# Attachment types to cycle through, a mix of stored media and compressible text
+FILENAMES = ["image.png", "clip.mp4", "notes.txt", "data.json"]
+
+
+class AttachmentServer:
+    """Serves attachments over HTTP on localhost. Attachments of the same size share random
+    contents, generated once, but each starts with its own ID so none of them are duplicates.
+    Use as an async context manager"""
+
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.base_url = ""
+        self._runner: Optional[web.AppRunner] = None
+        self._contents: Dict[int, bytes] = {}
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/attachments/{attachment_id}/{size}/{filename}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/attachments"
+        self.session = aiohttp.ClientSession()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        await self._runner.cleanup()
+
+    def contents(self, size: int) -> bytes:
+        if size not in self._contents:
+            self._contents[size] = os.urandom(size)
+        return self._contents[size]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        contents = self.contents(int(request.match_info["size"]))
+        prefix = int(request.match_info["attachment_id"]).to_bytes(8, "big")[: len(contents)]
+        return web.Response(body=prefix + contents[len(prefix) :])
+
+    def attachment(self, attachment_id: int, filename: str, size: int) -> "FakeAttachment":
+        url = f"{self.base_url}/{attachment_id}/{size}/{filename}"
+        return FakeAttachment(attachment_id, filename, size, url, self.session)
+
+
+class FakeAttachment:
+    def __init__(
+        self,
+        attachment_id: int,
+        filename: str,
+        size: int,
+        url: str,
+        session: aiohttp.ClientSession,
+    ):
+        self.id = attachment_id
+        self.filename = filename
+        self.size = size
+        self.url = url
+        self._session = session
+
+    async def read(self) -> bytes:
+        async with self._session.get(self.url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+
+class FakeAuthor:
+    def __init__(self, author_id: int):
+        self.id = author_id
+        self.name = f"user{author_id}"
+        self.display_name = f"User {author_id}"
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, content: str, attachments: List[FakeAttachment]):
+        self.id = message_id
+        self.created_at = datetime.datetime(
+            2024, 1, 1, tzinfo=datetime.timezone.utc
+        ) + datetime.timedelta(minutes=message_id)
+        self.edited_at = None
+        self.author = FakeAuthor(message_id % 7)
+        self.content = content
+        self.clean_content = content
+        self.reference = None
+        self.pinned = False
+        self.attachments = attachments
+        self.embeds = []
+        self.reactions = []
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int = 1):
+        self.id = guild_id
+
+
+class FakeTextChannel:
+    """Pages through its messages like channel.history(), yielding to the loop between pages
+    the way a request to Discord would, after page_delay seconds"""
+
+    def __init__(self, name: str, messages: List[FakeMessage], page_delay: float = 0.0):
+        self.id = 1
+        self.name = name
+        self.mention = f"#{name}"
+        self.guild = FakeGuild()
+        self.messages = messages
+        self.page_delay = page_delay
+
+    async def history(
+        self, limit=None, oldest_first: bool = True, after=None
+    ) -> AsyncIterator[FakeMessage]:
+        messages = [msg for msg in self.messages if after is None or msg.id > after.id]
+        for start in range(0, len(messages), PAGE_SIZE):
+            await asyncio.sleep(self.page_delay)
+            for msg in messages[start : start + PAGE_SIZE]:
+                yield msg
+
+
+def make_channel(
+    server: AttachmentServer,
+    messages: int,
+    attachments: int,
+    attachment_size: int,
+    page_delay: float = 0.0,
+) -> FakeTextChannel:
+    """A channel of messages with attachments spread evenly between them"""
+    every = max(1, messages // attachments) if attachments else None
+    channel_messages = []
+    attachment_id = 0
+    for message_id in range(1, messages + 1):
+        message_attachments = []
+        if every is not None and message_id % every == 0 and attachment_id < attachments:
+            attachment_id += 1
+            filename = FILENAMES[attachment_id % len(FILENAMES)]
+            message_attachments.append(server.attachment(attachment_id, filename, attachment_size))
+        channel_messages.append(
+            FakeMessage(
+                message_id,
+                f"message {message_id} of the benchmark channel, with a few words to index",
+                message_attachments,
+            )
+        )
+    return FakeTextChannel("benchmark", channel_messages, page_delay)
@@ -0,0 +1,47 @@
+import asyncio
+import time
+from typing import List, Optional
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop runs a task that wakes up every interval seconds.
+
+    Anything that blocks the loop (e.g. disk I/O or CPU work done inline) shows up as lag, the
+    same way it would delay the gateway heartbeat and every other command. Use as an async
+    context manager around the code being measured.
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - start - self.interval)
+
+    @property
+    def max_ms(self) -> float:
+        return max(self.lags, default=0.0) * 1000
+
+    def percentile_ms(self, percent: float) -> float:
+        if not self.lags:
+            return 0.0
+        lags = sorted(self.lags)
+        return lags[min(len(lags) - 1, int(len(lags) * percent / 100))] * 1000
+
+    def __str__(self):
+        return (
+            f"loop lag p50 {self.percentile_ms(50):.2f}ms, p99 {self.percentile_ms(99):.2f}ms, "
+            f"max {self.max_ms:.2f}ms"
+        )
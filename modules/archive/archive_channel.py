@@ -0,0 +1,324 @@
+import asyncio
+import collections
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import nextcord
+
+from modules.archive import archive_constants, archive_exporters, archive_utils
+from modules.archive.archive_checkpoints import ChannelCheckpoint, CheckpointStore
+from modules.archive.archive_dedup import DedupIndex
+from modules.archive.archive_downloads import ArchiveStats, DownloadPool
+from modules.archive.archive_jobs import CancelToken
+from modules.archive.archive_names import NameRegistry
+from modules.archive.archive_search import SearchIndex
+from modules.archive.archive_volumes import VolumeWriter
+
+# A message record, its attachments with the names they're saved under, and their downloads
+PendingRecord = Tuple[
+    Dict[str, Any], List[Tuple[nextcord.Attachment, Optional[str]]], List[asyncio.Task]
+]
+
+
+class ChannelArchive:
+    """One channel's archive, written into a workspace: the zip, its volumes if it's split, the
+    chat log and the exports.
+
+    Attachments are downloaded by a pool while the history keeps paginating, and written into
+    the zip by a single writer thread. Repeats are only saved once, see DedupIndex. The chat
+    log, exports and search index are written in the same pass, by a BatchWriter.
+
+    With a checkpoint, only the messages after it are archived, into the delta paths, and the
+    checkpoint is moved forward. With merge as well, the delta is only written to be merged.
+    """
+
+    def __init__(
+        self,
+        channel: nextcord.TextChannel,
+        workspace: str,
+        search_index: SearchIndex,
+        stats: ArchiveStats,
+        dedup: DedupIndex,
+        cancel: CancelToken,
+        formats: List[str],
+        volume_limit: Optional[int] = None,
+        text_only: bool = False,
+        checkpoint: Optional[ChannelCheckpoint] = None,
+        merge: bool = False,
+    ):
+        self.channel = channel
+        self.workspace = workspace
+        self.search_index = search_index
+        self.stats = stats
+        self.dedup = dedup
+        self.cancel = cancel
+        self.volume_limit = volume_limit
+        # A text only archive links every attachment in the chat log rather than downloading it
+        self.text_only = text_only
+        self.checkpoint = checkpoint
+        self.merge = merge
+        # Archives are told apart by channel ID, as channels in different categories often share
+        # a name. The name is only for showing
+        self.where = channel.id
+        dedup.name_archive(self.where, f"the #{channel.name} archive")
+        # The names of everything saved in this archive's zip
+        self.names = NameRegistry()
+        suffix = ""
+        if checkpoint is not None:
+            suffix = archive_constants.DELTA_SUFFIX
+            self._add_checkpoint()
+
+        self.merged_formats = formats
+        self.records_format = archive_exporters.JsonlExporter.extension
+        if checkpoint is not None and merge:
+            # A delta that's about to be merged only needs the message records, the merged
+            # exports are built from those
+            formats = [self.records_format]
+        elif checkpoint is not None and self.records_format not in formats:
+            # The store needs the records to build merged exports from later
+            formats = [*formats, self.records_format]
+        self.zip_path = archive_utils.get_zip_path(workspace, channel, suffix)
+        self.text_log_path = archive_utils.get_text_log_path(workspace, channel, suffix)
+        self.text_log_arcname = os.path.join(
+            archive_constants.ARCHIVE,
+            os.path.basename(archive_utils.get_text_log_path("", channel)),
+        )
+        self.duplicates_arcname = os.path.join(
+            archive_constants.ARCHIVE, channel.name + "_" + archive_constants.DUPLICATES_PATH
+        )
+        self.export_paths = {
+            extension: archive_utils.get_export_path(workspace, channel, extension, suffix)
+            for extension in formats
+        }
+        self.export_arcnames = {
+            extension: os.path.join(
+                archive_constants.ARCHIVE,
+                os.path.basename(archive_utils.get_export_path("", channel, extension)),
+            )
+            for extension in set(formats) | set(self.merged_formats)
+        }
+
+        self.volumes: Optional[VolumeWriter] = None
+        self._zip_writer: Optional[ThreadPoolExecutor] = None
+        # Records whose attachments might still turn out to be repeats, oldest first. A repeat
+        # isn't saved, so its record has to name the copy that is, which is only known once the
+        # downloads are done
+        self._unwritten: Deque[PendingRecord] = collections.deque()
+
+    def _add_checkpoint(self) -> None:
+        """Keep new attachments from clashing with, or saving again, the ones already archived"""
+        self.names.update(self.checkpoint.attachments)
+        earlier = self.where
+        if not self.merge:
+            earlier = (self.channel.id, "earlier")
+            self.dedup.name_archive(earlier, f"an earlier #{self.channel.name} archive")
+        for arcname, entry in self.checkpoint.attachments.items():
+            if "sha256" in entry:
+                self.dedup.add_id(self.where, entry["id"], entry["size"], (earlier, arcname))
+                self.dedup.add_hash(self.where, entry["sha256"], (earlier, arcname))
+
+    async def write(self, history: AsyncIterator[nextcord.Message]) -> List[str]:
+        """Archive every message in history, returning the paths of the zip volumes. Stops with
+        ArchiveCancelled at the first cancellation point after a cancel"""
+        # A delta that's about to be merged is never sent, so it doesn't need splitting
+        self.volumes = VolumeWriter(self.zip_path, None if self.merge else self.volume_limit)
+        self._zip_writer = ThreadPoolExecutor(max_workers=1)
+        # The writer thread is shut down before the zip is closed, even if archiving failed
+        with self.volumes, self._zip_writer:
+            async with archive_exporters.BatchWriter(
+                self._open_exporters(), cancel=self.cancel
+            ) as exporters:
+                async with DownloadPool(
+                    archive_constants.DOWNLOAD_POOL_SIZE,
+                    self.stats,
+                    self.cancel,
+                    archive_constants.DOWNLOAD_POOL_BYTES,
+                ) as pool:
+                    async for msg in history:
+                        self.cancel.check()
+                        await self._add_message(msg, pool, exporters)
+                # Every download is done, so the rest of the records can be written
+                await self._write_records(exporters, wait=True)
+            await self._finish_zip()
+        return self.volumes.paths
+
+    def _open_exporters(self) -> List[functools.partial]:
+        """The chat log, exports and search index, all written by the BatchWriter's thread"""
+        open_exporters = [functools.partial(archive_exporters.TextExporter, self.text_log_path)]
+        for extension, path in self.export_paths.items():
+            open_exporters.append(functools.partial(archive_exporters.EXPORTERS[extension], path))
+        open_exporters.append(
+            functools.partial(
+                self.search_index.writer,
+                self.channel.guild.id,
+                self.channel.id,
+                self.channel.name,
+            )
+        )
+        return open_exporters
+
+    async def _add_message(
+        self,
+        msg: nextcord.Message,
+        pool: DownloadPool,
+        exporters: archive_exporters.BatchWriter,
+    ) -> None:
+        # Each attachment and the name it's saved under, or None if it's linked
+        saved_attachments = []
+        downloads = []
+        for attachment in msg.attachments:
+            saved_as, download = await self._add_attachment(attachment, pool)
+            saved_attachments.append((attachment, saved_as))
+            if download is not None:
+                downloads.append(download)
+        self._unwritten.append(
+            (archive_exporters.message_record(msg, saved_attachments), saved_attachments, downloads)
+        )
+        await self._write_records(exporters)
+        self.stats.messages_archived += 1
+        self.stats.last_message_id = msg.id
+        if self.checkpoint is not None:
+            self.checkpoint.last_message_id = msg.id
+
+    async def _add_attachment(
+        self, attachment: nextcord.Attachment, pool: DownloadPool
+    ) -> Tuple[Optional[str], Optional[asyncio.Task]]:
+        """Claim a name for an attachment in the zip and start downloading it, unless it's a
+        repeat or can't be sent. Returns the name, or None if it's linked, and its download"""
+        # change duplicate filenames
+        # img.png would become img (1).png
+        # Names are claimed here rather than when the download finishes, so they don't depend
+        # on the order the downloads complete in
+        original_path = os.path.join(
+            archive_constants.ARCHIVE, archive_constants.IMAGES, attachment.filename
+        )
+        # There's no point downloading what can't be sent, link to it instead
+        if self.text_only or (
+            self.volume_limit is not None and not self.volumes.fits(original_path, attachment.size)
+        ):
+            self.stats.attachments_too_big += 1
+            return None, None
+        proposed_path = self.names.claim(original_path)
+        # The same attachment was already saved, so don't download it again
+        original = self.dedup.find_by_id(self.where, attachment.id, attachment.size)
+        if original is not None:
+            self.dedup.add_duplicate(self.where, proposed_path, original)
+            self.stats.duplicates += 1
+            self.stats.duplicate_bytes += attachment.size
+            self.stats.downloads_skipped += 1
+            if self.checkpoint is not None:
+                self.checkpoint.add_attachment(
+                    proposed_path, attachment.id, attachment.size, duplicate_of=original[1]
+                )
+            return proposed_path, None
+        self.dedup.add_id(self.where, attachment.id, attachment.size, (self.where, proposed_path))
+        # Attachments never touch disk, they're written into the zip as soon as they've been
+        # downloaded
+        download = await pool.submit(
+            attachment, functools.partial(self._save_attachment, proposed_path, attachment)
+        )
+        return proposed_path, download
+
+    async def _save_attachment(
+        self, arcname: str, attachment: nextcord.Attachment, data: bytes
+    ) -> None:
+        """Write a downloaded attachment into the zip, unless the same file is already saved"""
+        digest = await asyncio.to_thread(self.dedup.hash, data)
+        original = self.dedup.find_by_hash(self.where, digest)
+        if original is not None:
+            self.dedup.add_duplicate(self.where, arcname, original)
+            # Later repeats of this attachment, and its record, point at the saved copy
+            self.dedup.add_id(self.where, attachment.id, attachment.size, original)
+            self.stats.duplicates += 1
+            self.stats.duplicate_bytes += len(data)
+            if self.checkpoint is not None:
+                self.checkpoint.add_attachment(
+                    arcname, attachment.id, attachment.size, duplicate_of=original[1]
+                )
+            return
+        self.dedup.add_hash(self.where, digest, (self.where, arcname))
+        await self._in_zip_writer(self._write_entry, arcname, data)
+        self.stats.bytes_written += len(data)
+        if self.checkpoint is not None:
+            self.checkpoint.add_attachment(arcname, attachment.id, attachment.size, sha256=digest)
+
+    async def _write_records(
+        self, exporters: archive_exporters.BatchWriter, wait: bool = False
+    ) -> None:
+        """Write the records whose downloads are done, keeping them in order. With wait, write
+        them all, which is only safe once every download is done"""
+        while self._unwritten and (wait or all(task.done() for task in self._unwritten[0][2])):
+            record, saved_attachments, _ = self._unwritten.popleft()
+            for entry, (attachment, saved_as) in zip(record["attachments"], saved_attachments):
+                if saved_as is None:
+                    continue
+                saved_where, entry["saved_as"] = self.dedup.find_by_id(
+                    self.where, attachment.id, attachment.size
+                )
+                if saved_where != self.where:
+                    # Saved in another archive, e.g. another channel of the job
+                    archive_name = self.dedup.describe_archive(saved_where)
+                    entry["duplicate_of"] = f"{entry['saved_as']} in {archive_name}"
+                    entry["saved_as"] = None
+            await exporters.write(record)
+
+    async def _finish_zip(self) -> None:
+        """Add the duplicates list, exports and chat log to the zip, and close it"""
+        duplicates = self.dedup.describe_duplicates(self.where)
+        if duplicates:
+            await self._in_zip_writer(
+                self._write_entry, self.duplicates_arcname, duplicates.encode()
+            )
+        for extension, path in self.export_paths.items():
+            self.cancel.check()
+            await self._in_zip_writer(self.volumes.write, path, self.export_arcnames[extension])
+        self.cancel.check()
+        # The chat log is also sent on its own
+        await self._in_zip_writer(self.volumes.write, self.text_log_path, self.text_log_arcname)
+        # Writing the zip's central directory can take a while too
+        await self._in_zip_writer(self.volumes.close)
+
+    def _in_zip_writer(self, func, *args) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self._zip_writer, func, *args)
+
+    def _write_entry(self, arcname: str, data: bytes) -> None:
+        """Runs in the zip writer. Writes queued up before a cancel are skipped"""
+        self.cancel.check()
+        self.volumes.writestr(arcname, data)
+
+    async def write_merged(self, store: CheckpointStore) -> Tuple[List[str], str]:
+        """Build the merged archive from the stored history followed by the delta written by
+        write. Returns the paths of its zip volumes and its chat log. The delta is kept, so it
+        can be committed to the store after sending"""
+        text_log_path = archive_utils.get_text_log_path(self.workspace, self.channel)
+        merged_export_paths = {
+            extension: archive_utils.get_export_path(self.workspace, self.channel, extension)
+            for extension in self.merged_formats
+        }
+        with VolumeWriter(
+            archive_utils.get_zip_path(self.workspace, self.channel), self.volume_limit
+        ) as merged_volumes:
+            await asyncio.to_thread(
+                store.merge_into,
+                self.checkpoint,
+                self.volumes.paths,
+                self.text_log_path,
+                merged_volumes,
+                text_log_path,
+                self.text_log_arcname,
+                self.duplicates_arcname,
+            )
+            self.cancel.check()
+            await asyncio.to_thread(
+                store.merge_exports,
+                self.checkpoint,
+                self.export_paths[self.records_format],
+                merged_export_paths,
+            )
+            for extension, path in merged_export_paths.items():
+                self.cancel.check()
+                await asyncio.to_thread(merged_volumes.write, path, self.export_arcnames[extension])
+            await asyncio.to_thread(merged_volumes.close)
+        return merged_volumes.paths, text_log_path
@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+import zipfile
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Union
+
+from modules.archive import archive_constants, archive_exporters
+from modules.archive.archive_volumes import VolumeWriter
+from utils import file_utils
+
+
+@dataclass
+class ChannelCheckpoint:
+    """How far a channel has been archived, and the attachments already saved for it"""
+
+    channel_id: int
+    last_message_id: Optional[int] = None
+    # Maps the name of each attachment inside the zip to its Discord id and size, plus either
+    # its content hash, or the name of the saved copy it's a duplicate of
+    attachments: Dict[str, Dict[str, Union[int, str]]] = field(default_factory=dict)
+
+    def add_attachment(
+        self,
+        arcname: str,
+        attachment_id: int,
+        size: int,
+        sha256: Optional[str] = None,
+        duplicate_of: Optional[str] = None,
+    ) -> None:
+        entry = {"id": attachment_id, "size": size}
+        if sha256 is not None:
+            entry["sha256"] = sha256
+        if duplicate_of is not None:
+            entry["duplicate_of"] = duplicate_of
+        self.attachments[arcname] = entry
+
+
+class CheckpointStore:
+    """Local store for incremental archives, kept outside the archive dir so it isn't wiped.
+
+    Each channel gets a folder holding its checkpoint and a running copy of everything
+    archived so far (the attachments zip, the chat log and the message records), which merged
+    archives are built from.
+    """
+
+    CHECKPOINT_FILE = "checkpoint.json"
+    TEXT_LOG_FILE = "text_log.txt"
+    RECORDS_FILE = "messages.jsonl"
+    ATTACHMENTS_FILE = "attachments.zip"
+
+    def __init__(self, root: str = archive_constants.CHECKPOINT_DIR):
+        self.root = root
+
+    def _channel_dir(self, channel_id: int) -> str:
+        return os.path.join(self.root, str(channel_id))
+
+    def _path(self, channel_id: int, filename: str) -> str:
+        return os.path.join(self._channel_dir(channel_id), filename)
+
+    def load(self, channel_id: int) -> ChannelCheckpoint:
+        """Get the checkpoint for a channel, or an empty one if it has never been archived"""
+        path = self._path(channel_id, self.CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return ChannelCheckpoint(channel_id=channel_id)
+        with open(path, "r") as f:
+            return ChannelCheckpoint(**json.load(f))
+
+    def merge_into(
+        self,
+        checkpoint: ChannelCheckpoint,
+        delta_zip_paths: List[str],
+        delta_text_log_path: str,
+        volumes: VolumeWriter,
+        text_log_path: str,
+        text_log_arcname: str,
+        duplicates_arcname: str,
+    ) -> None:
+        """Build a merged archive in volumes and at text_log_path from the stored history
+        followed by the delta archive. The store itself is left untouched"""
+        stored_text_log = self._path(checkpoint.channel_id, self.TEXT_LOG_FILE)
+        with open(text_log_path, "w", encoding="utf-8") as out:
+            for path in (stored_text_log, delta_text_log_path):
+                if os.path.exists(path):
+                    with open(path, "r", encoding="utf-8") as f:
+                        shutil.copyfileobj(f, out)
+
+        stored_zip = self._path(checkpoint.channel_id, self.ATTACHMENTS_FILE)
+        if os.path.exists(stored_zip):
+            self._copy_attachments(stored_zip, volumes)
+        for delta_zip_path in delta_zip_paths:
+            self._copy_attachments(delta_zip_path, volumes)
+        # The checkpoint already includes the delta, so it lists every duplicate in the merge
+        duplicates = "".join(
+            f"{arcname} is the same file as {entry['duplicate_of']}\n"
+            for arcname, entry in checkpoint.attachments.items()
+            if "duplicate_of" in entry
+        )
+        if duplicates:
+            volumes.writestr(duplicates_arcname, duplicates.encode())
+        volumes.write(text_log_path, arcname=text_log_arcname)
+
+    def merge_exports(
+        self,
+        checkpoint: ChannelCheckpoint,
+        delta_records_path: str,
+        export_paths: Dict[str, str],
+    ) -> None:
+        """Write merged exports, in each format of export_paths, from the stored message records
+        followed by the delta's. Messages archived before records were kept are left out"""
+        exporters = [
+            archive_exporters.EXPORTERS[extension](path) for extension, path in export_paths.items()
+        ]
+        try:
+            for path in (self._path(checkpoint.channel_id, self.RECORDS_FILE), delta_records_path):
+                if not os.path.exists(path):
+                    continue
+                for record in archive_exporters.read_records(path):
+                    for exporter in exporters:
+                        exporter.write(record)
+        finally:
+            for exporter in exporters:
+                exporter.close()
+
+    def commit(
+        self,
+        checkpoint: ChannelCheckpoint,
+        delta_zip_paths: List[str],
+        delta_text_log_path: str,
+        delta_records_path: Optional[str] = None,
+    ) -> None:
+        """Append a delta archive to the stored history and save the checkpoint.
+        Only call this once the archive has been delivered"""
+        os.makedirs(self._channel_dir(checkpoint.channel_id), exist_ok=True)
+        appends = [(delta_text_log_path, self.TEXT_LOG_FILE)]
+        if delta_records_path is not None:
+            appends.append((delta_records_path, self.RECORDS_FILE))
+        for delta_path, filename in appends:
+            with open(self._path(checkpoint.channel_id, filename), "a", encoding="utf-8") as out:
+                with open(delta_path, "r", encoding="utf-8") as f:
+                    shutil.copyfileobj(f, out)
+        with zipfile.ZipFile(
+            self._path(checkpoint.channel_id, self.ATTACHMENTS_FILE), mode="a"
+        ) as zf:
+            for delta_zip_path in delta_zip_paths:
+                self._copy_attachments(delta_zip_path, zf)
+
+        file_utils.write_json_atomic(
+            self._path(checkpoint.channel_id, self.CHECKPOINT_FILE), asdict(checkpoint)
+        )
+
+    @staticmethod
+    def _copy_attachments(source_zip_path: str, zf: Union[zipfile.ZipFile, VolumeWriter]) -> None:
+        """Copy every attachment (but not the chat log) from one zip into another"""
+        images_dir = os.path.join(archive_constants.ARCHIVE, archive_constants.IMAGES)
+        with zipfile.ZipFile(source_zip_path, mode="r") as source:
+            for info in source.infolist():
+                if os.path.dirname(info.filename) == images_dir:
+                    zf.writestr(info, source.read(info))
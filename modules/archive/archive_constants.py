@@ -5,3 +5,100 @@
 ARCHIVE = "archive"
 IMAGES = "images"
 TEXT_LOG_PATH = "text_log.txt"
+DUPLICATES_PATH = "duplicates.txt"
+# Structured exports added to the archive alongside the chat log, see archive_exporters.EXPORTERS
+EXPORT_FORMATS = ["jsonl", "html"]
+# Messages handed to the writer thread at a time, for the chat log and exports
+WRITE_BATCH_SIZE = 200
+WORKSPACE_PREFIX = "job_"
+# Incremental archive checkpoints. Must live outside ARCHIVE, which is wiped on startup
+CHECKPOINT_DIR = "archive_checkpoints"
+DELTA_SUFFIX = "_delta"
+
+# Attachments with these extensions are already compressed, so they're stored in the zip as is
+STORED_EXTENSIONS = {
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".webp",
+    ".heic",
+    ".avif",
+    ".mp4",
+    ".mov",
+    ".webm",
+    ".mkv",
+    ".m4a",
+    ".mp3",
+    ".ogg",
+    ".opus",
+    ".flac",
+    ".zip",
+    ".gz",
+    ".7z",
+    ".rar",
+    ".pdf",
+}
+# Deflate level (1-9) for everything else, like the chat log
+COMPRESSION_LEVEL = 6
+# Zip volumes are kept this many bytes under the guild's upload limit, to leave room for the
+# rest of the upload request
+VOLUME_HEADROOM = 65_536
+MERGED = "merged"
+
+# How an archive gets sent, chosen before archiving from the size of the channel's attachments
+FULL_ZIP = "full zip"
+SPLIT_VOLUMES = "split volumes"
+# The chat log and exports only, linking to the attachments instead of downloading them
+TEXT_ONLY = "text only"
+# Even the chat log is too big to send, so there's no point archiving
+TOO_BIG = "too big"
+# The chat log size estimated before archiving counts mentions as written (<@1234...>) rather
+# than as shown (@name), so it can be well off. Channels are only turned away up front when it's
+# this many times the upload limit, otherwise the real chat log is checked once it's written
+TOO_BIG_MARGIN = 1.5
+# Most volumes an archive is split into before it's sent as text only instead
+MAX_VOLUMES = 8
+# Channels with up to this many messages are only read once, the archive reuses the messages
+# read while estimating its size
+PREFLIGHT_KEEP_MESSAGES = 20_000
+# Download speed assumed for time estimates until an archive has measured one, in bytes/s
+DEFAULT_DOWNLOAD_RATE = 4 * 1_048_576
+
+# Full text index of archived messages, searched with ~searcharchive. Like CHECKPOINT_DIR it
+# must live outside ARCHIVE
+SEARCH_INDEX_FILE = "archive_index.sqlite3"
+# Messages added to the index per transaction while archiving
+SEARCH_BATCH_SIZE = 500
+# Most matches a search returns
+SEARCH_RESULT_LIMIT = 200
+# Matches shown per page of ~searcharchive results, each page is only fetched once it's shown
+SEARCH_PAGE_SIZE = 10
+
+# Number of archive jobs that may run at the same time
+MAX_CONCURRENT_JOBS = 2
+
+# Number of attachments that may be downloading at once for a single archive job
+DOWNLOAD_POOL_SIZE = 8
+# Most attachment bytes a single archive holds in memory at once, between downloading and saving
+DOWNLOAD_POOL_BYTES = 64 * 1_048_576
+
+# Number of channels a category or server archive job works on at once. Discord rate limits
+# message history per channel, so these don't hold each other up. Their uploads all go to the
+# same channel, so they're sent one at a time
+CHANNELS_PER_JOB = 3
+
+# Category and server archive jobs, saved so they survive a restart
+JOBS_FILE = "archive_jobs.json"
+# How often the status message of a running archive is updated, in seconds. Editing a message
+# counts against the channel's rate limit, so this shouldn't be much lower
+PROGRESS_INTERVAL = 10
+# How often a running job's progress is saved, in seconds
+JOB_SAVE_INTERVAL = 30
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# Stopped partway through by ~archivecancel, with the partial archive thrown away
+CANCELLED = "cancelled"
+JOB_STATUSES = [PENDING, RUNNING, DONE, FAILED, CANCELLED]
@@ -0,0 +1,87 @@
+import hashlib
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class DedupIndex:
+    """Remembers the attachments saved during an archive job, so a repeat of one can point at the
+    copy already saved instead of being downloaded or zipped again.
+
+    Repeats are spotted by Discord attachment ID and size before downloading, and by content hash
+    afterwards. Saved copies are tracked by where they were saved (usually a channel's archive,
+    keyed by channel ID), so one job can share copies across all its channels. An archive's
+    copies are only shared once mark_sent says it's been delivered, until then other archives
+    save their own.
+    """
+
+    def __init__(self):
+        # The (where, name) of the copy of each attachment known to each archive, by where
+        self._by_id: Dict[Hashable, Dict[Tuple[int, int], Tuple[Hashable, str]]] = {}
+        self._by_hash: Dict[Hashable, Dict[str, Tuple[Hashable, str]]] = {}
+        # The same, for copies in archives that have been sent, which any archive can point at
+        self._sent_by_id: Dict[Tuple[int, int], Tuple[Hashable, str]] = {}
+        self._sent_by_hash: Dict[str, Tuple[Hashable, str]] = {}
+        # (where, name) of each repeat, and the (where, name) of the copy it's the same as
+        self.duplicates: List[Tuple[Tuple[Hashable, str], Tuple[Hashable, str]]] = []
+        # How each archive is described to users, by where
+        self.archive_names: Dict[Hashable, str] = {}
+
+    @staticmethod
+    def hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def find_by_id(
+        self, where: Hashable, attachment_id: int, size: int
+    ) -> Optional[Tuple[Hashable, str]]:
+        """The copy of an attachment that where can point at, if there is one"""
+        original = self._by_id.get(where, {}).get((attachment_id, size))
+        if original is None:
+            original = self._sent_by_id.get((attachment_id, size))
+        return original
+
+    def find_by_hash(self, where: Hashable, digest: str) -> Optional[Tuple[Hashable, str]]:
+        original = self._by_hash.get(where, {}).get(digest)
+        if original is None:
+            original = self._sent_by_hash.get(digest)
+        return original
+
+    def add_id(
+        self, where: Hashable, attachment_id: int, size: int, original: Tuple[Hashable, str]
+    ) -> None:
+        """Note the copy where has of an attachment. Claim it as soon as its download starts,
+        so later repeats can skip theirs"""
+        self._by_id.setdefault(where, {})[(attachment_id, size)] = original
+
+    def add_hash(self, where: Hashable, digest: str, original: Tuple[Hashable, str]) -> None:
+        self._by_hash.setdefault(where, {})[digest] = original
+
+    def mark_sent(self, where: Hashable) -> None:
+        """Share the copies known to where with every other archive, now it's been delivered.
+        Where a copy was already shared, the first one stays"""
+        for key, original in self._by_id.pop(where, {}).items():
+            self._sent_by_id.setdefault(key, original)
+        for digest, original in self._by_hash.pop(where, {}).items():
+            self._sent_by_hash.setdefault(digest, original)
+
+    def name_archive(self, where: Hashable, name: str) -> None:
+        self.archive_names[where] = name
+
+    def describe_archive(self, where: Hashable) -> str:
+        return self.archive_names.get(where, str(where))
+
+    def add_duplicate(self, where: Hashable, arcname: str, original: Tuple[Hashable, str]) -> None:
+        self.duplicates.append(((where, arcname), original))
+
+    def describe_duplicates(self, where: Hashable) -> str:
+        """List what each repeat saved in where is the same file as, one per line"""
+        lines = []
+        for (duplicate_where, arcname), (original_where, original_arcname) in self.duplicates:
+            if duplicate_where != where:
+                continue
+            if original_where == where:
+                lines.append(f"{arcname} is the same file as {original_arcname}\n")
+            else:
+                lines.append(
+                    f"{arcname} is the same file as {original_arcname} in "
+                    f"{self.describe_archive(original_where)}\n"
+                )
+        return "".join(lines)
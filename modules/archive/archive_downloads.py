@@ -0,0 +1,187 @@
+import asyncio
+import time
+from dataclasses import dataclass, field, fields
+from typing import Awaitable, Callable, Iterable, Optional, Set
+
+import nextcord
+
+import constants
+from modules.archive.archive_jobs import ArchiveCancelled, CancelToken
+
+
+@dataclass
+class ArchiveStats:
+    """Counters for a single archive job, used to report progress and tune the download pool"""
+
+    messages_archived: int = 0
+    last_message_id: Optional[int] = None
+    attachments_downloaded: int = 0
+    bytes_downloaded: int = 0
+    # Total time spent inside attachment fetches, summed over every worker
+    download_seconds: float = 0.0
+    # Time the history loop spent blocked because every download slot was busy
+    pool_wait_seconds: float = 0.0
+    # Attachments linked in the chat log rather than downloaded, as they'd never fit in a volume
+    attachments_too_big: int = 0
+    # Repeated attachments left out of the zip, and how many of those weren't even downloaded
+    duplicates: int = 0
+    duplicate_bytes: int = 0
+    downloads_skipped: int = 0
+    # Attachment bytes saved into the zip, before compression
+    bytes_written: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @classmethod
+    def combined(cls, all_stats: Iterable["ArchiveStats"]) -> "ArchiveStats":
+        """Add up the counters of several archives, e.g. every channel of a job so far"""
+        all_stats = list(all_stats)
+        total = cls()
+        for stats in all_stats:
+            for counter in fields(cls):
+                if counter.name not in ("last_message_id", "started_at"):
+                    setattr(
+                        total,
+                        counter.name,
+                        getattr(total, counter.name) + getattr(stats, counter.name),
+                    )
+        total.started_at = min((stats.started_at for stats in all_stats), default=total.started_at)
+        return total
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def describe_progress(self) -> str:
+        """Progress so far, for showing in an embed"""
+        minutes, seconds = divmod(int(self.elapsed_seconds), 60)
+        return (
+            f"Messages scanned: {self.messages_archived:,}\n"
+            f"Attachments downloaded: {self.attachments_downloaded:,} "
+            f"(`{self.bytes_downloaded/constants.BYTES_TO_MEGABYTES:.2f}MB`)\n"
+            f"Saved to the archive: `{self.bytes_written/constants.BYTES_TO_MEGABYTES:.2f}MB`\n"
+            f"Elapsed: {minutes}m {seconds}s"
+        )
+
+    def __str__(self):
+        elapsed = max(self.elapsed_seconds, 1e-9)
+        return (
+            f"{self.messages_archived} messages, {self.attachments_downloaded} attachments, "
+            f"{self.bytes_downloaded} bytes downloaded in {self.download_seconds:.2f}s, "
+            f"{self.pool_wait_seconds:.2f}s waiting on the download pool, "
+            f"{self.attachments_too_big} attachments too big to send, "
+            f"{self.duplicates} duplicates ({self.duplicate_bytes} bytes) left out of the zip, "
+            f"{self.bytes_written} bytes saved. Took {elapsed:.2f}s: "
+            f"{self.messages_archived / elapsed:.1f} messages/s, "
+            f"{self.bytes_downloaded / elapsed / constants.BYTES_TO_MEGABYTES:.2f}MB/s downloaded"
+        )
+
+
+class DownloadPool:
+    """Downloads attachments in the background with a bounded number of fetches in flight.
+
+    Use as an async context manager. Leaving the block waits for every download to finish. If
+    the block or any download raised, the downloads still running are cancelled instead, so
+    nothing is left saving into an archive that's been given up on.
+    With a cancel token, no download starts or gets saved once the archive is cancelled.
+    With max_bytes, downloads also wait while the attachments in flight add up to more than
+    that, so memory stays bounded however big the guild's upload limit is. An attachment
+    bigger than max_bytes is downloaded on its own.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        stats: ArchiveStats,
+        cancel: Optional[CancelToken] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.stats = stats
+        self.cancel = cancel if cancel is not None else CancelToken()
+        self.max_bytes = max_bytes
+        self._slots = asyncio.Semaphore(size)
+        self._bytes_in_flight = 0
+        # Set whenever a download finishes and frees up some of the byte budget
+        self._bytes_freed = asyncio.Event()
+        self._tasks: Set[asyncio.Task] = set()
+        self._error: Optional[BaseException] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                # There's no point waiting for the rest once a download has failed
+                while self._tasks and self._error is None:
+                    await asyncio.wait(set(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if exc_type is None and self._error is not None:
+            raise self._error
+
+    async def submit(
+        self, attachment: nextcord.Attachment, on_done: Callable[[bytes], Awaitable[None]]
+    ) -> asyncio.Task:
+        """Queue a download, waiting only if the pool is already full. Returns its task.
+
+        on_done is awaited with the attachment's contents, and holds the download's slot until
+        it's done, so slow saving also slows down the downloads
+        """
+        # Stop paginating as soon as a download has failed
+        if self._error is not None:
+            raise self._error
+        self.cancel.check()
+        start = time.perf_counter()
+        await self._reserve_bytes(attachment.size)
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            self._release_bytes(attachment.size)
+            raise
+        self.stats.pool_wait_seconds += time.perf_counter() - start
+        # The archive may have been cancelled while waiting for a slot
+        try:
+            self.cancel.check()
+        except ArchiveCancelled:
+            self._slots.release()
+            self._release_bytes(attachment.size)
+            raise
+        task = asyncio.create_task(self._download(attachment, on_done))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+        return task
+
+    def _on_task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None and self._error is None:
+            self._error = task.exception()
+
+    async def _download(
+        self, attachment: nextcord.Attachment, on_done: Callable[[bytes], Awaitable[None]]
+    ) -> None:
+        try:
+            start = time.perf_counter()
+            data = await attachment.read()
+            self.stats.download_seconds += time.perf_counter() - start
+            self.stats.attachments_downloaded += 1
+            self.stats.bytes_downloaded += len(data)
+            self.cancel.check()
+            await on_done(data)
+        finally:
+            self._slots.release()
+            self._release_bytes(attachment.size)
+
+    async def _reserve_bytes(self, size: int) -> None:
+        """Wait until size more bytes fit in the budget. Only submit waits on this, one
+        attachment at a time"""
+        if self.max_bytes is not None:
+            while self._bytes_in_flight and self._bytes_in_flight + size > self.max_bytes:
+                self._bytes_freed.clear()
+                await self._bytes_freed.wait()
+        self._bytes_in_flight += size
+
+    def _release_bytes(self, size: int) -> None:
+        self._bytes_in_flight -= size
+        self._bytes_freed.set()
@@ -0,0 +1,280 @@
+import abc
+import asyncio
+import datetime
+import html
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from modules.archive import archive_constants
+from modules.archive.archive_jobs import CancelToken
+
+# Attachments shown inline in the HTML transcript rather than just linked
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
+
+
+def message_record(message, attachments: List[Tuple[Any, Optional[str]]]) -> Dict[str, Any]:
+    """Turn a message into the record every exporter writes from.
+
+    attachments pairs each of the message's attachments with the name it was saved under in
+    the zip, or None if it's only linked. A repeat saved in another archive (e.g. another
+    channel of the same job) has no name in this one, and says where it is in duplicate_of
+    """
+    reference = message.reference
+    return {
+        "id": message.id,
+        "created_at": message.created_at.isoformat(),
+        "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+        "author": {
+            "id": message.author.id,
+            "name": message.author.name,
+            "display_name": message.author.display_name,
+        },
+        "content": message.content,
+        "clean_content": message.clean_content,
+        "reply_to": reference.message_id if reference is not None else None,
+        "pinned": message.pinned,
+        "attachments": [
+            {
+                "id": attachment.id,
+                "filename": attachment.filename,
+                "size": attachment.size,
+                "url": attachment.url,
+                "saved_as": saved_as,
+                "duplicate_of": None,
+            }
+            for attachment, saved_as in attachments
+        ],
+        "embeds": [embed.to_dict() for embed in message.embeds],
+        "reactions": [
+            {"emoji": str(reaction.emoji), "count": reaction.count}
+            for reaction in message.reactions
+        ],
+    }
+
+
+class Exporter(abc.ABC):
+    """Writes an archive's message records to a file, one message at a time, as they're
+    archived. Use as a context manager, or call close when done"""
+
+    extension = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "w", encoding="utf-8")
+        self.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def write(self, record: Dict[str, Any]) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def close(self) -> None:
+        if not self._f.closed:
+            self.end()
+            self._f.close()
+
+
+class TextExporter(Exporter):
+    """The chat log, one line per message. Attachments are replaced with their filename (for
+    easy reference), or their link if they weren't saved in any archive"""
+
+    extension = "txt"
+
+    def write(self, record: Dict[str, Any]) -> None:
+        created_at = datetime.datetime.fromisoformat(record["created_at"])
+        self._f.write(
+            f"[ {created_at.strftime('%m-%d-%Y, %H:%M:%S')} ] "
+            f"{record['author']['display_name'].rjust(25, ' ')}: "
+            f"{record['clean_content']}"
+        )
+        for attachment in record["attachments"]:
+            # Records from before duplicate_of was added don't have it
+            if attachment["saved_as"] is None and attachment.get("duplicate_of") is None:
+                self._f.write(f" {attachment['url']}")
+            else:
+                self._f.write(f" {attachment['filename']}")
+        # Important: Write the newline after each comment is done
+        self._f.write("\n")
+
+
+class JsonlExporter(Exporter):
+    """One JSON record per line, for scripts to read back without parsing the chat log"""
+
+    extension = "jsonl"
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._f.write(json.dumps(record, ensure_ascii=False))
+        self._f.write("\n")
+
+
+class HtmlExporter(Exporter):
+    """A static transcript page, meant to sit next to the images folder in the archive"""
+
+    extension = "html"
+
+    def start(self) -> None:
+        self._f.write(
+            '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+            "<style>\n"
+            "body { font-family: sans-serif; max-width: 60em; margin: auto; }\n"
+            ".message { padding: 0.4em 0; border-bottom: 1px solid #ddd; }\n"
+            ".meta, .reply, .reactions { color: #777; font-size: 0.85em; }\n"
+            ".embed { border-left: 4px solid #ccc; padding-left: 0.6em; margin: 0.3em 0; }\n"
+            "img { max-width: 30em; display: block; }\n"
+            "</style>\n</head>\n<body>\n"
+        )
+
+    def write(self, record: Dict[str, Any]) -> None:
+        escape = html.escape
+        parts = [f"<div class=\"message\" id=\"m{record['id']}\">"]
+        if record["reply_to"] is not None:
+            parts.append(
+                f"<div class=\"reply\"><a href=\"#m{record['reply_to']}\">replying to</a></div>"
+            )
+        edited = " (edited)" if record["edited_at"] is not None else ""
+        parts.append(
+            f"<div class=\"meta\"><b>{escape(record['author']['display_name'])}</b> "
+            f"{escape(record['created_at'])}{edited}</div>"
+        )
+        if record["clean_content"]:
+            content = escape(record["clean_content"]).replace("\n", "<br>")
+            parts.append(f"<div>{content}</div>")
+        for attachment in record["attachments"]:
+            if attachment["saved_as"] is None:
+                href = attachment["url"]
+            else:
+                # The page sits in the archive folder, next to the images folder
+                href = "/".join(attachment["saved_as"].split(os.sep)[1:])
+            href = escape(href, quote=True)
+            if os.path.splitext(attachment["filename"])[1].lower() in IMAGE_EXTENSIONS:
+                parts.append(f'<a href="{href}"><img src="{href}" loading="lazy"></a>')
+            else:
+                parts.append(f"<div><a href=\"{href}\">{escape(attachment['filename'])}</a></div>")
+        for embed in record["embeds"]:
+            parts.append(
+                f"<div class=\"embed\"><b>{escape(embed.get('title', ''))}</b>"
+                f"<div>{escape(embed.get('description', ''))}</div></div>"
+            )
+        if record["reactions"]:
+            reactions = " ".join(
+                f"{escape(reaction['emoji'])} {reaction['count']}"
+                for reaction in record["reactions"]
+            )
+            parts.append(f'<div class="reactions">{reactions}</div>')
+        parts.append("</div>\n")
+        self._f.write("".join(parts))
+
+    def end(self) -> None:
+        self._f.write("</body>\n</html>\n")
+
+
+# Formats that can be asked for with EXPORT_FORMATS, besides the chat log which is always written
+EXPORTERS = {
+    JsonlExporter.extension: JsonlExporter,
+    HtmlExporter.extension: HtmlExporter,
+}
+
+
+def read_records(path: str) -> Iterable[Dict[str, Any]]:
+    """Read back the records written by a JsonlExporter"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+class BatchWriter:
+    """Hands message records to exporters in a dedicated thread, so none of their disk I/O
+    happens on the event loop.
+
+    Records are queued up and handed over batch_size at a time. Only one batch is ever being
+    written, so if the disk can't keep up, write waits rather than piling up records.
+    The exporters are opened, written and closed in the writer thread, as some (e.g. SQLite
+    connections) can only be used by the thread that made them. Use as an async context manager.
+    With a cancel token, the writer thread stops between records once the archive is cancelled.
+    If the archive fails or is cancelled, exporters with a discard method (like the search
+    index's) have it called instead of close, to take back what they've written.
+    """
+
+    def __init__(
+        self,
+        open_exporters: List[Callable[[], Any]],
+        batch_size: int = archive_constants.WRITE_BATCH_SIZE,
+        cancel: Optional[CancelToken] = None,
+    ):
+        self.batch_size = batch_size
+        self.cancel = cancel if cancel is not None else CancelToken()
+        self._open_exporters = open_exporters
+        self._exporters: List[Any] = []
+        self._batch: List[Dict[str, Any]] = []
+        self._pending: Optional[asyncio.Future] = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def __aenter__(self):
+        try:
+            await self._run(self._open)
+        except BaseException:
+            await self._run(self._close)
+            self._executor.shutdown()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        failed = exc_type is not None
+        try:
+            if not failed:
+                await self.flush()
+            if self._pending is not None:
+                await asyncio.gather(self._pending, return_exceptions=failed)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            # Runs after any pending batch, as the thread takes one job at a time
+            await self._run(self._close, failed)
+            self._executor.shutdown()
+
+    def _run(self, func, *args) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> None:
+        for open_exporter in self._open_exporters:
+            self._exporters.append(open_exporter())
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        for record in batch:
+            self.cancel.check()
+            for exporter in self._exporters:
+                exporter.write(record)
+
+    def _close(self, failed: bool = False) -> None:
+        for exporter in self._exporters:
+            discard = getattr(exporter, "discard", None)
+            if failed and discard is not None:
+                discard()
+            else:
+                exporter.close()
+
+    async def write(self, record: Dict[str, Any]) -> None:
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Hand over the queued records, once the batch before them has been written"""
+        if self._pending is not None:
+            await self._pending
+        batch, self._batch = self._batch, []
+        self._pending = self._run(self._write_batch, batch)
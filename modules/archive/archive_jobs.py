@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from modules.archive import archive_constants
+from utils import file_utils
+
+
+class ArchiveCancelled(Exception):
+    """Raised at the next cancellation point of an archive that's been cancelled"""
+
+
+class CancelToken:
+    """Lets a running archive be stopped partway through.
+
+    Nothing is interrupted outright. Instead the archive checks the token at its cancellation
+    points (every message, download and write), and stops at the first one after cancel is
+    called. It's safe to check from the writer threads as well as the event loop.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        """A cancellation point: raise ArchiveCancelled if the archive has been cancelled"""
+        if self._event.is_set():
+            raise ArchiveCancelled()
+
+
+@dataclass
+class ChannelJob:
+    """One channel's part in an archive job"""
+
+    channel_id: int
+    status: str = archive_constants.PENDING
+    # The last message archived so far, for progress reports
+    last_message_id: Optional[int] = None
+
+
+@dataclass
+class ArchiveJob:
+    """A multi-channel archive (e.g. ~archivecategory) that can be picked back up after a restart"""
+
+    job_id: int
+    guild_id: int
+    # Where the archives are sent
+    reply_channel_id: int
+    # What's being archived, e.g. the category name
+    target: str
+    channels: List[ChannelJob] = field(default_factory=list)
+    cancelled: bool = False
+
+    def next_channel(self) -> Optional[ChannelJob]:
+        """The next channel that still needs archiving, if any"""
+        for channel_job in self.channels:
+            if channel_job.status == archive_constants.PENDING:
+                return channel_job
+        return None
+
+    def count(self, status: str) -> int:
+        return sum(1 for channel_job in self.channels if channel_job.status == status)
+
+
+class JobQueue:
+    """Archive jobs that haven't finished yet, saved to a JSON file on every change"""
+
+    def __init__(self, path: str = archive_constants.JOBS_FILE):
+        self.path = path
+        self.jobs: Dict[int, ArchiveJob] = {}
+        # The highest job ID handed out so far. IDs are never reused, so an old ~archivecancel
+        # can't stop a newer job
+        self.last_job_id = 0
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                saved = json.load(f)
+            # Queues saved before the counter was added are just the list of jobs
+            if isinstance(saved, list):
+                saved = {"last_job_id": 0, "jobs": saved}
+            for job in saved["jobs"]:
+                job["channels"] = [ChannelJob(**channel_job) for channel_job in job["channels"]]
+                self.jobs[job["job_id"]] = ArchiveJob(**job)
+            self.last_job_id = max(saved["last_job_id"], max(self.jobs, default=0))
+        # Anything still running was interrupted, and its partial archive went with the process
+        for job in self.jobs.values():
+            for channel_job in job.channels:
+                if channel_job.status == archive_constants.RUNNING:
+                    channel_job.status = archive_constants.PENDING
+
+    def save(self) -> None:
+        file_utils.write_json_atomic(
+            self.path,
+            {
+                "last_job_id": self.last_job_id,
+                "jobs": [asdict(job) for job in self.jobs.values()],
+            },
+        )
+
+    def create(
+        self, guild_id: int, reply_channel_id: int, target: str, channel_ids: List[int]
+    ) -> ArchiveJob:
+        self.last_job_id += 1
+        job_id = self.last_job_id
+        job = ArchiveJob(
+            job_id=job_id,
+            guild_id=guild_id,
+            reply_channel_id=reply_channel_id,
+            target=target,
+            channels=[ChannelJob(channel_id=channel_id) for channel_id in channel_ids],
+        )
+        self.jobs[job_id] = job
+        self.save()
+        return job
+
+    def finish(self, job: ArchiveJob) -> None:
+        """Drop a job once it's done or cancelled"""
+        self.jobs.pop(job.job_id, None)
+        self.save()
+
+    def for_guild(self, guild_id: int) -> List[ArchiveJob]:
+        return [job for job in self.jobs.values() if job.guild_id == guild_id]
@@ -0,0 +1,50 @@
+import os
+from typing import Dict, Iterable, Set, Tuple
+
+
+def split_extension(name: str) -> Tuple[str, str]:
+    """Split a name into its stem and full extension, e.g. notes.v2.txt into notes.v2 and .txt,
+    or logs.tar.gz into logs and .tar.gz"""
+    root, ext = os.path.splitext(name)
+    inner_root, inner_ext = os.path.splitext(root)
+    if inner_ext.lower() == ".tar":
+        return inner_root, inner_ext + ext
+    return root, ext
+
+
+class NameRegistry:
+    """Hands out unique names for the files in an archive, without touching the disk.
+
+    The first img.png keeps its name, and the ones after it become img (1).png, img (2).png...
+    The next number to try is remembered for every name, so claiming a name takes the same
+    time however many copies of it there already are.
+    """
+
+    def __init__(self, taken: Iterable[str] = ()):
+        self._taken: Set[str] = set(taken)
+        self._next_number: Dict[str, int] = {}
+
+    def update(self, taken: Iterable[str]) -> None:
+        """Mark names as already used, e.g. the ones in an earlier archive being added to"""
+        self._taken.update(taken)
+
+    def claim(self, name: str) -> str:
+        """Get a unique name to save name under, and keep anything else from getting it"""
+        if name not in self._taken:
+            self._taken.add(name)
+            return name
+        root, ext = split_extension(name)
+        number = self._next_number.get(name, 1)
+        # Only loops for names that were taken some other way, like an upload called img (1).png
+        while f"{root} ({number}){ext}" in self._taken:
+            number += 1
+        self._next_number[name] = number + 1
+        unique_name = f"{root} ({number}){ext}"
+        self._taken.add(unique_name)
+        return unique_name
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._taken
+
+    def __len__(self) -> int:
+        return len(self._taken)
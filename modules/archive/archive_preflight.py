@@ -0,0 +1,131 @@
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Optional
+
+import constants
+from modules.archive import archive_constants
+from modules.archive.archive_jobs import CancelToken
+from modules.archive.archive_volumes import VolumeWriter
+
+# Length of the "[ 01-02-2024, 03:04:05 ] " timestamp starting every chat log line, plus ": "
+TEXT_LOG_LINE_OVERHEAD = 27
+
+
+@dataclass
+class Preflight:
+    """What a channel's archive will hold, found from message metadata without downloading
+    anything, and how it'll be sent"""
+
+    messages: int = 0
+    attachments: int = 0
+    # Attachments that would be downloaded, and those too big to ever fit in a volume
+    attachment_bytes: int = 0
+    attachments_too_big: int = 0
+    text_log_bytes: int = 0
+    scan_seconds: float = 0.0
+    # The scanned messages, kept so the archive doesn't have to read the history again,
+    # unless there were too many to keep
+    kept_messages: Optional[List[Any]] = None
+    strategy: Optional[str] = None
+    volumes: int = 1
+
+    def estimated_size(self, export_count: int = len(archive_constants.EXPORT_FORMATS)) -> int:
+        """Rough size of the zip, before compression. The exports are counted as about the
+        size of the chat log each"""
+        return self.attachment_bytes + self.text_log_bytes * (1 + export_count)
+
+    def plan(
+        self, filesize_limit: int, export_count: int = len(archive_constants.EXPORT_FORMATS)
+    ) -> str:
+        """Choose how to send the archive: in one zip, split into volumes, just the chat log and
+        exports if the attachments would take too many volumes, or not at all if the chat log is
+        clearly too big"""
+        volume_limit = filesize_limit - archive_constants.VOLUME_HEADROOM
+        size = self.estimated_size(export_count)
+        self.volumes = max(1, math.ceil(size / volume_limit))
+        if self.text_log_bytes > filesize_limit * archive_constants.TOO_BIG_MARGIN:
+            self.strategy = archive_constants.TOO_BIG
+        elif self.volumes == 1:
+            self.strategy = archive_constants.FULL_ZIP
+        elif self.volumes <= archive_constants.MAX_VOLUMES:
+            self.strategy = archive_constants.SPLIT_VOLUMES
+        else:
+            self.strategy = archive_constants.TEXT_ONLY
+            self.volumes = max(1, math.ceil((size - self.attachment_bytes) / volume_limit))
+        return self.strategy
+
+    def describe(self, download_rate: float) -> str:
+        """What's about to be archived, how it'll be sent and how long it should take"""
+        minutes, seconds = divmod(int(self.eta_seconds(download_rate)), 60)
+        how = {
+            archive_constants.FULL_ZIP: "in a single zip",
+            archive_constants.SPLIT_VOLUMES: f"split into about {self.volumes} parts",
+            archive_constants.TEXT_ONLY: "as the chat log only, with links to the attachments, "
+            f"since they'd take more than {archive_constants.MAX_VOLUMES} uploads",
+        }[self.strategy]
+        return (
+            f"{self.messages:,} messages and {self.attachments:,} attachments, about "
+            f"`{self.estimated_size()/constants.BYTES_TO_MEGABYTES:.2f}MB`. I'll send them {how}. "
+            f"This should take about {minutes}m {seconds}s"
+        )
+
+    def eta_seconds(self, download_rate: float) -> float:
+        """How long archiving should take, given the download rate in bytes per second"""
+        # Reading the history again takes about as long as the scan did
+        seconds = 0.0 if self.kept_messages is not None else self.scan_seconds
+        if self.strategy != archive_constants.TEXT_ONLY:
+            seconds += self.attachment_bytes / download_rate
+        return seconds
+
+
+async def scan(
+    history: AsyncIterator[Any],
+    volume_limit: Optional[int] = None,
+    keep_limit: int = archive_constants.PREFLIGHT_KEEP_MESSAGES,
+    cancel: Optional[CancelToken] = None,
+) -> Preflight:
+    """Go through a channel's history (e.g. channel.history(...)) adding up what its archive
+    would hold. Only message metadata is read, nothing is downloaded.
+    Stops with ArchiveCancelled if the cancel token is cancelled partway through"""
+    preflight = Preflight(kept_messages=[])
+    fits = VolumeWriter("", volume_limit).fits
+    start = time.perf_counter()
+    async for msg in history:
+        if cancel is not None:
+            cancel.check()
+        preflight.messages += 1
+        # The name is padded to 25 characters, not bytes
+        display_name = msg.author.display_name
+        line_bytes = (
+            TEXT_LOG_LINE_OVERHEAD
+            + len(display_name.encode())
+            + max(0, 25 - len(display_name))
+            + len(msg.content.encode())
+            + 1
+        )
+        for attachment in msg.attachments:
+            preflight.attachments += 1
+            arcname = os.path.join(
+                archive_constants.ARCHIVE, archive_constants.IMAGES, attachment.filename
+            )
+            if fits(arcname, attachment.size):
+                preflight.attachment_bytes += attachment.size
+                line_bytes += 1 + len(attachment.filename.encode())
+            else:
+                preflight.attachments_too_big += 1
+                line_bytes += 1 + len(attachment.url)
+        preflight.text_log_bytes += line_bytes
+        if preflight.kept_messages is not None:
+            preflight.kept_messages.append(msg)
+            if len(preflight.kept_messages) > keep_limit:
+                preflight.kept_messages = None
+    preflight.scan_seconds = time.perf_counter() - start
+    return preflight
+
+
+async def replay(messages: List[Any]) -> AsyncIterator[Any]:
+    """Go through kept messages the same way as channel.history()"""
+    for msg in messages:
+        yield msg
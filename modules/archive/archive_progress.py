@@ -0,0 +1,53 @@
+import asyncio
+from typing import Callable, Optional
+
+import nextcord
+
+from modules.archive import archive_constants
+
+
+class ProgressReporter:
+    """Keeps a status message up to date while archiving.
+
+    Use as an async context manager. Every interval seconds the message is edited with a fresh
+    embed from make_embed, unless nothing has changed, so a long archive only costs a few edits
+    a minute however busy it is.
+    """
+
+    def __init__(
+        self,
+        message: nextcord.Message,
+        make_embed: Callable[[], nextcord.Embed],
+        interval: float = archive_constants.PROGRESS_INTERVAL,
+    ):
+        self.message = message
+        self.make_embed = make_embed
+        self.interval = interval
+        self._last_shown: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        self._last_shown = self.message.embeds[0].to_dict() if self.message.embeds else None
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def refresh(self) -> None:
+        """Edit the message now, if it would show anything new"""
+        embed = self.make_embed()
+        if embed.to_dict() == self._last_shown:
+            return
+        self._last_shown = embed.to_dict()
+        try:
+            await self.message.edit(embed=embed)
+        except nextcord.HTTPException as e:
+            # Progress is only a nicety, the archive carries on without it
+            print(f"Couldn't update archive progress: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.refresh()
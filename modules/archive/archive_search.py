@@ -0,0 +1,182 @@
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from modules.archive import archive_constants
+
+# Each message is stored with its Discord ID as the rowid, so archiving a channel again updates
+# its messages instead of adding them twice. Only the text and author are searchable
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    content,
+    author,
+    author_name UNINDEXED,
+    channel_name UNINDEXED,
+    channel_id UNINDEXED,
+    guild_id UNINDEXED,
+    created_at UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+
+@dataclass
+class SearchHit:
+    message_id: int
+    channel_name: str
+    author: str
+    created_at: str
+    # The matching part of the message, with the matched words in bold
+    snippet: str
+
+
+def to_match_query(query: str) -> str:
+    """Turn what the user typed into an FTS5 query matching every word in the message text.
+    Each word is quoted, so characters that mean something to FTS5 are searched for as is"""
+    words = ['"' + word.replace('"', '""') + '"' for word in query.split()]
+    return "content : (" + " ".join(words) + ")"
+
+
+class SearchIndex:
+    """Full text index of every archived message, in a SQLite database outside the archive dir.
+
+    Archives write to it through an IndexWriter, and searches open their own connection, so
+    searching works while a channel is being archived
+    """
+
+    def __init__(self, path: str = archive_constants.SEARCH_INDEX_FILE):
+        self.path = path
+        with self._connect() as conn:
+            # Lets searches read while an archive is writing
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def writer(self, guild_id: int, channel_id: int, channel_name: str) -> "IndexWriter":
+        return IndexWriter(self._connect(), guild_id, channel_id, channel_name)
+
+    def search(
+        self,
+        guild_id: int,
+        query: str,
+        author: Optional[str] = None,
+        channel_name: Optional[str] = None,
+        limit: int = archive_constants.SEARCH_RESULT_LIMIT,
+        offset: int = 0,
+    ) -> List[SearchHit]:
+        """Find the messages in a server's archives containing every word of query, best match
+        first. Optionally only the ones by an author (display name or username) or in a channel.
+        Skips the best offset matches, so the results can be read a page at a time"""
+        if not query.split():
+            return []
+        sql = (
+            "SELECT rowid, channel_name, author, created_at, "
+            "snippet(messages, 0, '**', '**', '...', 16) "
+            "FROM messages WHERE messages MATCH ? AND guild_id = ?"
+        )
+        params: List[Any] = [to_match_query(query), guild_id]
+        if author is not None:
+            sql += " AND (author = ? COLLATE NOCASE OR author_name = ? COLLATE NOCASE)"
+            params.extend([author, author])
+        if channel_name is not None:
+            sql += " AND channel_name = ? COLLATE NOCASE"
+            params.append(channel_name.lstrip("#"))
+        sql += " ORDER BY rank LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        conn = self._connect()
+        try:
+            return [SearchHit(*row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+
+class IndexWriter:
+    """Adds one channel's messages to the index as they're archived, a batch at a time.
+    Use as a context manager, or call close when done (or discard if the archive failed)"""
+
+    def __init__(self, conn: sqlite3.Connection, guild_id: int, channel_id: int, channel_name: str):
+        self._conn = conn
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self._batch: List[tuple] = []
+        # Messages this writer added to the index, rather than updated, so a failed archive
+        # can take them back out
+        self._added: List[int] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Queue a message record (see archive_exporters.message_record) to be indexed"""
+        # Attachment names are searchable too, since the chat log refers to them by name
+        content = " ".join(
+            [record["clean_content"]]
+            + [attachment["filename"] for attachment in record["attachments"]]
+        )
+        self._batch.append(
+            (
+                record["id"],
+                content,
+                record["author"]["display_name"],
+                record["author"]["name"],
+                self.channel_name,
+                self.channel_id,
+                self.guild_id,
+                record["created_at"],
+            )
+        )
+        if len(self._batch) >= archive_constants.SEARCH_BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._batch:
+            return
+        message_ids = [row[0] for row in self._batch]
+        with self._conn:
+            indexed = {
+                message_id
+                for (message_id,) in self._conn.execute(
+                    f"SELECT rowid FROM messages WHERE rowid IN "
+                    f"({', '.join('?' * len(message_ids))})",
+                    message_ids,
+                )
+            }
+            self._added.extend(
+                message_id for message_id in message_ids if message_id not in indexed
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages(rowid, content, author, author_name, "
+                "channel_name, channel_id, guild_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self._batch,
+            )
+        self._batch = []
+
+    def close(self) -> None:
+        if self._conn is None:
+            return
+        self.flush()
+        self._conn.close()
+        self._conn = None
+
+    def discard(self) -> None:
+        """Close without keeping the messages of an archive that failed or was cancelled.
+        Messages an earlier archive indexed stay searchable"""
+        if self._conn is None:
+            return
+        self._batch = []
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM messages WHERE rowid = ?",
+                [(message_id,) for message_id in self._added],
+            )
+        self._conn.close()
+        self._conn = None
@@ -1,5 +1,6 @@
 import os
 import shutil
+import tempfile
 
 from modules.archive import archive_constants
 from utils import discord_utils
@@ -18,7 +19,28 @@ def get_delay_embed():
 
 def reset_archive_dir():
     # Remove the archive directory and remake
+    # Only safe to call while no archive jobs are running, as it wipes every job's workspace
     if os.path.exists(archive_constants.ARCHIVE):
         shutil.rmtree(archive_constants.ARCHIVE)
     os.mkdir(archive_constants.ARCHIVE)
-    os.mkdir(os.path.join(archive_constants.ARCHIVE, archive_constants.IMAGES))
+
+
+def create_workspace() -> tempfile.TemporaryDirectory:
+    """Create a private directory for one archive job inside the archive dir.
+    Use as a context manager, the directory and everything in it is removed on exit"""
+    os.makedirs(archive_constants.ARCHIVE, exist_ok=True)
+    return tempfile.TemporaryDirectory(
+        prefix=archive_constants.WORKSPACE_PREFIX, dir=archive_constants.ARCHIVE
+    )
+
+
+def get_text_log_path(workspace: str, channel, suffix: str = "") -> str:
+    return os.path.join(workspace, channel.name + suffix + "_" + archive_constants.TEXT_LOG_PATH)
+
+
+def get_zip_path(workspace: str, channel, suffix: str = "") -> str:
+    return os.path.join(workspace, channel.name + suffix + "_archive.zip")
+
+
+def get_export_path(workspace: str, channel, extension: str, suffix: str = "") -> str:
+    return os.path.join(workspace, channel.name + suffix + "_messages." + extension)
@@ -0,0 +1,108 @@
+import os
+import zipfile
+from typing import Callable, List, Optional, Tuple, Union
+
+from modules.archive import archive_constants
+
+# Room a zip entry needs besides its data: its local header and central directory record
+# (each holding the name), plus slack for zip64 extras and deflate's worst case expansion
+ENTRY_OVERHEAD = 160
+# The end of central directory record, with room for the zip64 variant
+END_RECORD_SIZE = 100
+
+
+def get_compression(arcname: str) -> Tuple[int, Optional[int]]:
+    """Pick the compression for a zip entry. Media that's already compressed won't shrink any
+    further, so it's stored as is rather than spending CPU time deflating it"""
+    if os.path.splitext(arcname)[1].lower() in archive_constants.STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, archive_constants.COMPRESSION_LEVEL
+
+
+class VolumeWriter:
+    """Writes zip entries across as many volumes as it takes to keep each one under limit bytes.
+
+    With no limit, or if everything fits, there is a single volume at zip_path. Otherwise the
+    volumes are numbered next to it, e.g. chan_archive_part1.zip, chan_archive_part2.zip...
+    Entries are never split, so an entry bigger than the limit can't be kept under it.
+    Each entry's compression type and level come from the compression policy.
+    """
+
+    def __init__(
+        self,
+        zip_path: str,
+        limit: Optional[int] = None,
+        compression: Callable[[str], Tuple[int, Optional[int]]] = get_compression,
+    ):
+        self.zip_path = zip_path
+        self.limit = limit
+        self.compression = compression
+        self.paths: List[str] = []
+        self._zf: Optional[zipfile.ZipFile] = None
+        # Bytes the current volume's central directory will take once it's closed
+        self._central_directory_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def _entry_size(arcname: str, size: int) -> int:
+        return size + size // 1000 + 2 * len(arcname.encode()) + ENTRY_OVERHEAD
+
+    def fits(self, arcname: str, size: int) -> bool:
+        """Whether an entry of this size fits in a volume on its own"""
+        return self.limit is None or self._entry_size(arcname, size) + END_RECORD_SIZE <= self.limit
+
+    def _volume_for(self, arcname: str, size: int) -> zipfile.ZipFile:
+        """Get the volume the next entry should go in, starting a new one if it won't fit"""
+        needed = self._entry_size(arcname, size)
+        if (
+            self._zf is not None
+            and self.limit is not None
+            and self._zf.infolist()
+            and self._zf.fp.tell() + self._central_directory_size + needed + END_RECORD_SIZE
+            > self.limit
+        ):
+            self._zf.close()
+            self._zf = None
+        if self._zf is None:
+            root, ext = os.path.splitext(self.zip_path)
+            path = f"{root}_part{len(self.paths) + 1}{ext}"
+            self.paths.append(path)
+            self._zf = zipfile.ZipFile(path, mode="w")
+            self._central_directory_size = 0
+        self._central_directory_size += len(arcname.encode()) + ENTRY_OVERHEAD
+        return self._zf
+
+    def writestr(self, zinfo_or_arcname: Union[str, zipfile.ZipInfo], data: bytes) -> None:
+        if isinstance(zinfo_or_arcname, zipfile.ZipInfo):
+            # Entries copied from another zip keep the compression they already had
+            self._volume_for(zinfo_or_arcname.filename, len(data)).writestr(zinfo_or_arcname, data)
+            return
+        compress_type, compresslevel = self.compression(zinfo_or_arcname)
+        self._volume_for(zinfo_or_arcname, len(data)).writestr(
+            zinfo_or_arcname, data, compress_type=compress_type, compresslevel=compresslevel
+        )
+
+    def write(self, filename: str, arcname: str) -> None:
+        compress_type, compresslevel = self.compression(arcname)
+        self._volume_for(arcname, os.path.getsize(filename)).write(
+            filename, arcname=arcname, compress_type=compress_type, compresslevel=compresslevel
+        )
+
+    def close(self) -> List[str]:
+        """Finish the last volume and get the paths of every volume, in order"""
+        if self._zf is not None:
+            self._zf.close()
+            self._zf = None
+        if not self.paths:
+            zipfile.ZipFile(self.zip_path, mode="w").close()
+            self.paths = [self.zip_path]
+        elif len(self.paths) == 1 and self.paths[0] != self.zip_path:
+            # Don't number the only volume
+            os.replace(self.paths[0], self.zip_path)
+            self.paths = [self.zip_path]
+        return self.paths
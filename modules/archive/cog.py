@@ -1,15 +1,30 @@
 import asyncio
+import functools
 import os
-import zipfile
-from typing import Optional, Tuple, Union
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 import nextcord
 from nextcord.ext import commands
 from nextcord.ext.commands.errors import ChannelNotFound
 
 import constants
-from modules.archive import archive_constants, archive_utils
+from modules.archive import archive_constants, archive_exporters, archive_preflight, archive_utils
+from modules.archive.archive_channel import ChannelArchive
+from modules.archive.archive_checkpoints import ChannelCheckpoint, CheckpointStore
+from modules.archive.archive_dedup import DedupIndex
+from modules.archive.archive_downloads import ArchiveStats
+from modules.archive.archive_jobs import (
+    ArchiveCancelled,
+    ArchiveJob,
+    CancelToken,
+    ChannelJob,
+    JobQueue,
+)
+from modules.archive.archive_preflight import Preflight
+from modules.archive.archive_progress import ProgressReporter
+from modules.archive.archive_search import SearchIndex
 from utils import command_predicates, discord_utils, logging_utils
+from utils.search_utils import PaginatorView
 
 
 class ArchiveCog(commands.Cog, name="Archive"):
@@ -17,115 +32,215 @@ class ArchiveCog(commands.Cog, name="Archive"):
 
     def __init__(self, bot):
         self.bot = bot
-        self.compression = zipfile.ZIP_DEFLATED
-        self.lock = asyncio.Lock()
+        # Limits how many archive jobs run at once. Each job works in its own workspace
+        self.job_slots = asyncio.Semaphore(archive_constants.MAX_CONCURRENT_JOBS)
+        self.checkpoints = CheckpointStore()
+        # Every archived message, for ~searcharchive
+        self.search_index = SearchIndex()
+        # Bytes per second, as measured by the last archive that downloaded much
+        self.download_rate = archive_constants.DEFAULT_DOWNLOAD_RATE
+        # Category and server archives, saved so they can be resumed after a restart
+        self.jobs = JobQueue()
+        # The cancel token of each running job, by job ID
+        self.cancel_tokens: Dict[int, CancelToken] = {}
+        self._jobs_resumed = False
+        # Jobs resumed after a restart. The loop only keeps weak references to tasks, so they're
+        # kept here until they finish
+        self._resumed_jobs: Set[asyncio.Task] = set()
 
+        # No jobs are running yet, so anything left in the archive dir is from a previous run
         archive_utils.reset_archive_dir()
 
     async def archive_one_channel(
-        self, channel: nextcord.TextChannel
-    ) -> Tuple[nextcord.File, int, nextcord.File, int]:
-        """Download a channel's history"""
-        # Write the chat log. Replace attachments with their filename (for easy reference)
-        text_log_path = os.path.join(
-            archive_constants.ARCHIVE,
-            channel.name + "_" + archive_constants.TEXT_LOG_PATH,
+        self,
+        channel: nextcord.TextChannel,
+        workspace: str,
+        stats: Optional[ArchiveStats] = None,
+        checkpoint: Optional[ChannelCheckpoint] = None,
+        merge: bool = False,
+        filesize_limit: Optional[int] = None,
+        dedup: Optional[DedupIndex] = None,
+        formats: Optional[List[str]] = None,
+        preflight: Optional[Preflight] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Tuple[List[nextcord.File], int, nextcord.File, int]:
+        """Archive a channel into workspace, see ChannelArchive. Returns the zip volumes in order,
+        their total size, the chat log and its size. The caller owns the workspace and anything
+        left in it, and saves the checkpoint once the archive is sent"""
+        if stats is None:
+            stats = ArchiveStats()
+        volume_limit = None
+        if filesize_limit is not None:
+            volume_limit = filesize_limit - archive_constants.VOLUME_HEADROOM
+        archive = ChannelArchive(
+            channel,
+            workspace,
+            self.search_index,
+            stats,
+            DedupIndex() if dedup is None else dedup,
+            CancelToken() if cancel is None else cancel,
+            archive_constants.EXPORT_FORMATS if formats is None else formats,
+            volume_limit,
+            preflight is not None and preflight.strategy == archive_constants.TEXT_ONLY,
+            checkpoint,
+            merge,
         )
-        with open(text_log_path, "w") as f:
-            async for msg in channel.history(limit=None, oldest_first=True):
-                # print(f"{msg.created_at} - {msg.author.display_name.rjust(25, ' ')}: {msg.clean_content}")
-                f.write(
-                    f"[ {msg.created_at.strftime('%m-%d-%Y, %H:%M:%S')} ] "
-                    f"{msg.author.display_name.rjust(25, ' ')}: "
-                    f"{msg.clean_content}"
-                )
-                for attachment in msg.attachments:
-                    f.write(f" {attachment.filename}")
-                    # change duplicate filenames
-                    # img.png would become img (1).png
-                    original_path = os.path.join(
-                        archive_constants.ARCHIVE,
-                        archive_constants.IMAGES,
-                        attachment.filename,
-                    )
-                    proposed_path = original_path
-                    dupe_counter = 1
-                    while os.path.exists(proposed_path):
-                        proposed_path = (
-                            original_path.split(".")[0]
-                            + f" ({dupe_counter})."
-                            + original_path.split(".")[1]
-                        )
-                        dupe_counter += 1
-                    # The discord filenames can get too long and throw an OSError
-                    try:
-                        await attachment.save(proposed_path)
-                    except OSError:
-                        await attachment.save(
-                            f"path_too_long_{dupe_counter}.{original_path.split('.')[1]}"
-                        )
-                # Important: Write the newline after each comment is done
-                f.write("\n")
-            text_file_size = f.tell()
-
-        ZIP_FILENAME = os.path.join(archive_constants.ARCHIVE, channel.name + "_archive.zip")
-        # Create a zipfile and then walk through all the saved chatlogs and images, and zip em up
-        with zipfile.ZipFile(ZIP_FILENAME, mode="w") as zf:
-            for root, directories, files in os.walk(archive_constants.ARCHIVE):
-                for filename in files:
-                    if filename == ZIP_FILENAME.split("/")[-1]:  # Don't include self
-                        continue
-                    zf.write(os.path.join(root, filename), compress_type=self.compression)
-            zf_file_size = zf.fp.tell()
+        # Reuse the messages the preflight read, if it kept them
+        if preflight is not None and preflight.kept_messages is not None:
+            history = archive_preflight.replay(preflight.kept_messages)
+        else:
+            history = self.get_history(channel, checkpoint)
+        zip_paths = await archive.write(history)
+        text_log_path = archive.text_log_path
+        if checkpoint is not None and merge:
+            zip_paths, text_log_path = await archive.write_merged(self.checkpoints)
+        print(f"Archived #{channel.name}: {stats}")
+        # Only trust the download rate of archives with enough downloading to measure it
+        if stats.bytes_downloaded >= constants.BYTES_TO_MEGABYTES:
+            self.download_rate = stats.bytes_downloaded / stats.elapsed_seconds
         return (
-            nextcord.File(ZIP_FILENAME),
-            zf_file_size,
+            [nextcord.File(path) for path in zip_paths],
+            sum(os.path.getsize(path) for path in zip_paths),
             nextcord.File(text_log_path),
-            text_file_size,
+            os.path.getsize(text_log_path),
+        )
+
+    def get_history(
+        self, channel: nextcord.TextChannel, checkpoint: Optional[ChannelCheckpoint] = None
+    ):
+        """The channel's messages to archive, oldest first. With a checkpoint, only the ones
+        sent since"""
+        after = None
+        if checkpoint is not None and checkpoint.last_message_id is not None:
+            after = nextcord.Object(id=checkpoint.last_message_id)
+        return channel.history(limit=None, oldest_first=True, after=after)
+
+    async def run_preflight(
+        self,
+        channel: nextcord.TextChannel,
+        filesize_limit: int,
+        checkpoint: Optional[ChannelCheckpoint] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> Preflight:
+        """Find out how big a channel's archive will be, without downloading anything, and
+        plan how to send it"""
+        preflight = await archive_preflight.scan(
+            self.get_history(channel, checkpoint),
+            filesize_limit - archive_constants.VOLUME_HEADROOM,
+            cancel=cancel,
+        )
+        preflight.plan(filesize_limit)
+        print(
+            f"Preflight for #{channel.name}: {preflight.messages} messages, "
+            f"{preflight.attachment_bytes} attachment bytes, {preflight.strategy}"
+        )
+        return preflight
+
+    def get_too_big_embed(self, channel, filesize_limit, textfile_size):
+        embed = discord_utils.create_embed()
+        embed.add_field(
+            name="ERROR: History Too Big",
+            value=f"Sorry about that! The chat log in {channel.mention} is too big for me to send.\n"
+            f"The max file size I can send in this server is "
+            f"`{(filesize_limit/constants.BYTES_TO_MEGABYTES):.2f}MB`, but the chat log is "
+            f"`{(textfile_size/constants.BYTES_TO_MEGABYTES):.2f}MB`",
+            inline=False,
         )
+        return embed
 
     def get_file_and_embed(
-        self, channel, filesize_limit, zip_file, zip_file_size, textfile, textfile_size
+        self,
+        channel,
+        filesize_limit,
+        zip_files,
+        zip_file_size,
+        textfile,
+        textfile_size,
+        text_only=False,
+        attachments_linked=0,
     ):
-        """Check if zipfile and textfile can be sent or not, create embed with message"""
+        """Check if the zip volumes can be sent or not, create embed with message.
+        Any attachments linked rather than saved are pointed out, as they're lost if the
+        channel is deleted"""
         embed = discord_utils.create_embed()
+        too_big_volumes = [
+            zip_file for zip_file in zip_files if os.path.getsize(zip_file.fp.name) > filesize_limit
+        ]
 
-        if zip_file_size > filesize_limit:
-            if textfile_size > filesize_limit:
-                embed.add_field(
-                    name="ERROR: History Too Big",
-                    value=f"Sorry about that! The chat log in {channel.mention} is too big for me to send.\n"
-                    f"The max file size I can send in this server is "
-                    f"`{(filesize_limit/constants.BYTES_TO_MEGABYTES):.2f}MB`, but the chat log is "
-                    f"`{(textfile_size/constants.BYTES_TO_MEGABYTES):.2f}MB`",
-                    inline=False,
+        # The chat log is never split, so it's the one thing that can stop us sending anything
+        if textfile_size > filesize_limit:
+            embed = self.get_too_big_embed(channel, filesize_limit, textfile_size)
+            for zip_file in zip_files:
+                zip_file.close()
+            files = []
+        elif too_big_volumes:
+            # Volumes are kept under the limit, so this shouldn't happen. Don't send anything
+            # rather than have Discord refuse the upload partway through
+            volume_size = os.path.getsize(too_big_volumes[0].fp.name)
+            embed.add_field(
+                name="ERROR: Archive Too Big",
+                value=f"Sorry about that! Part of the archive of {channel.mention} came out at "
+                f"`{(volume_size/constants.BYTES_TO_MEGABYTES):.2f}MB`, but the max file size "
+                f"I can send in this server is "
+                f"`{(filesize_limit/constants.BYTES_TO_MEGABYTES):.2f}MB`, so I haven't sent it.",
+                inline=False,
+            )
+            for zip_file in zip_files:
+                zip_file.close()
+            files = []
+        elif len(zip_files) > 1:
+            embed.add_field(
+                name="Archive Split",
+                value=f"The archive of {channel.mention} is "
+                f"`{(zip_file_size/constants.BYTES_TO_MEGABYTES):.2f}MB`, but the max file size "
+                f"I can send in this server is "
+                f"`{(filesize_limit/constants.BYTES_TO_MEGABYTES):.2f}MB`, so I've split it into "
+                f"{len(zip_files)} parts.",
+                inline=False,
+            )
+            files = zip_files
+        else:
+            files = zip_files
+            embed = None
+        if files and (text_only or attachments_linked):
+            if embed is None:
+                embed = discord_utils.create_embed()
+            if text_only:
+                value = (
+                    f"The attachments in {channel.mention} would take more than "
+                    f"{archive_constants.MAX_VOLUMES} uploads, so the archive only has the chat "
+                    f"log and message exports, which link to every attachment instead."
                 )
-                file = None
             else:
-                embed.add_field(
-                    name="WARNING: Attachments Too Big",
-                    value=f"There are too many photos in {channel.mention} for me to send. The max file size "
-                    f"I can send in this server is "
-                    f"`{(filesize_limit/constants.BYTES_TO_MEGABYTES):.2f}MB` but the zip is "
-                    f"`{(zip_file_size/constants.BYTES_TO_MEGABYTES):.2f}MB`. I'll only be able to send you the chat log.",
-                    inline=False,
-                )
-                ZIP_FILENAME = os.path.join(
-                    archive_constants.ARCHIVE, channel.name + "_archive.zip"
+                value = (
+                    f"{attachments_linked} attachments in {channel.mention} are too big to ever "
+                    f"fit in an upload, so the chat log links to them instead."
                 )
-                with zipfile.ZipFile(ZIP_FILENAME, mode="w") as zf:
-                    zf.write(
-                        os.path.join(
-                            archive_constants.ARCHIVE,
-                            channel.name + "_" + archive_constants.TEXT_LOG_PATH,
-                        ),
-                        compress_type=self.compression,
-                    )
-                file = zip_file
-        else:
-            file = zip_file
-            embed = None
-        return file, embed
+            embed.add_field(
+                name="Attachments Linked",
+                value=f"{value} They're only kept on Discord, so save them before deleting "
+                f"the channel.",
+                inline=False,
+            )
+        return files, embed
+
+    async def send_archive(
+        self,
+        destination: nextcord.abc.Messageable,
+        files: List[nextcord.File],
+        embed: Optional[nextcord.Embed],
+        attachments_linked: bool = False,
+    ) -> nextcord.Message:
+        """Send each zip volume as its own message, with the embed on the first one.
+        Returns the last message sent.
+        If attachments were linked rather than saved, the embed goes on the last volume instead,
+        so anything checking the returned message (like ~close) sees the warning"""
+        if not files:
+            return await destination.send(embed=embed)
+        embed_index = len(files) - 1 if attachments_linked else 0
+        for index, file in enumerate(files):
+            msg = await destination.send(file=file, embed=embed if index == embed_index else None)
+        return msg
 
     @commands.command(name="archivechannel", aliases=["archivechan"])
     @commands.has_any_role(*constants.HOST_ROLES)
@@ -146,22 +261,20 @@ class ArchiveCog(commands.Cog, name="Archive"):
             # No arguments provided
             await ctx.send(embed=discord_utils.create_no_argument_embed("channel"))
             return
-        # If we don't have the lock, let the user know it may take a while.
+        # If every job slot is taken, let the user know it may take a while.
         msg = None
 
         # The final message sent to the channel will be returned
         return_msg = None
 
         for channelname in args:
-            if self.lock.locked():
+            if self.job_slots.locked():
                 msg = await ctx.send(embed=archive_utils.get_delay_embed())
-            # LOCK EVERYTHING
-            async with self.lock:
-                # If we printed a message about being delayed bc of lock, we can delete that now.
+            async with self.job_slots:
+                # If we printed a message about being delayed bc of the job limit, we can delete that now.
                 if msg:
                     await msg.delete()
                     msg = None
-                archive_utils.reset_archive_dir()
                 if isinstance(channelname, nextcord.TextChannel):
                     channel = channelname
                 else:
@@ -183,18 +296,151 @@ class ArchiveCog(commands.Cog, name="Archive"):
                             inline=False,
                         )
                         return ctx.send(embed=embed)
-                # If we've gotten to this point, we know we have a channel so we should probably let the user know.
-                start_embed = await self.get_start_embed(channel)
-                msg = await ctx.send(embed=start_embed)
-                try:
-                    # zipfile, textfile
-                    (
-                        zip_file,
+                # Everything for this channel lives in its own workspace, removed once it's sent
+                with archive_utils.create_workspace() as workspace:
+                    # If we've gotten to this point, we know we have a channel so we should probably let the user know.
+                    start_embed = await self.get_start_embed(channel)
+                    msg = await ctx.send(embed=start_embed)
+                    stats = ArchiveStats()
+                    try:
+                        # Find out what we're in for before downloading anything
+                        preflight = await self.run_preflight(channel, ctx.guild.filesize_limit)
+                        if preflight.strategy == archive_constants.TOO_BIG:
+                            await msg.delete()
+                            msg = None
+                            return_msg = await ctx.send(
+                                embed=self.get_too_big_embed(
+                                    channel, ctx.guild.filesize_limit, preflight.text_log_bytes
+                                )
+                            )
+                            continue
+                        start_embed.add_field(
+                            name="Estimate",
+                            value=preflight.describe(self.download_rate),
+                            inline=False,
+                        )
+                        await msg.edit(embed=start_embed)
+                        async with ProgressReporter(
+                            msg,
+                            functools.partial(self.get_channel_progress_embed, start_embed, stats),
+                        ):
+                            # zipfile, textfile
+                            (
+                                zip_files,
+                                zip_file_size,
+                                textfile,
+                                textfile_size,
+                            ) = await self.archive_one_channel(
+                                channel,
+                                workspace,
+                                stats,
+                                filesize_limit=ctx.guild.filesize_limit,
+                                preflight=preflight,
+                            )
+                    except nextcord.errors.Forbidden:
+                        embed.add_field(
+                            name="ERROR: No access",
+                            value=f"Sorry! I don't have access to {channel}. You'll need "
+                            f"to give me permission to view the channel if you want "
+                            f"to archive it",
+                            inline=False,
+                        )
+                        return await ctx.send(embed=embed)
+                    files, embed = self.get_file_and_embed(
+                        channel,
+                        ctx.guild.filesize_limit,
+                        zip_files,
                         zip_file_size,
                         textfile,
                         textfile_size,
-                    ) = await self.archive_one_channel(channel)
+                        preflight.strategy == archive_constants.TEXT_ONLY,
+                        stats.attachments_too_big,
+                    )
+                    # There has been an issue with AIO HTTP message sending fails, in which case discord.py crashes?
+                    # So adding this try/catch for runtime to catch this. I don't think it's a deterministic error
+                    try:
+                        return_msg = await self.send_archive(
+                            ctx, files, embed, stats.attachments_too_big > 0
+                        )
+                    except RuntimeError:
+                        embed = discord_utils.create_embed()
+                        embed.add_field(
+                            name="ERROR: Failed to send archive",
+                            value=f"Sorry! I had trouble sending you the archived file for "
+                            f"{channel.mention}. Please try again later, and let kev know if this "
+                            f"issue persists",
+                            inline=False,
+                        )
+                        return_msg = await ctx.send(embed=embed)
+
+                    if msg:
+                        await msg.delete()
+                        msg = None
+        return return_msg
+
+    @commands.command(name="archivedelta", aliases=["archiveinc"])
+    @commands.has_any_role(*constants.HOST_ROLES)
+    async def archivedelta(
+        self, ctx: commands.Context, channel: nextcord.TextChannel, mode: str = ""
+    ) -> Optional[nextcord.Message]:
+        """Command to download only the messages sent since the last time this command archived
+        the channel. Add `merged` to get everything archived so far in one file instead
+
+        Permission Category : Verified Roles only.
+        Usage: `~archivedelta #channel`
+        Usage: `~archivedelta #channel merged`
+        """
+        logging_utils.log_command("archivedelta", ctx.guild, ctx.channel, ctx.author)
+        merge = mode.lower() == archive_constants.MERGED
+
+        # If every job slot is taken, let the user know it may take a while.
+        msg = None
+        if self.job_slots.locked():
+            msg = await ctx.send(embed=archive_utils.get_delay_embed())
+        async with self.job_slots:
+            if msg:
+                await msg.delete()
+                msg = None
+            with archive_utils.create_workspace() as workspace:
+                start_embed = await self.get_start_embed(channel)
+                msg = await ctx.send(embed=start_embed)
+                checkpoint = self.checkpoints.load(channel.id)
+                stats = ArchiveStats()
+                try:
+                    # Only the new messages are counted, even for a merged archive
+                    preflight = await self.run_preflight(
+                        channel, ctx.guild.filesize_limit, checkpoint
+                    )
+                    if preflight.strategy == archive_constants.TOO_BIG:
+                        await msg.delete()
+                        return await ctx.send(
+                            embed=self.get_too_big_embed(
+                                channel, ctx.guild.filesize_limit, preflight.text_log_bytes
+                            )
+                        )
+                    start_embed.add_field(
+                        name="Estimate", value=preflight.describe(self.download_rate), inline=False
+                    )
+                    await msg.edit(embed=start_embed)
+                    async with ProgressReporter(
+                        msg, functools.partial(self.get_channel_progress_embed, start_embed, stats)
+                    ):
+                        (
+                            zip_files,
+                            zip_file_size,
+                            textfile,
+                            textfile_size,
+                        ) = await self.archive_one_channel(
+                            channel,
+                            workspace,
+                            stats,
+                            checkpoint=checkpoint,
+                            merge=merge,
+                            filesize_limit=ctx.guild.filesize_limit,
+                            preflight=preflight,
+                        )
                 except nextcord.errors.Forbidden:
+                    embed = discord_utils.create_embed()
                     embed.add_field(
                         name="ERROR: No access",
                         value=f"Sorry! I don't have access to {channel}. You'll need "
@@ -203,19 +449,24 @@ class ArchiveCog(commands.Cog, name="Archive"):
                         inline=False,
                     )
                     return await ctx.send(embed=embed)
-                file, embed = self.get_file_and_embed(
+                files, embed = self.get_file_and_embed(
                     channel,
                     ctx.guild.filesize_limit,
-                    zip_file,
+                    zip_files,
                     zip_file_size,
                     textfile,
                     textfile_size,
+                    preflight.strategy == archive_constants.TEXT_ONLY,
+                    stats.attachments_too_big,
                 )
                 # There has been an issue with AIO HTTP message sending fails, in which case discord.py crashes?
                 # So adding this try/catch for runtime to catch this. I don't think it's a deterministic error
                 try:
-                    return_msg = await ctx.send(file=file, embed=embed)
+                    return_msg = await self.send_archive(
+                        ctx, files, embed, stats.attachments_too_big > 0
+                    )
                 except RuntimeError:
+                    embed = discord_utils.create_embed()
                     embed.add_field(
                         name="ERROR: Failed to send archive",
                         value=f"Sorry! I had trouble sending you the archived file for "
@@ -223,15 +474,84 @@ class ArchiveCog(commands.Cog, name="Archive"):
                         f"issue persists",
                         inline=False,
                     )
-                    return_msg = await ctx.send(embed=embed)
-
-                if msg:
-                    await msg.delete()
-                    msg = None
-            # Clean up the archive dir
-            archive_utils.reset_archive_dir()
+                    return await ctx.send(embed=embed)
+                # Only move the checkpoint forward once the new messages have been delivered
+                if files:
+                    if merge:
+                        delta_zip_paths = [
+                            archive_utils.get_zip_path(
+                                workspace, channel, archive_constants.DELTA_SUFFIX
+                            )
+                        ]
+                    else:
+                        delta_zip_paths = [file.fp.name for file in files]
+                    await asyncio.to_thread(
+                        self.checkpoints.commit,
+                        checkpoint,
+                        delta_zip_paths,
+                        archive_utils.get_text_log_path(
+                            workspace, channel, archive_constants.DELTA_SUFFIX
+                        ),
+                        archive_utils.get_export_path(
+                            workspace,
+                            channel,
+                            archive_exporters.JsonlExporter.extension,
+                            archive_constants.DELTA_SUFFIX,
+                        ),
+                    )
+                await msg.delete()
         return return_msg
 
+    @commands.command(name="searcharchive", aliases=["archivesearch"])
+    @commands.has_any_role(*constants.HOST_ROLES)
+    async def searcharchive(
+        self,
+        ctx: commands.Context,
+        query: str,
+        author: Optional[str] = None,
+        channel: Optional[str] = None,
+    ):
+        """Command to search the messages of every channel archived in this server, even if
+        the channel has since been deleted. Put quotes around a query with more than one word
+
+        Permission Category : Verified Roles only.
+        Usage: `~searcharchive "secret plan"`
+        Usage: `~searcharchive "secret plan" kev`
+        Usage: `~searcharchive "secret plan" kev kev-confessional`
+        """
+        logging_utils.log_command("searcharchive", ctx.guild, ctx.channel, ctx.author)
+
+        async def get_page(page: int) -> Optional[str]:
+            hits = await asyncio.to_thread(
+                self.search_index.search,
+                ctx.guild.id,
+                query,
+                author,
+                channel,
+                limit=archive_constants.SEARCH_PAGE_SIZE,
+                offset=(page - 1) * archive_constants.SEARCH_PAGE_SIZE,
+            )
+            if not hits:
+                return None
+            return chr(10).join(
+                f"`#{hit.channel_name}` **{hit.author}** ({hit.created_at[:10]}): {hit.snippet}"
+                for hit in hits
+            )
+
+        embed = discord_utils.create_embed()
+        embed.title = f"Archived messages matching {query}"
+        view = PaginatorView(ctx.author, get_page, embed)
+        if await view.render(1) is None:
+            embed = discord_utils.create_embed()
+            embed.add_field(
+                name="No Results",
+                value=f"I couldn't find any archived messages matching `{query}`",
+                inline=False,
+            )
+            await ctx.send(embed=embed)
+            return
+        await view.start(ctx.channel)
+
     @command_predicates.is_owner_or_admin()
     @commands.command(name="archivecategory", aliases=["archivecat"])
     async def archivecategory(self, ctx, *args: str):
@@ -249,86 +569,24 @@ class ArchiveCog(commands.Cog, name="Archive"):
             await ctx.send(embed=discord_utils.create_no_argument_embed("category"))
             return
 
-        # If we don't have the lock, let the user know it may take a while.
-        msg = None
-        if self.lock.locked():
-            msg = await ctx.send(embed=archive_utils.get_delay_embed())
-        # LOCK EVERYTHING
-        async with self.lock:
-            if msg:
-                await msg.delete()
-                msg = None
-            category = await discord_utils.find_category(ctx, " ".join(args))
-            if category is None:
-                embed.add_field(
-                    name="ERROR: Cannot find category",
-                    value=f"Sorry, I cannot find a category with name {' '.join(args)}. "
-                    f"Please make sure the spelling and capitalization are correct!",
-                    inline=False,
-                )
-                await ctx.send(embed=embed)
-                return
-
-            start_embed = await self.get_start_embed(category, category.text_channels)
-            # SOMETIMES THE EMBED IS TOO LONG FOR DISCORD
-            embeds = discord_utils.split_embed(start_embed)
-            msgs = []
-            for embed in embeds:
-                msgs.append(await ctx.send(embed=embed))
-
-            for text_channel in category.text_channels:
-                archive_utils.reset_archive_dir()
-                try:
-                    (
-                        zip_file,
-                        zip_file_size,
-                        textfile,
-                        textfile_size,
-                    ) = await self.archive_one_channel(text_channel)
-                    file, embed = self.get_file_and_embed(
-                        text_channel,
-                        ctx.guild.filesize_limit,
-                        zip_file,
-                        zip_file_size,
-                        textfile,
-                        textfile_size,
-                    )
-                    await ctx.send(file=file, embed=embed)
-                except nextcord.errors.Forbidden:
-                    embed.add_field(
-                        name="ERROR: No access",
-                        value=f"Sorry! I don't have access to {text_channel.mention}. You'll need "
-                        f"to give me permission to view the channel if you want "
-                        f"to archive it",
-                        inline=False,
-                    )
-                    await ctx.send(embed=embed)
-                    continue
-                # There has been an issue with AIO HTTP message sending fails, in which case discord.py crashes?
-                # So adding this try/catch for runtime to catch this. I don't think it's a deterministic error
-                except RuntimeError:
-                    embed = discord_utils.create_embed()
-                    embed.add_field(
-                        name="ERROR: Failed to send archive",
-                        value=f"Sorry! I had trouble sending you the archived file for "
-                        f"{text_channel.mention}. Perhaps you can try again with {ctx.prefix}archivechannel"
-                        f" after I've finished archiving {category.mention}.",
-                        inline=False,
-                    )
-                    await ctx.send(embed=embed)
-                    continue
-            if msgs:
-                for msg in msgs:
-                    await msg.delete()
-            embed = discord_utils.create_embed()
+        category = await discord_utils.find_category(ctx, " ".join(args))
+        if category is None:
             embed.add_field(
-                name="All Done!",
-                value=f"Successfully archived {category}",
+                name="ERROR: Cannot find category",
+                value=f"Sorry, I cannot find a category with name {' '.join(args)}. "
+                f"Please make sure the spelling and capitalization are correct!",
                 inline=False,
             )
             await ctx.send(embed=embed)
-        # Clean up the archive dir
-        archive_utils.reset_archive_dir()
+            return
+
+        job = self.jobs.create(
+            ctx.guild.id,
+            ctx.channel.id,
+            category.name,
+            [text_channel.id for text_channel in category.text_channels],
+        )
+        await self.run_job(job)
 
     @command_predicates.is_owner_or_admin()
     @commands.command(name="archiveserver")
@@ -340,65 +598,415 @@ class ArchiveCog(commands.Cog, name="Archive"):
         Usage: `~archiveserver`
         """
         logging_utils.log_command("archiveserver", ctx.guild, ctx.channel, ctx.author)
+
+        job = self.jobs.create(
+            ctx.guild.id,
+            ctx.channel.id,
+            ctx.guild.name,
+            [text_channel.id for text_channel in ctx.guild.text_channels],
+        )
+        await self.run_job(job)
+
+    @command_predicates.is_owner_or_admin()
+    @commands.command(name="archivestatus")
+    async def archivestatus(self, ctx):
+        """Command to list the category and server archives that haven't finished yet
+
+        Permission Category : Admin or Bot Owner Roles only.
+        Usage: `~archivestatus`
+        """
+        logging_utils.log_command("archivestatus", ctx.guild, ctx.channel, ctx.author)
         embed = discord_utils.create_embed()
 
-        # If we don't have the lock, let the user know it may take a while.
-        msg = None
-        if self.lock.locked():
-            msg = await ctx.send(embed=archive_utils.get_delay_embed())
+        jobs = self.jobs.for_guild(ctx.guild.id)
+        if not jobs:
+            embed.add_field(
+                name="No Archives Running",
+                value="There are no category or server archives in progress.",
+                inline=False,
+            )
+            await ctx.send(embed=embed)
+            return
+
+        for job in jobs:
+            lines = [
+                f"{status.capitalize()}: {job.count(status)}"
+                for status in archive_constants.JOB_STATUSES
+                if job.count(status)
+            ]
+            for channel_job in job.channels:
+                if channel_job.status == archive_constants.RUNNING:
+                    lines.append(
+                        f"Archiving <#{channel_job.channel_id}>, "
+                        f"last saved message ID `{channel_job.last_message_id}`"
+                    )
+            if job.cancelled:
+                lines.append("Cancelling...")
+            embed.add_field(
+                name=f"Job {job.job_id}: {job.target}",
+                value=chr(10).join(lines),
+                inline=False,
+            )
+        embed.set_footer(text=f"Use {ctx.prefix}archivecancel <job> to stop one")
+        await ctx.send(embed=embed)
+
+    @command_predicates.is_owner_or_admin()
+    @commands.command(name="archivecancel")
+    async def archivecancel(self, ctx, job_id: int):
+        """Command to stop a category or server archive. Channels already sent are kept, and the
+        ones partway through are thrown away
+
+        Permission Category : Admin or Bot Owner Roles only.
+        Usage: `~archivecancel 3`
+        """
+        logging_utils.log_command("archivecancel", ctx.guild, ctx.channel, ctx.author)
+        embed = discord_utils.create_embed()
+
+        job = self.jobs.jobs.get(job_id)
+        if job is None or job.guild_id != ctx.guild.id:
+            embed.add_field(
+                name=f"{constants.FAILED}!",
+                value=f"There's no archive job {job_id}. Use `{ctx.prefix}archivestatus` to see them.",
+                inline=False,
+            )
+            await ctx.send(embed=embed)
+            return
+
+        # The job's channels stop at their next cancellation point, which frees up its job slot
+        job.cancelled = True
+        self.jobs.save()
+        if job.job_id in self.cancel_tokens:
+            self.cancel_tokens[job.job_id].cancel()
+        embed.add_field(
+            name=f"{constants.SUCCESS}!",
+            value=f"Archive job {job_id} for {job.target} is stopping. Channels already sent are "
+            f"kept, but the ones being archived right now will be left out.",
+            inline=False,
+        )
+        await ctx.send(embed=embed)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # on_ready fires again on every reconnect, but jobs only need resuming once
+        if self._jobs_resumed:
+            return
+        self._jobs_resumed = True
+        for job in list(self.jobs.jobs.values()):
+            task = asyncio.create_task(self.run_job(job, resumed=True))
+            self._resumed_jobs.add(task)
+            task.add_done_callback(functools.partial(self.resumed_job_done, job))
+
+    def resumed_job_done(self, job: ArchiveJob, task: asyncio.Task) -> None:
+        self._resumed_jobs.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Resumed archive job {job.job_id} for {job.target} failed: {task.exception()!r}")
+
+    async def run_job(self, job: ArchiveJob, resumed: bool = False) -> None:
+        """Archive each channel in the job that hasn't been archived yet, saving the job's
+        progress as it goes. Up to CHANNELS_PER_JOB channels are archived at once, and each is
+        sent as soon as it's done. A single progress message is kept up to date meanwhile"""
+        guild = self.bot.get_guild(job.guild_id)
+        reply_channel = self.bot.get_channel(job.reply_channel_id)
+        if guild is None or reply_channel is None:
+            print(f"Dropping archive job {job.job_id} for {job.target}, its server is gone")
+            self.jobs.finish(job)
+            return
+        # A job that was cancelled just before a restart stops straight away
+        cancel = self.cancel_tokens.setdefault(job.job_id, CancelToken())
+        if job.cancelled:
+            cancel.cancel()
 
-        # LOCK EVERYTHING
-        async with self.lock:
-            start_embed = await self.get_start_embed(ctx.guild, ctx.guild.text_channels)
+        # If every job slot is taken, let the user know it may take a while.
+        msg = None
+        if self.job_slots.locked():
+            msg = await reply_channel.send(embed=archive_utils.get_delay_embed())
+        async with self.job_slots:
             if msg:
                 await msg.delete()
                 msg = None
+            remaining_channels = [
+                guild.get_channel(channel_job.channel_id)
+                for channel_job in job.channels
+                if channel_job.status == archive_constants.PENDING
+            ]
+            start_embed = await self.get_start_embed(
+                job.target, [channel for channel in remaining_channels if channel is not None]
+            )
+            if resumed:
+                start_embed.add_field(
+                    name="Resuming",
+                    value=f"I was restarted partway through, so I'm picking up where I left off. "
+                    f"{job.count(archive_constants.DONE)} of {len(job.channels)} channels were "
+                    f"already sent.",
+                    inline=False,
+                )
             # SOMETIMES THE EMBED IS TOO LONG FOR DISCORD
             embeds = discord_utils.split_embed(start_embed)
             msgs = []
             for embed in embeds:
-                msgs.append(await ctx.send(embed=embed))
+                msgs.append(await reply_channel.send(embed=embed))
 
-            for text_channel in ctx.guild.text_channels:
-                archive_utils.reset_archive_dir()
-                try:
-                    (
-                        zip_file,
-                        zip_file_size,
-                        textfile,
-                        textfile_size,
-                    ) = await self.archive_one_channel(text_channel)
-                    file, embed = self.get_file_and_embed(
-                        text_channel,
-                        ctx.guild.filesize_limit,
-                        zip_file,
-                        zip_file_size,
-                        textfile,
-                        textfile_size,
-                    )
-                    await ctx.send(file=file, embed=embed)
-                except nextcord.errors.Forbidden:
-                    embed.add_field(
-                        name="ERROR: No access",
-                        value=f"Sorry! I don't have access to {text_channel.mention}. You'll need "
-                        f"to give me permission to view the channel if you want "
-                        f"to archive it",
-                        inline=False,
-                    )
-                    await ctx.send(embed=embed)
-                    continue
-            if msgs:
+            # The stats of every channel archived so far in this run
+            channel_stats = []
+            progress_msg = await reply_channel.send(
+                embed=self.get_progress_embed(job, channel_stats)
+            )
+
+            # Attachments repeated across channels aren't saved again once an archive holding them
+            # has been sent
+            dedup = DedupIndex()
+            # Every channel's archive goes to the same reply channel, so send them one at a time.
+            # That keeps a channel's volumes together, and stays within the channel's rate limit
+            send_lock = asyncio.Lock()
+
+            async def archive_channels() -> None:
+                """Keep archiving the job's next channel until there are none left"""
+                channel_job = job.next_channel()
+                while channel_job is not None and not job.cancelled:
+                    text_channel = guild.get_channel(channel_job.channel_id)
+                    # Claim the channel before anything else can pick it
+                    channel_job.status = archive_constants.RUNNING
+                    self.jobs.save()
+                    stats = ArchiveStats()
+                    channel_stats.append(stats)
+                    try:
+                        channel_job.status = await self.archive_job_channel(
+                            channel_job,
+                            text_channel,
+                            reply_channel,
+                            dedup,
+                            send_lock,
+                            stats,
+                            cancel,
+                        )
+                    except asyncio.CancelledError:
+                        # The bot is shutting down, e.g. for a redeploy. Leave the channel to be
+                        # archived again when the job resumes
+                        channel_job.status = archive_constants.PENDING
+                        raise
+                    except Exception as e:
+                        # Anything unexpected only fails this channel, the rest of the job
+                        # carries on
+                        print(f"Failed to archive channel {channel_job.channel_id}: {e!r}")
+                        channel_job.status = archive_constants.FAILED
+                        await self.report_channel_error(reply_channel, channel_job.channel_id)
+                    finally:
+                        self.jobs.save()
+                    channel_job = job.next_channel()
+
+            # Whether every channel got its turn. If not, the job was interrupted (e.g. the bot is
+            # shutting down), and it's kept to resume on the next start
+            finished = False
+            try:
+                async with ProgressReporter(
+                    progress_msg, functools.partial(self.get_progress_embed, job, channel_stats)
+                ):
+                    workers = [
+                        asyncio.create_task(archive_channels())
+                        for _ in range(archive_constants.CHANNELS_PER_JOB)
+                    ]
+                    try:
+                        await asyncio.gather(*workers)
+                    except BaseException:
+                        for worker in workers:
+                            worker.cancel()
+                        await asyncio.gather(*workers, return_exceptions=True)
+                        raise
+                finished = True
+                total_stats = ArchiveStats.combined(channel_stats)
+                print(f"Archived {job.target}: {total_stats}")
+
+                msgs.append(progress_msg)
                 for msg in msgs:
                     await msg.delete()
+                embed = discord_utils.create_embed()
+                if job.cancelled:
+                    value = (
+                        f"Stopped archiving {job.target} after "
+                        f"{job.count(archive_constants.DONE)} of {len(job.channels)} channels."
+                    )
+                    stopped = [
+                        f"<#{channel_job.channel_id}>"
+                        for channel_job in job.channels
+                        if channel_job.status == archive_constants.CANCELLED
+                    ]
+                    if stopped:
+                        value += f" The partial archives of {', '.join(stopped)} were thrown away."
+                    embed.add_field(name="Archive Cancelled", value=value, inline=False)
+                else:
+                    value = f"Successfully archived {job.target}"
+                    failed = job.count(archive_constants.FAILED)
+                    if failed:
+                        value += f", but {failed} of its channels failed (see above)"
+                    embed.add_field(name="All Done!", value=value, inline=False)
+                embed.add_field(name="Stats", value=total_stats.describe_progress(), inline=False)
+                await reply_channel.send(embed=embed)
+            finally:
+                self.cancel_tokens.pop(job.job_id, None)
+                if finished:
+                    self.jobs.finish(job)
+
+    async def archive_job_channel(
+        self,
+        channel_job: ChannelJob,
+        text_channel: Optional[nextcord.TextChannel],
+        reply_channel: nextcord.TextChannel,
+        dedup: DedupIndex,
+        send_lock: asyncio.Lock,
+        stats: ArchiveStats,
+        cancel: CancelToken,
+    ) -> str:
+        """Archive and send one channel of a job. Returns the channel's new status.
+        The send lock is held while sending, so archives sent at the same time don't interleave.
+        If the job is cancelled before the channel is sent, its workspace and everything
+        written so far are thrown away"""
+        embed = discord_utils.create_embed()
+        if text_channel is None:
+            embed.add_field(
+                name="ERROR: Cannot find channel",
+                value=f"Sorry, channel `{channel_job.channel_id}` seems to have been deleted "
+                f"so I can't archive it.",
+                inline=False,
+            )
+            await reply_channel.send(embed=embed)
+            return archive_constants.FAILED
+
+        # Keep the saved job up to date, so archivestatus can show how far along the channel is
+        saver = asyncio.create_task(self.save_job_progress(channel_job, stats))
+        try:
+            preflight = await self.run_preflight(
+                text_channel, reply_channel.guild.filesize_limit, cancel=cancel
+            )
+            if preflight.strategy == archive_constants.TOO_BIG:
+                await reply_channel.send(
+                    embed=self.get_too_big_embed(
+                        text_channel, reply_channel.guild.filesize_limit, preflight.text_log_bytes
+                    )
+                )
+                return archive_constants.FAILED
+            with archive_utils.create_workspace() as workspace:
+                (
+                    zip_files,
+                    zip_file_size,
+                    textfile,
+                    textfile_size,
+                ) = await self.archive_one_channel(
+                    text_channel,
+                    workspace,
+                    stats,
+                    filesize_limit=reply_channel.guild.filesize_limit,
+                    dedup=dedup,
+                    preflight=preflight,
+                    cancel=cancel,
+                )
+                files, embed = self.get_file_and_embed(
+                    text_channel,
+                    reply_channel.guild.filesize_limit,
+                    zip_files,
+                    zip_file_size,
+                    textfile,
+                    textfile_size,
+                    preflight.strategy == archive_constants.TEXT_ONLY,
+                    stats.attachments_too_big,
+                )
+                async with send_lock:
+                    # Another channel may have been sending while the job was cancelled
+                    cancel.check()
+                    await self.send_archive(
+                        reply_channel, files, embed, stats.attachments_too_big > 0
+                    )
+                    # Only now can the job's other channels point at the copies it holds
+                    if files:
+                        dedup.mark_sent(text_channel.id)
+        except ArchiveCancelled:
+            print(f"Cancelled archiving #{text_channel.name}: {stats}")
+            return archive_constants.CANCELLED
+        except nextcord.errors.Forbidden:
             embed = discord_utils.create_embed()
             embed.add_field(
-                name="All Done!",
-                value=f"Successfully archived {ctx.guild}",
+                name="ERROR: No access",
+                value=f"Sorry! I don't have access to {text_channel.mention}. You'll need "
+                f"to give me permission to view the channel if you want "
+                f"to archive it",
                 inline=False,
             )
-            await ctx.send(embed=embed)
-        # Clean up the archive dir
-        archive_utils.reset_archive_dir()
+            await reply_channel.send(embed=embed)
+            return archive_constants.FAILED
+        # There has been an issue with AIO HTTP message sending fails, in which case discord.py crashes?
+        # So adding this try/catch for runtime to catch this. I don't think it's a deterministic error
+        except RuntimeError:
+            embed = discord_utils.create_embed()
+            embed.add_field(
+                name="ERROR: Failed to send archive",
+                value=f"Sorry! I had trouble sending you the archived file for "
+                f"{text_channel.mention}. Perhaps you can try again with "
+                f"{constants.DEFAULT_BOT_PREFIX}archivechannel once I've finished.",
+                inline=False,
+            )
+            await reply_channel.send(embed=embed)
+            return archive_constants.FAILED
+        finally:
+            saver.cancel()
+            channel_job.last_message_id = stats.last_message_id
+        return archive_constants.DONE
+
+    async def report_channel_error(
+        self, reply_channel: nextcord.TextChannel, channel_id: int
+    ) -> None:
+        """Let the job's channel know one of its channels failed unexpectedly"""
+        embed = discord_utils.create_embed()
+        embed.add_field(
+            name="ERROR: Archive failed",
+            value=f"Sorry! Something went wrong archiving <#{channel_id}>, so I've skipped it. "
+            f"You can try again with {constants.DEFAULT_BOT_PREFIX}archivechannel once "
+            f"I've finished the rest.",
+            inline=False,
+        )
+        try:
+            await reply_channel.send(embed=embed)
+        except nextcord.HTTPException as e:
+            print(f"Couldn't report the failed archive of channel {channel_id}: {e}")
+
+    async def save_job_progress(self, channel_job: ChannelJob, stats: ArchiveStats) -> None:
+        while True:
+            await asyncio.sleep(archive_constants.JOB_SAVE_INTERVAL)
+            channel_job.last_message_id = stats.last_message_id
+            self.jobs.save()
+
+    def get_channel_progress_embed(
+        self, start_embed: nextcord.Embed, stats: ArchiveStats
+    ) -> nextcord.Embed:
+        """The start embed of a single channel archive, with its progress so far"""
+        embed = start_embed.copy()
+        embed.add_field(name="Progress", value=stats.describe_progress(), inline=False)
+        return embed
+
+    def get_progress_embed(
+        self, job: ArchiveJob, channel_stats: List[ArchiveStats]
+    ) -> nextcord.Embed:
+        """Show how many of a job's channels are done, which ones are being archived, and the
+        job's progress so far"""
+        embed = discord_utils.create_embed()
+        lines = [
+            f"Archived {job.count(archive_constants.DONE)} of {len(job.channels)} channels",
+        ]
+        if job.count(archive_constants.FAILED):
+            lines.append(f"Failed: {job.count(archive_constants.FAILED)}")
+        running = [
+            f"<#{channel_job.channel_id}>"
+            for channel_job in job.channels
+            if channel_job.status == archive_constants.RUNNING
+        ]
+        if running:
+            lines.append(f"Archiving {', '.join(running)}")
+        embed.add_field(name="Archive Progress", value=chr(10).join(lines), inline=False)
+        if channel_stats:
+            embed.add_field(
+                name="Stats",
+                value=ArchiveStats.combined(channel_stats).describe_progress(),
+                inline=False,
+            )
+        return embed
 
     async def get_start_embed(self, channel_or_guild, multiple_channels=None):
         owner = await self.bot.fetch_user(os.getenv("BOT_OWNER_DISCORD_ID"))
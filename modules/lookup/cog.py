@@ -1,11 +1,12 @@
-import re
-import urllib
+import asyncio
+import os
 
-import googlesearch
+import aiohttp
 import nextcord
 from nextcord.ext import commands
 
-from modules.lookup import lookup_constants, lookup_utils
+from modules.lookup import lookup_constants, lookup_hpwiki, lookup_nutrimatic, lookup_utils
+from modules.lookup.lookup_cache import LookupCache
 from utils import discord_utils, logging_utils
 from utils.search_utils import Pages
 
@@ -15,6 +16,47 @@ class LookupCog(commands.Cog, name="Lookup"):
 
     def __init__(self, bot):
         self.bot = bot
+        self.search_cache = LookupCache(
+            lookup_constants.SEARCH_CACHE_SIZE,
+            lookup_constants.SEARCH_CACHE_TTL,
+            self.get_cache_path(lookup_constants.SEARCH_CACHE_FILE),
+        )
+        self.nutrimatic_cache = LookupCache(
+            lookup_constants.NUTRIMATIC_CACHE_SIZE,
+            lookup_constants.NUTRIMATIC_CACHE_TTL,
+            self.get_cache_path(lookup_constants.NUTRIMATIC_CACHE_FILE),
+        )
+        self.nutrimatic_client = lookup_utils.NutrimaticClient(cache=self.nutrimatic_cache)
+        self.hpwiki_index = lookup_hpwiki.load_index(lookup_constants.HPWIKI_INDEX)
+        self._cache_saver = None
+
+    def cog_unload(self):
+        if self._cache_saver is not None:
+            self._cache_saver.cancel()
+        for cache in (self.search_cache, self.nutrimatic_cache):
+            if cache.dirty:
+                cache.save()
+        asyncio.create_task(self.nutrimatic_client.close())
+
+    @staticmethod
+    def get_cache_path(filename):
+        """Where a cache is saved, or None if the caches aren't saved"""
+        if lookup_constants.LOOKUP_CACHE_DIR is None:
+            return None
+        return os.path.join(lookup_constants.LOOKUP_CACHE_DIR, filename)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # on_ready fires again on every reconnect, but only one saver is needed
+        if self._cache_saver is None:
+            self._cache_saver = asyncio.create_task(self.save_caches())
+
+    async def save_caches(self):
+        while True:
+            await asyncio.sleep(lookup_constants.CACHE_SAVE_INTERVAL)
+            for cache in (self.search_cache, self.nutrimatic_cache):
+                if cache.path is not None and cache.dirty:
+                    await asyncio.to_thread(cache.write, cache.snapshot())
 
     @commands.command(name="search")
     async def search(self, ctx, target_site: str, *args):
@@ -41,32 +83,22 @@ class LookupCog(commands.Cog, name="Lookup"):
             is_google_search = False
 
         original_query = " ".join(args)
-        # Don't add google to the query but add any other target site for easier access/SEO
-        if not is_google_search:
-            query_with_site = original_query + " " + target_site
-        else:
-            query_with_site = original_query
-        # Dude this loop is going to be horrible wtf
-        # If google:
-        #   Store all results as a list and print them out line by line in an embed
-        # If not google:
-        #   Find the first result that matches the target site and return that
-        #   If we can't find it, return the google query I think
-        results = []
-        for result in googlesearch.search(
-            query_with_site,
-            num=lookup_constants.QUERY_NUM,
-            stop=lookup_constants.QUERY_NUM,
-            pause=lookup_constants.PAUSE_TIME,
-        ):
-            if target_site in result:
-                embed.add_field(
-                    name=f"{target_site.capitalize()} Result for {original_query}",
-                    value=result,
-                )
-                await ctx.send(embed=embed)
-                return
-            results.append(result)
+        results = None
+        # Most HP wiki searches are for an article title, which the index answers without Google
+        if target_site == lookup_constants.HPWIKISITE and self.hpwiki_index is not None:
+            url = self.hpwiki_index.lookup(original_query)
+            if url is not None:
+                results = [url]
+        if results is None:
+            results = await lookup_utils.search(original_query, target_site, self.search_cache)
+        # A result from the target site is always returned on its own
+        if results and target_site in results[0]:
+            embed.add_field(
+                name=f"{target_site.capitalize()} Result for {original_query}",
+                value=results[0],
+            )
+            await ctx.send(embed=embed)
+            return
         if is_google_search:
             embed.add_field(
                 name=f"{target_site.capitalize()} Result for {original_query}",
@@ -91,7 +123,7 @@ class LookupCog(commands.Cog, name="Lookup"):
         logging_utils.log_command("google", ctx.guild, ctx.channel, ctx.author)
         embed = discord_utils.create_embed()
 
-        results = lookup_utils.search_query(" ".join(args))
+        results = await lookup_utils.search(" ".join(args), cache=self.search_cache)
 
         embed.add_field(
             name=f"Google Result for {' '.join(args)}", value=f"{chr(10).join(results)}"
@@ -108,7 +140,9 @@ class LookupCog(commands.Cog, name="Lookup"):
         logging_utils.log_command("wikipedia", ctx.guild, ctx.channel, ctx.author)
         embed = discord_utils.create_embed()
 
-        results = lookup_utils.search_query(" ".join(args), target_site=lookup_constants.WIKI)
+        results = await lookup_utils.search(
+            " ".join(args), target_site=lookup_constants.WIKI, cache=self.search_cache
+        )
 
         if len(results) > 1:
             embed.add_field(
@@ -124,6 +158,33 @@ class LookupCog(commands.Cog, name="Lookup"):
             )
         await ctx.send(embed=embed)
 
+    @commands.command(name="lookupstats", aliases=["cachestats"])
+    async def lookupstats(self, ctx):
+        """
+        Command to see how often lookups are answered from the cache, by sharing an
+        identical lookup that was already running, or from the HP wiki index
+
+        Usage: `~lookupstats`
+        """
+        logging_utils.log_command("lookupstats", ctx.guild, ctx.channel, ctx.author)
+        embed = discord_utils.create_embed()
+
+        embed.add_field(
+            name="Search Cache",
+            value=f"{self.search_cache.describe()}\n"
+            f"Shared with an identical search: {lookup_utils.search_flights.shared:,}",
+            inline=False,
+        )
+        embed.add_field(
+            name="Nutrimatic Cache",
+            value=f"{self.nutrimatic_cache.describe()}\n"
+            f"Shared with an identical query: {self.nutrimatic_client.flights.shared:,}",
+            inline=False,
+        )
+        if self.hpwiki_index is not None:
+            embed.add_field(name="HP Wiki Index", value=self.hpwiki_index.describe(), inline=False)
+        await ctx.send(embed=embed)
+
     @commands.command(
         aliases=[
             "n",
@@ -147,15 +208,7 @@ class LookupCog(commands.Cog, name="Lookup"):
         query = query.replace("\\", "")
 
         query_initial = query[:]
-        query = (
-            query_initial.replace("&", "%26")
-            .replace("+", "%2B")
-            .replace("#", "%23")
-            .replace(" ", "+")
-        )  # html syntax
-        url = "https://nutrimatic.org/?q=" + query + "&go=Go"
-        text = urllib.request.urlopen(url).read()
-        text1 = text.decode()
+        url = self.nutrimatic_client.url(query_initial)
 
         # set up embed template
         embed = nextcord.Embed(
@@ -163,43 +216,29 @@ class LookupCog(commands.Cog, name="Lookup"):
         )
         embed.set_footer(text="Query: " + query_initial)
 
-        # parse for solution list
-        posA = [m.start() for m in re.finditer("<span", text1)]
-        posB = [m.start() for m in re.finditer("</span", text1)]
-
-        # check for no solutions, send error
-        if not posA:
-            final = "None"
-            errA = [m.start() for m in re.finditer("<b>", text1)]
-            errB = [m.start() for m in re.finditer("</b>", text1)]
-            final = text1[errA[-1] + 3 : errB[-1]]
-            if final.find("font") != -1:
-                errA = [m.start() for m in re.finditer("<font", text1)]
-                errB = [m.start() for m in re.finditer("</font>", text1)]
-                final = text1[errA[-1] + 16 : errB[-1]]
-            embed.description = final
+        try:
+            page = await self.nutrimatic_client.fetch(query_initial)
+        except asyncio.TimeoutError:
+            embed.description = "Sorry! Nutrimatic took too long to answer. Try a simpler pattern?"
+            await ctx.send(embed=embed)
+            return
+        except aiohttp.ClientError:
+            embed.description = "Sorry! I couldn't reach nutrimatic. Try again in a bit?"
             await ctx.send(embed=embed)
             return
 
-        # check for ending error message, usually bolded
-        # max number of solutions on a nutrimatic page is 100
-        finalend = None
-        if len(posA) < 100:
-            try:
-                errA = [m.start() for m in re.finditer("<b>", text1)]
-                errB = [m.start() for m in re.finditer("</b>", text1)]
-                finalend = text1[errA[-1] + 3 : errB[-1]]
-            except:
-                pass
+        results, status = lookup_nutrimatic.parse_results(page)
+
+        # check for no solutions, send the reason
+        if not results:
+            embed.description = status or "No results found"
+            await ctx.send(embed=embed)
+            return
 
         # prep solution and weights for paginator
-        solutions = []
-        weights = []
-        for n in range(0, min(len(posA), 200)):
-            word = text1[posA[n] + 36 : posB[n]]
-            size = float(text1[posA[n] + 23 : posA[n] + 32])
-            solutions.append(word)
-            weights.append(size)
+        solutions = [word for word, _ in results]
+        weights = [weight for _, weight in results]
+        finalend = status
 
         p = Pages(ctx, solutions=solutions, weights=weights, embedTemp=embed, endflag=finalend)
         await p.pageLoop()
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils import file_utils
+
+
+def cache_key(query: str, target_site: str, exact: bool = False) -> str:
+    """The key a query is cached under. Searches ignore case and spacing, so queries that only
+    differ in those share an entry. Exact queries, like nutrimatic patterns where C, V and A
+    mean consonant, vowel and any letter, only ignore leading and trailing spaces"""
+    if exact:
+        query = query.strip()
+    else:
+        query = " ".join(query.lower().split())
+    return f"{target_site}\n{query}"
+
+
+def describe_hits(hits: int, misses: int) -> str:
+    """Hit and miss counts and the hit rate, one per line"""
+    lookups = hits + misses
+    hit_rate = hits / lookups if lookups else 0.0
+    return f"Hits: {hits:,}\nMisses: {misses:,}\nHit rate: {hit_rate:.0%}"
+
+
+class LookupCache:
+    """Remembers lookup results for ttl seconds, keeping at most max_size of them.
+
+    Once it's full, the least recently used result is dropped. With a path, the results are
+    saved there as JSON by save (or snapshot and write), and loaded back when the cache is
+    made, so they survive a restart. Expiry times are wall clock times for the same reason.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # Key to (expiry time, result), least recently used first
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        # Whether there's anything save hasn't written yet
+        self.dirty = False
+        if path is not None and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for key, expires_at, result in json.load(f):
+                    if expires_at > self.clock():
+                        self._entries[key] = (expires_at, result)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """The cached result, or None if there isn't one or it's expired"""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            if entry is not None:
+                del self._entries[key]
+                self.dirty = True
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, result: Any) -> None:
+        self._entries[key] = (self.clock() + self.ttl, result)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self.dirty = True
+
+    def snapshot(self) -> List[List[Any]]:
+        """The entries to save, taken on the event loop so write can run in a thread"""
+        self.dirty = False
+        return [[key, expires_at, result] for key, (expires_at, result) in self._entries.items()]
+
+    def write(self, entries: List[List[Any]]) -> None:
+        if self.path is None:
+            return
+        file_utils.write_json_atomic(self.path, entries)
+
+    def save(self) -> None:
+        self.write(self.snapshot())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def describe(self) -> str:
+        """Hit and miss counts, for showing in an embed"""
+        return (
+            f"{describe_hits(self.hits, self.misses)}\n"
+            f"Cached results: {len(self):,} of {self.max_size:,}"
+        )
+
+
+class SingleFlight:
+    """Shares one in-flight lookup between everyone asking for the same thing at once.
+
+    When a puzzle drops, several people tend to send the same query within seconds. The first
+    caller's fetch does the work, and the rest wait for it and get the same result (or error).
+    A caller giving up doesn't cancel the fetch for the others.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        # Calls that were answered by a fetch already in flight
+        self.shared = 0
+
+    async def run(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(fetch())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
@@ -1,9 +1,14 @@
+import os
+
 ################
 #### LOOKUP ####
 ################
 
 PAUSE_TIME = 1
 QUERY_NUM = 10
+# googlesearch blocks while it fetches and pauses between pages, so searches run in a pool of
+# this many threads. More than a few at once and Google starts rate limiting us anyway
+SEARCH_WORKERS = 4
 DCODE = "dcode"
 DCODE_FR = "dcode.fr"
 WIKI = "wiki"
@@ -17,3 +22,39 @@ REGISTERED_SITES = {
     GOOGLE: GOOGLE,
     HPWIKI: HPWIKISITE,
 }
+
+# Where ~nutrimatic sends queries. Set NUTRIMATIC_URL to use a mirror, or a local stand-in.
+# Leaving it blank, as .env.template does, is the same as not setting it
+NUTRIMATIC_URL = os.getenv("NUTRIMATIC_URL") or "https://nutrimatic.org/"
+# Most results shown for a pattern. At least NUTRIMATIC_FULL_PAGE
+NUTRIMATIC_RESULT_LIMIT = 200
+# Nutrimatic stops after this many results, so a page this long has no end of search message
+NUTRIMATIC_FULL_PAGE = 100
+# Seconds to wait for nutrimatic, to connect and for the whole page. Complex patterns can take
+# nutrimatic a while to search, so the total is fairly generous
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_TIMEOUT = 30
+# Most connections the shared HTTP session keeps open at once
+HTTP_POOL_SIZE = 10
+
+# Lookup results are cached, as the same queries come up again and again during a game
+SEARCH_CACHE_SIZE = 512
+SEARCH_CACHE_TTL = 6 * 60 * 60
+# Nutrimatic's results never change, but its pages are fairly big
+NUTRIMATIC_CACHE_SIZE = 128
+NUTRIMATIC_CACHE_TTL = 24 * 60 * 60
+# Set LOOKUP_CACHE_DIR to save the caches there, so they survive a restart. Blank means unset,
+# so the caches aren't saved
+LOOKUP_CACHE_DIR = os.getenv("LOOKUP_CACHE_DIR") or None
+SEARCH_CACHE_FILE = "search_cache.json"
+NUTRIMATIC_CACHE_FILE = "nutrimatic_cache.json"
+# How often changed caches are saved, in seconds
+CACHE_SAVE_INTERVAL = 5 * 60
+
+# Set HPWIKI_INDEX to an index built by lookup_hpwiki from the HP fandom wiki's dump, and
+# ~search hp looks titles up in it before falling back to Google. Blank means there's no index
+HPWIKI_INDEX = os.getenv("HPWIKI_INDEX") or None
+# How close a misspelt query has to be to a title to count as a match, from 0 to 1
+HPWIKI_FUZZY_CUTOFF = 0.85
+# Shortest query that can match the start of a longer title, so "hog" finds "Hogwarts"
+HPWIKI_MIN_PREFIX = 3
@@ -0,0 +1,154 @@
+"""A local index of the Harry Potter fandom wiki's article titles, so ~search hp can usually
+answer without going to Google.
+
+The index is built offline from the wiki's XML dump (Special:Statistics has a link to it):
+    python -m modules.lookup.lookup_hpwiki harrypotter_pages_current.xml hpwiki_index.json
+and loaded from HPWIKI_INDEX when the bot starts.
+"""
+import bisect
+import difflib
+import json
+import os
+import re
+import sys
+import xml.etree.ElementTree as ElementTree
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+from modules.lookup import lookup_constants
+from modules.lookup.lookup_cache import describe_hits
+
+# Anything that isn't a letter or digit, so "Hogwarts: A History" and "hogwarts a history" match
+PUNCTUATION = re.compile(r"[\W_]+")
+
+
+def normalize(title: str) -> str:
+    return PUNCTUATION.sub(" ", title.casefold()).strip()
+
+
+def build_index(dump_path: str) -> Dict[str, Dict[str, str]]:
+    """Read the article titles and redirects out of a MediaWiki XML dump.
+
+    Redirects become aliases for the article they point to. Other namespaces (talk pages,
+    templates, categories and so on) are left out. The dump is streamed, so its size
+    doesn't matter.
+    """
+    articles = set()
+    redirects = {}
+    for _, element in ElementTree.iterparse(dump_path):
+        # Dumps are namespaced by their MediaWiki export version
+        if element.tag.rpartition("}")[2] != "page":
+            continue
+        fields = {child.tag.rpartition("}")[2]: child for child in element}
+        if fields["ns"].text == "0":
+            title = fields["title"].text
+            if "redirect" in fields:
+                redirects[title] = fields["redirect"].get("title")
+            else:
+                articles.add(title)
+        element.clear()
+    aliases = {
+        alias: target
+        for alias, target in redirects.items()
+        # Redirects to sections, other namespaces or missing pages aren't worth keeping
+        if target in articles
+    }
+    return {"articles": sorted(articles), "aliases": aliases}
+
+
+class HPWikiIndex:
+    """Finds the wiki article for a query from its titles and aliases, all held in memory.
+
+    An exact match (ignoring case and punctuation) wins, then the shortest title the query is
+    the start of, if it's at least HPWIKI_MIN_PREFIX characters, then the closest title within
+    HPWIKI_FUZZY_CUTOFF. Closeness is only measured against titles starting with the same
+    letter, which keeps misses fast.
+    """
+
+    def __init__(self, articles: List[str], aliases: Dict[str, str]):
+        # Normalized title or alias to the article it's for. Titles win over aliases
+        self.titles: Dict[str, str] = {
+            normalize(alias): target for alias, target in aliases.items()
+        }
+        self.titles.update((normalize(article), article) for article in articles)
+        self.titles.pop("", None)
+        self.keys = sorted(self.titles)
+        self.keys_by_initial: Dict[str, List[str]] = {}
+        for key in self.keys:
+            self.keys_by_initial.setdefault(key[0], []).append(key)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: str) -> "HPWikiIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        return cls(index["articles"], index["aliases"])
+
+    def find(self, query: str) -> Optional[str]:
+        """The title of the article for query, or None if nothing is close enough"""
+        key = normalize(query)
+        if not key:
+            return None
+        if key in self.titles:
+            return self.titles[key]
+        # Keys starting with the query sit together right after where it would go
+        start = bisect.bisect_left(self.keys, key)
+        end = bisect.bisect_left(self.keys, key + "\uffff", start)
+        if start < end and len(key) >= lookup_constants.HPWIKI_MIN_PREFIX:
+            return self.titles[min(self.keys[start:end], key=len)]
+        matches = difflib.get_close_matches(
+            key,
+            self.keys_by_initial.get(key[0], []),
+            n=1,
+            cutoff=lookup_constants.HPWIKI_FUZZY_CUTOFF,
+        )
+        if matches:
+            return self.titles[matches[0]]
+        return None
+
+    def lookup(self, query: str) -> Optional[str]:
+        """The URL of the article for query, or None to fall back to a search"""
+        title = self.find(query)
+        if title is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        path = quote(title.replace(" ", "_"), safe=":/()!,'")
+        return f"https://{lookup_constants.HPWIKISITE}/{path}"
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def describe(self) -> str:
+        """Hit and miss counts, for showing in an embed"""
+        return f"{describe_hits(self.hits, self.misses)}\nTitles and aliases: {len(self):,}"
+
+
+def load_index(path: Optional[str]) -> Optional[HPWikiIndex]:
+    """The index saved at path, or None if there isn't one, in which case every HP wiki
+    search goes to Google"""
+    if path is None:
+        return None
+    if not os.path.exists(path):
+        print(f"No HP wiki index at {path}, HP wiki searches will use Google")
+        return None
+    return HPWikiIndex.load(path)
+
+
+def main() -> None:
+    if len(sys.argv) != 3:
+        print("Usage: python -m modules.lookup.lookup_hpwiki <dump.xml> <index.json>")
+        sys.exit(1)
+    dump_path, index_path = sys.argv[1:]
+    index = build_index(dump_path)
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    print(
+        f"Indexed {len(index['articles']):,} articles and {len(index['aliases']):,} aliases "
+        f"into {index_path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import html
+import re
+from typing import List, Optional, Tuple
+
+from modules.lookup import lookup_constants
+
+# Everything a results page is read for, found in a single pass over it. Each result is a span
+# whose font size is its weight, e.g. <span style='font-size: 2.519574em'>asymptote</span>.
+# The page's status, e.g. the end of the search or a syntax error in the pattern, is bold
+PAGE_PARTS = re.compile(
+    r"<(?:span[^>]*?font-size:\s*([0-9.]+)[^>]*>(.*?)</span|b>(.*?)</b)", re.DOTALL
+)
+TAG = re.compile(r"<[^>]*>")
+
+
+def to_text(markup: str) -> str:
+    """Drop any tags (e.g. the red font of an error) and unescape what's left"""
+    # Results are almost always plain words, with nothing to drop or unescape
+    if "<" in markup or "&" in markup:
+        markup = html.unescape(TAG.sub("", markup))
+    return markup.strip()
+
+
+def parse_results(page: str) -> Tuple[List[Tuple[str, float]], Optional[str]]:
+    """Get the (word, weight) results on a nutrimatic page, and its status message.
+
+    Only the first NUTRIMATIC_RESULT_LIMIT results are read. The status is the page's last
+    bold message, and is only given when it's worth showing: when there are no results (it's
+    the reason why) or when the page stopped short of a full page of results.
+    """
+    results = []
+    status = None
+    for match in PAGE_PARTS.finditer(page):
+        weight, word, bold = match.groups()
+        if weight is not None:
+            results.append((to_text(word), float(weight)))
+            # A page this long is full, so its status won't be shown and the rest can be skipped
+            if len(results) == lookup_constants.NUTRIMATIC_RESULT_LIMIT:
+                break
+        else:
+            status = bold
+    if status is not None:
+        status = to_text(status)
+    if len(results) >= lookup_constants.NUTRIMATIC_FULL_PAGE:
+        status = None
+    return results, status
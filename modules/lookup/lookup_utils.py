@@ -1,6 +1,19 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import aiohttp
 import googlesearch
 
 from modules.lookup import lookup_constants
+from modules.lookup.lookup_cache import LookupCache, SingleFlight, cache_key
+
+# Every search runs in here rather than on the event loop, see search
+search_pool = ThreadPoolExecutor(
+    max_workers=lookup_constants.SEARCH_WORKERS, thread_name_prefix="search"
+)
+# Identical searches sent at the same time share one trip to Google
+search_flights = SingleFlight()
 
 
 def search_query(original_query, target_site="google"):
@@ -39,3 +52,84 @@ def search_query(original_query, target_site="google"):
         results.append(result)
 
     return results
+
+
+async def search(
+    original_query: str, target_site: str = "google", cache: Optional[LookupCache] = None
+) -> List[str]:
+    """Run search_query in the search pool. googlesearch blocks for at least PAUSE_TIME per page
+    of results, which would otherwise hold up every other command, button and heartbeat.
+    Searches beyond SEARCH_WORKERS wait their turn, and a search that's already running is
+    shared rather than sent again.
+    With a cache, results are reused for queries that were searched recently"""
+    key = cache_key(original_query, lookup_constants.REGISTERED_SITES.get(target_site, target_site))
+    if cache is not None:
+        results = cache.get(key)
+        if results is not None:
+            return list(results)
+
+    async def fetch() -> List[str]:
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(search_pool, search_query, original_query, target_site)
+        if cache is not None:
+            cache.put(key, results)
+        return results
+
+    # The result is shared, so every caller gets their own list
+    return list(await search_flights.run(key, fetch))
+
+
+class NutrimaticClient:
+    """Fetches nutrimatic result pages through one HTTP session, shared by every command so
+    connections are pooled and reused rather than opened for each query. A pattern that's
+    already being fetched is shared rather than sent again.
+    With a cache, pages are reused for patterns that were looked up recently"""
+
+    def __init__(
+        self,
+        base_url: str = lookup_constants.NUTRIMATIC_URL,
+        timeout: float = lookup_constants.HTTP_TIMEOUT,
+        connect_timeout: float = lookup_constants.HTTP_CONNECT_TIMEOUT,
+        cache: Optional[LookupCache] = None,
+    ):
+        self.base_url = base_url
+        self.cache = cache
+        self.flights = SingleFlight()
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def url(self, query: str) -> str:
+        """The results page for a query, which is also the link shown to users"""
+        query = query.replace("&", "%26").replace("+", "%2B").replace("#", "%23").replace(" ", "+")
+        return self.base_url + "?q=" + query + "&go=Go"
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Made on first use, as a session has to be made inside the event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=lookup_constants.HTTP_POOL_SIZE),
+            )
+        return self._session
+
+    async def fetch(self, query: str) -> str:
+        """Get the results page for a query.
+        Raises asyncio.TimeoutError if nutrimatic is too slow, or aiohttp.ClientError"""
+        key = cache_key(query, self.base_url, exact=True)
+        if self.cache is not None:
+            page = self.cache.get(key)
+            if page is not None:
+                return page
+        return await self.flights.run(key, lambda: self._fetch(key, query))
+
+    async def _fetch(self, key: str, query: str) -> str:
+        async with self._get_session().get(self.url(query)) as response:
+            response.raise_for_status()
+            page = await response.text(encoding="utf-8")
+        if self.cache is not None:
+            self.cache.put(key, page)
+        return page
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import zipfile
+
+from benchmarks.fakes import FakeMessage, FakeTextChannel
+from modules.archive import archive_constants
+from modules.archive.archive_checkpoints import CheckpointStore
+from modules.archive.archive_volumes import VolumeWriter
+from modules.archive.cog import ArchiveCog
+
+IMAGES_DIR = os.path.join(archive_constants.ARCHIVE, archive_constants.IMAGES)
+TEXT_LOG_ARCNAME = os.path.join(archive_constants.ARCHIVE, "chan_text_log.txt")
+DUPLICATES_ARCNAME = os.path.join(archive_constants.ARCHIVE, "chan_duplicates.txt")
+
+
+def write_delta(directory, name, lines, images):
+    """Write a delta archive the way ArchiveCog does: attachments plus the chat log"""
+    text_log_path = os.path.join(directory, f"{name}_text_log.txt")
+    zip_path = os.path.join(directory, f"{name}_archive.zip")
+    with open(text_log_path, "w") as f:
+        f.writelines(line + "\n" for line in lines)
+    with zipfile.ZipFile(zip_path, mode="w") as zf:
+        for image in images:
+            zf.writestr(os.path.join(IMAGES_DIR, image), image.encode())
+        zf.write(text_log_path, arcname=TEXT_LOG_ARCNAME)
+    return [zip_path], text_log_path
+
+
+def test_load_missing_checkpoint(tmp_path):
+    checkpoint = CheckpointStore(str(tmp_path)).load(123)
+    assert checkpoint.channel_id == 123
+    assert checkpoint.last_message_id is None
+    assert checkpoint.attachments == {}
+
+
+def test_commit_round_trip(tmp_path):
+    store = CheckpointStore(str(tmp_path / "store"))
+    checkpoint = store.load(123)
+    checkpoint.last_message_id = 42
+    checkpoint.add_attachment(os.path.join(IMAGES_DIR, "a.png"), 1, 10)
+    store.commit(checkpoint, *write_delta(str(tmp_path), "first", ["one"], ["a.png"]))
+
+    loaded = store.load(123)
+    assert loaded == checkpoint
+
+
+def test_merge_into_appends_delta_to_stored_history(tmp_path):
+    store = CheckpointStore(str(tmp_path / "store"))
+    checkpoint = store.load(123)
+    store.commit(checkpoint, *write_delta(str(tmp_path), "first", ["one"], ["a.png"]))
+    delta_zips, delta_text_log = write_delta(str(tmp_path), "second", ["two"], ["b.png"])
+
+    zip_path = str(tmp_path / "merged.zip")
+    text_log_path = str(tmp_path / "merged.txt")
+    with VolumeWriter(zip_path) as volumes:
+        store.merge_into(
+            checkpoint,
+            delta_zips,
+            delta_text_log,
+            volumes,
+            text_log_path,
+            TEXT_LOG_ARCNAME,
+            DUPLICATES_ARCNAME,
+        )
+
+    with open(text_log_path) as f:
+        assert f.read() == "one\ntwo\n"
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.namelist() == [
+            os.path.join(IMAGES_DIR, "a.png"),
+            os.path.join(IMAGES_DIR, "b.png"),
+            TEXT_LOG_ARCNAME,
+        ]
+
+
+def test_merge_into_lists_duplicates(tmp_path):
+    store = CheckpointStore(str(tmp_path / "store"))
+    checkpoint = store.load(123)
+    original = os.path.join(IMAGES_DIR, "a.png")
+    repeat = os.path.join(IMAGES_DIR, "a (1).png")
+    checkpoint.add_attachment(original, 1, 10, sha256="abc")
+    checkpoint.add_attachment(repeat, 2, 10, duplicate_of=original)
+    delta_zips, delta_text_log = write_delta(str(tmp_path), "delta", ["one"], ["a.png"])
+
+    zip_path = str(tmp_path / "merged.zip")
+    with VolumeWriter(zip_path) as volumes:
+        store.merge_into(
+            checkpoint,
+            delta_zips,
+            delta_text_log,
+            volumes,
+            str(tmp_path / "merged.txt"),
+            TEXT_LOG_ARCNAME,
+            DUPLICATES_ARCNAME,
+        )
+
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.read(DUPLICATES_ARCNAME).decode() == f"{repeat} is the same file as {original}\n"
+
+
+def test_merge_exports_replays_stored_and_delta_records(tmp_path):
+    store = CheckpointStore(str(tmp_path / "store"))
+    checkpoint = store.load(123)
+    first_records = tmp_path / "first.jsonl"
+    first_records.write_text('{"id": 1}\n')
+    store.commit(
+        checkpoint,
+        *write_delta(str(tmp_path), "first", ["one"], []),
+        delta_records_path=str(first_records),
+    )
+    delta_records = tmp_path / "second.jsonl"
+    delta_records.write_text('{"id": 2}\n')
+
+    merged = str(tmp_path / "merged.jsonl")
+    store.merge_exports(checkpoint, str(delta_records), {"jsonl": merged})
+
+    with open(merged) as f:
+        assert [json.loads(line)["id"] for line in f] == [1, 2]
+
+
+def test_merged_delta_archive_has_the_whole_history(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    channel = FakeTextChannel("chan", [FakeMessage(1, "first", [])])
+
+    async def archive(merge):
+        cog = ArchiveCog(None)
+        checkpoint = cog.checkpoints.load(channel.id)
+        workspace = str(tmp_path / f"workspace{len(channel.messages)}")
+        os.mkdir(workspace)
+        zip_files, _, textfile, _ = await cog.archive_one_channel(
+            channel, workspace, checkpoint=checkpoint, merge=merge
+        )
+        for file in [*zip_files, textfile]:
+            file.close()
+        cog.checkpoints.commit(
+            checkpoint,
+            [zip_file.fp.name for zip_file in zip_files],
+            os.path.join(workspace, "chan_delta_text_log.txt"),
+            os.path.join(workspace, "chan_delta_messages.jsonl"),
+        )
+        return zip_files[0].fp.name, textfile.fp.name
+
+    asyncio.run(archive(merge=False))
+    channel.messages.append(FakeMessage(2, "second", []))
+    zip_path, text_log_path = asyncio.run(archive(merge=True))
+
+    with open(text_log_path, encoding="utf-8") as f:
+        assert [line.split(": ", 1)[1] for line in f.read().splitlines()] == ["first", "second"]
+    with zipfile.ZipFile(zip_path) as zf:
+        records = zf.read("archive/chan_messages.jsonl").decode().splitlines()
+    assert [json.loads(record)["clean_content"] for record in records] == ["first", "second"]
@@ -0,0 +1,166 @@
+import asyncio
+import html
+import json
+import os
+import zipfile
+
+from benchmarks.fakes import FakeMessage, FakeTextChannel
+from modules.archive.archive_dedup import DedupIndex
+from modules.archive.cog import ArchiveCog
+
+
+def test_find_by_id_and_hash():
+    dedup = DedupIndex()
+    dedup.add_id("the #a archive", 1, 10, ("the #a archive", "img.png"))
+    dedup.add_hash("the #a archive", DedupIndex.hash(b"data"), ("the #a archive", "img.png"))
+
+    assert dedup.find_by_id("the #a archive", 1, 10) == ("the #a archive", "img.png")
+    # A different size means a different file, even with the same ID
+    assert dedup.find_by_id("the #a archive", 1, 11) is None
+    assert dedup.find_by_hash("the #a archive", DedupIndex.hash(b"data")) == (
+        "the #a archive",
+        "img.png",
+    )
+    assert dedup.find_by_hash("the #a archive", DedupIndex.hash(b"other")) is None
+
+
+def test_copies_are_only_shared_once_sent():
+    dedup = DedupIndex()
+    dedup.add_id("the #a archive", 1, 10, ("the #a archive", "img.png"))
+    dedup.add_hash("the #a archive", DedupIndex.hash(b"data"), ("the #a archive", "img.png"))
+
+    # #a might still fail or be cancelled, so #b can't count on its copy yet
+    assert dedup.find_by_id("the #b archive", 1, 10) is None
+    assert dedup.find_by_hash("the #b archive", DedupIndex.hash(b"data")) is None
+
+    dedup.add_id("the #b archive", 1, 10, ("the #b archive", "img.png"))
+    dedup.mark_sent("the #a archive")
+    dedup.mark_sent("the #b archive")
+    # The first archive sent keeps the copy others point at
+    assert dedup.find_by_id("the #c archive", 1, 10) == ("the #a archive", "img.png")
+    assert dedup.find_by_hash("the #c archive", DedupIndex.hash(b"data")) == (
+        "the #a archive",
+        "img.png",
+    )
+
+
+def test_describe_duplicates_only_lists_repeats_saved_in_that_archive():
+    dedup = DedupIndex()
+    dedup.add_duplicate("the #a archive", "img (1).png", ("the #a archive", "img.png"))
+    dedup.add_duplicate("the #b archive", "img.png", ("the #a archive", "img.png"))
+
+    assert (
+        dedup.describe_duplicates("the #a archive") == "img (1).png is the same file as img.png\n"
+    )
+    assert dedup.describe_duplicates("the #b archive") == (
+        "img.png is the same file as img.png in the #a archive\n"
+    )
+    assert dedup.describe_duplicates("the #c archive") == ""
+
+
+class StaticAttachment:
+    def __init__(self, attachment_id, data, delay=0.0):
+        self.id = attachment_id
+        self.filename = "img.png"
+        self.size = len(data)
+        self.url = f"https://cdn/{attachment_id}/img.png"
+        self.data = data
+        self.delay = delay
+
+    async def read(self):
+        await asyncio.sleep(self.delay)
+        return self.data
+
+
+def test_exports_point_at_the_saved_copy(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    image = os.urandom(1_000)
+    # The first download is slow, so the repeats' records are ready long before it's saved
+    attachments = [
+        StaticAttachment(1, image, delay=0.1),
+        StaticAttachment(2, image),
+        StaticAttachment(1, image),
+    ]
+    channel = FakeTextChannel(
+        "chan",
+        [FakeMessage(n, f"copy {n}", [attachment]) for n, attachment in enumerate(attachments, 1)],
+    )
+
+    async def archive():
+        cog = ArchiveCog(None)
+        workspace = str(tmp_path / "workspace")
+        os.mkdir(workspace)
+        zip_files, _, textfile, _ = await cog.archive_one_channel(channel, workspace)
+        for file in [*zip_files, textfile]:
+            file.close()
+        return zip_files[0].fp.name
+
+    with zipfile.ZipFile(asyncio.run(archive())) as zf:
+        images = [name for name in zf.namelist() if "/images/" in name]
+        records = [json.loads(line) for line in zf.read("archive/chan_messages.jsonl").splitlines()]
+        transcript = zf.read("archive/chan_messages.html").decode()
+
+    # Whichever copy finished downloading first is the one saved, and every record points at it
+    assert len(images) == 1
+    assert [record["attachments"][0]["saved_as"] for record in records] == images * 3
+    href = images[0].split("/", 1)[1]
+    assert transcript.count(f'src="{html.escape(href)}"') == 3
+
+
+def archive_general_channels(tmp_path, send_first):
+    """Archive two #general channels with the same image through one dedup index, marking the
+    first as sent if send_first. Returns the second one's zip"""
+    image = os.urandom(1_000)
+    channels = []
+    for channel_id in (1, 2):
+        channel = FakeTextChannel(
+            "general", [FakeMessage(1, "copy", [StaticAttachment(channel_id, image)])]
+        )
+        channel.id = channel_id
+        channels.append(channel)
+
+    async def archive():
+        cog = ArchiveCog(None)
+        dedup = DedupIndex()
+        for channel in channels:
+            workspace = str(tmp_path / f"workspace{channel.id}")
+            os.mkdir(workspace)
+            zip_files, _, textfile, _ = await cog.archive_one_channel(
+                channel, workspace, dedup=dedup
+            )
+            for file in [*zip_files, textfile]:
+                file.close()
+            if send_first:
+                dedup.mark_sent(channel.id)
+        return zip_files[0].fp.name
+
+    return zipfile.ZipFile(asyncio.run(archive()))
+
+
+def test_channels_with_the_same_name_are_different_archives(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with archive_general_channels(tmp_path, send_first=True) as zf:
+        record = json.loads(zf.read("archive/general_messages.jsonl"))
+        duplicates = zf.read("archive/general_duplicates.txt").decode()
+
+    # The second #general points at the first one's copy rather than claiming it as its own
+    assert record["attachments"][0]["saved_as"] is None
+    assert record["attachments"][0]["duplicate_of"] == (
+        "archive/images/img.png in the #general archive"
+    )
+    assert duplicates == (
+        "archive/images/img.png is the same file as archive/images/img.png in the #general "
+        "archive\n"
+    )
+
+
+def test_copies_in_unsent_archives_are_saved_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with archive_general_channels(tmp_path, send_first=False) as zf:
+        record = json.loads(zf.read("archive/general_messages.jsonl"))
+        images = [name for name in zf.namelist() if "/images/" in name]
+
+    # The first #general was never sent, so the second keeps its own copy
+    assert images == ["archive/images/img.png"]
+    assert record["attachments"][0]["saved_as"] == "archive/images/img.png"
+    assert record["attachments"][0]["duplicate_of"] is None
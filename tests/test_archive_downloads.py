@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from modules.archive.archive_downloads import ArchiveStats, DownloadPool
+from modules.archive.archive_jobs import ArchiveCancelled, CancelToken
+
+
+class SlowAttachment:
+    def __init__(self, data, delay=0.05):
+        self.data = data
+        self.size = len(data)
+        self.delay = delay
+
+    async def read(self):
+        await asyncio.sleep(self.delay)
+        return self.data
+
+
+class BrokenAttachment:
+    size = 1
+
+    async def read(self):
+        await asyncio.sleep(0.01)
+        raise ConnectionResetError("download failed")
+
+
+def test_pool_saves_every_download():
+    saved = []
+
+    async def save(data):
+        saved.append(data)
+
+    async def archive():
+        async with DownloadPool(2, ArchiveStats()) as pool:
+            for n in range(5):
+                await pool.submit(SlowAttachment(bytes([n])), save)
+
+    asyncio.run(archive())
+    assert sorted(saved) == [bytes([n]) for n in range(5)]
+
+
+def test_pool_stops_when_cancelled():
+    saved = []
+    cancel = CancelToken()
+
+    async def save(data):
+        saved.append(data)
+
+    async def archive():
+        async with DownloadPool(2, ArchiveStats(), cancel) as pool:
+            for n in range(5):
+                await pool.submit(SlowAttachment(bytes([n])), save)
+                cancel.cancel()
+
+    with pytest.raises(ArchiveCancelled):
+        asyncio.run(archive())
+    # Downloads that finish after the cancel aren't saved
+    assert saved == []
+
+
+def test_failed_download_cancels_the_rest():
+    saved = []
+
+    async def save(data):
+        saved.append(data)
+
+    async def archive():
+        with pytest.raises(ConnectionResetError):
+            async with DownloadPool(4, ArchiveStats()) as pool:
+                await pool.submit(SlowAttachment(b"slow", delay=0.3), save)
+                await pool.submit(BrokenAttachment(), save)
+        # Give the slow download time to finish, if it were still running
+        await asyncio.sleep(0.5)
+
+    asyncio.run(archive())
+    # It was stopped rather than left to save into an archive that's been given up on
+    assert saved == []
+
+
+def test_pool_keeps_to_its_byte_budget():
+    in_flight = []
+    most_in_flight = 0
+
+    class TrackedAttachment(SlowAttachment):
+        async def read(self):
+            nonlocal most_in_flight
+            in_flight.append(self.size)
+            most_in_flight = max(most_in_flight, sum(in_flight))
+            data = await super().read()
+            in_flight.remove(self.size)
+            return data
+
+    async def save(data):
+        pass
+
+    async def archive():
+        async with DownloadPool(8, ArchiveStats(), max_bytes=100) as pool:
+            for size in [40, 40, 40, 150, 10, 60, 30]:
+                await pool.submit(TrackedAttachment(bytes(size), delay=0.01), save)
+        return pool
+
+    pool = asyncio.run(archive())
+    # Only the attachment bigger than the whole budget went over it, and it went alone
+    assert most_in_flight == 150
+    assert pool._bytes_in_flight == 0
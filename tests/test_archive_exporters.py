@@ -0,0 +1,167 @@
+import asyncio
+import datetime
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from modules.archive import archive_exporters
+from modules.archive.archive_jobs import ArchiveCancelled, CancelToken
+
+
+def make_message(message_id, content, attachments=(), reply_to=None, edited=False):
+    """Just enough of a nextcord.Message for message_record"""
+    created_at = datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+    return SimpleNamespace(
+        id=message_id,
+        created_at=created_at,
+        edited_at=created_at if edited else None,
+        author=SimpleNamespace(id=7, name="kev", display_name="Kev"),
+        content=content,
+        clean_content=content,
+        reference=SimpleNamespace(message_id=reply_to) if reply_to is not None else None,
+        pinned=False,
+        attachments=list(attachments),
+        embeds=[SimpleNamespace(to_dict=lambda: {"title": "Puzzle", "description": "<b>hi</b>"})],
+        reactions=[SimpleNamespace(emoji="👍", count=3)],
+    )
+
+
+def make_attachment(attachment_id, filename):
+    return SimpleNamespace(
+        id=attachment_id, filename=filename, size=10, url=f"https://cdn/{attachment_id}/{filename}"
+    )
+
+
+def test_message_record():
+    image = make_attachment(1, "a.png")
+    big = make_attachment(2, "big.mp4")
+    msg = make_message(10, "hello", [image, big], reply_to=9, edited=True)
+    record = archive_exporters.message_record(msg, [(image, "archive/images/a.png"), (big, None)])
+
+    assert record["reply_to"] == 9
+    assert record["edited_at"] == record["created_at"] == "2024-01-02T03:04:05+00:00"
+    assert record["author"] == {"id": 7, "name": "kev", "display_name": "Kev"}
+    assert [attachment["saved_as"] for attachment in record["attachments"]] == [
+        "archive/images/a.png",
+        None,
+    ]
+    assert record["embeds"] == [{"title": "Puzzle", "description": "<b>hi</b>"}]
+    assert record["reactions"] == [{"emoji": "👍", "count": 3}]
+
+
+def test_text_exporter_matches_chat_log_format(tmp_path):
+    image = make_attachment(1, "a.png")
+    big = make_attachment(2, "big.mp4")
+    msg = make_message(10, "hello", [image, big])
+    path = str(tmp_path / "log.txt")
+    with archive_exporters.TextExporter(path) as exporter:
+        exporter.write(
+            archive_exporters.message_record(msg, [(image, "archive/images/a.png"), (big, None)])
+        )
+
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == (
+            f"[ 01-02-2024, 03:04:05 ] {'Kev'.rjust(25)}: hello a.png https://cdn/2/big.mp4\n"
+        )
+
+
+def test_jsonl_round_trip(tmp_path):
+    records = [
+        archive_exporters.message_record(make_message(n, f"message {n}"), []) for n in range(3)
+    ]
+    path = str(tmp_path / "messages.jsonl")
+    with archive_exporters.JsonlExporter(path) as exporter:
+        for record in records:
+            exporter.write(record)
+
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+    assert list(archive_exporters.read_records(path)) == json.loads(json.dumps(records))
+
+
+def test_html_exporter_escapes_and_links(tmp_path):
+    image = make_attachment(1, "a.png")
+    msg = make_message(10, "<script>x</script>", [image], reply_to=9)
+    path = str(tmp_path / "messages.html")
+    with archive_exporters.HtmlExporter(path) as exporter:
+        exporter.write(archive_exporters.message_record(msg, [(image, "archive/images/a.png")]))
+
+    with open(path, encoding="utf-8") as f:
+        page = f.read()
+    assert "<script>" not in page
+    assert "&lt;script&gt;" in page
+    assert '<img src="images/a.png"' in page
+    assert 'href="#m9"' in page
+    assert page.endswith("</html>\n")
+
+
+class RecordingExporter:
+    """Remembers which thread did what"""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.calls.append(("open", threading.get_ident()))
+
+    def write(self, record):
+        self.calls.append((record["id"], threading.get_ident()))
+
+    def close(self):
+        self.calls.append(("close", threading.get_ident()))
+
+
+def test_batch_writer_writes_in_order_off_the_event_loop():
+    calls = []
+
+    async def archive():
+        async with archive_exporters.BatchWriter(
+            [lambda: RecordingExporter(calls)], batch_size=3
+        ) as writer:
+            for n in range(7):
+                await writer.write({"id": n})
+
+    asyncio.run(archive())
+    assert [call for call, _ in calls] == ["open", *range(7), "close"]
+    assert {thread for _, thread in calls} != {threading.get_ident()}
+    assert len({thread for _, thread in calls}) == 1
+
+
+def test_batch_writer_raises_write_errors():
+    class BrokenExporter(RecordingExporter):
+        def write(self, record):
+            raise OSError("disk full")
+
+    calls = []
+
+    async def archive():
+        async with archive_exporters.BatchWriter(
+            [lambda: BrokenExporter(calls)], batch_size=2
+        ) as writer:
+            for n in range(5):
+                await writer.write({"id": n})
+
+    with pytest.raises(OSError):
+        asyncio.run(archive())
+    # The exporter is still closed
+    assert calls[-1][0] == "close"
+
+
+def test_batch_writer_stops_when_cancelled():
+    calls = []
+    cancel = CancelToken()
+
+    async def archive():
+        async with archive_exporters.BatchWriter(
+            [lambda: RecordingExporter(calls)], batch_size=2, cancel=cancel
+        ) as writer:
+            for n in range(10):
+                if n == 4:
+                    cancel.cancel()
+                await writer.write({"id": n})
+
+    with pytest.raises(ArchiveCancelled):
+        asyncio.run(archive())
+    written = [call for call, _ in calls if isinstance(call, int)]
+    assert written and written[-1] < 4
+    assert calls[-1][0] == "close"
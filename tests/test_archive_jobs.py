@@ -0,0 +1,200 @@
+import asyncio
+from types import SimpleNamespace
+
+import nextcord
+import pytest
+
+from modules.archive import archive_constants
+from modules.archive.archive_jobs import ArchiveCancelled, CancelToken, JobQueue
+from modules.archive.cog import ArchiveCog
+
+
+def test_jobs_survive_reload(tmp_path):
+    path = str(tmp_path / "jobs.json")
+    queue = JobQueue(path)
+    job = queue.create(1, 2, "Game 1", [10, 11, 12])
+    job.channels[0].status = archive_constants.DONE
+    job.channels[1].status = archive_constants.RUNNING
+    job.channels[1].last_message_id = 99
+    queue.save()
+
+    reloaded = JobQueue(path).jobs[job.job_id]
+    assert reloaded.target == "Game 1"
+    # The interrupted channel is archived again from the start
+    assert [channel_job.status for channel_job in reloaded.channels] == [
+        archive_constants.DONE,
+        archive_constants.PENDING,
+        archive_constants.PENDING,
+    ]
+    assert reloaded.channels[1].last_message_id == 99
+    assert reloaded.next_channel().channel_id == 11
+
+
+def test_finish_removes_job(tmp_path):
+    path = str(tmp_path / "jobs.json")
+    queue = JobQueue(path)
+    first = queue.create(1, 2, "Game 1", [10])
+    second = queue.create(3, 4, "Game 2", [20])
+    assert second.job_id == first.job_id + 1
+    queue.finish(first)
+
+    reloaded = JobQueue(path)
+    assert list(reloaded.jobs) == [second.job_id]
+    assert reloaded.for_guild(1) == []
+    assert [job.job_id for job in reloaded.for_guild(3)] == [second.job_id]
+
+
+def test_job_ids_are_never_reused(tmp_path):
+    path = str(tmp_path / "jobs.json")
+    queue = JobQueue(path)
+    queue.create(1, 2, "Game 1", [10])
+    second = queue.create(1, 2, "Game 2", [20])
+    queue.finish(second)
+
+    # Even after a restart, the next job doesn't get the finished job's ID
+    third = JobQueue(path).create(1, 2, "Game 3", [30])
+    assert third.job_id == second.job_id + 1
+
+
+def test_cancel_token():
+    cancel = CancelToken()
+    cancel.check()
+    cancel.cancel()
+    assert cancel.cancelled
+    with pytest.raises(ArchiveCancelled):
+        cancel.check()
+
+
+class FakeMessage:
+    def __init__(self, embed=None):
+        self.embeds = [embed] if embed is not None else []
+
+    async def edit(self, embed=None):
+        self.embeds = [embed]
+
+    async def delete(self):
+        pass
+
+
+class FakeReplyChannel:
+    def __init__(self):
+        self.id = 2
+        self.guild = SimpleNamespace(filesize_limit=8 * 1_048_576)
+        self.sent = []
+
+    async def send(self, embed=None, **kwargs):
+        self.sent.append(embed)
+        return FakeMessage(embed)
+
+
+class FakeBot:
+    """Just enough of a bot for ArchiveCog.run_job, with text channels 10, 11 and 12"""
+
+    def __init__(self):
+        self.reply_channel = FakeReplyChannel()
+        channels = {
+            channel_id: SimpleNamespace(id=channel_id, name=f"channel-{channel_id}")
+            for channel_id in (10, 11, 12)
+        }
+        self.guild = SimpleNamespace(id=1, get_channel=channels.get)
+
+    def get_guild(self, guild_id):
+        return self.guild
+
+    def get_channel(self, channel_id):
+        return self.reply_channel
+
+    async def fetch_user(self, user_id):
+        return SimpleNamespace(mention="@owner")
+
+
+def test_shutting_down_leaves_running_channels_to_resume(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    started = []
+
+    async def archive_job_channel(channel_job, *args):
+        started.append(channel_job.channel_id)
+        # Never finishes, like a long archive when the bot is stopped
+        await asyncio.Event().wait()
+
+    async def run():
+        cog = ArchiveCog(FakeBot())
+        monkeypatch.setattr(cog, "archive_job_channel", archive_job_channel)
+        job = cog.jobs.create(1, 2, "Game 1", [10, 11, 12])
+        job.channels[0].status = archive_constants.DONE
+        cog.jobs.save()
+        task = asyncio.create_task(cog.run_job(job))
+        while len(started) < 2:
+            await asyncio.sleep(0)
+        # What the bot does to every task when it's stopped
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return job
+
+    job = asyncio.run(run())
+    assert started == [11, 12]
+    assert [channel_job.status for channel_job in job.channels] == [
+        archive_constants.DONE,
+        archive_constants.PENDING,
+        archive_constants.PENDING,
+    ]
+    # The job is still saved, and picks up the interrupted channels when it's resumed
+    reloaded = JobQueue(archive_constants.JOBS_FILE).jobs[job.job_id]
+    assert reloaded.next_channel().channel_id == 11
+    assert reloaded.count(archive_constants.PENDING) == 2
+
+
+def test_resumed_jobs_are_kept_until_they_finish(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+
+    async def run_job(job, resumed=False):
+        await asyncio.sleep(0)
+        raise RuntimeError("Discord is down")
+
+    async def run():
+        cog = ArchiveCog(FakeBot())
+        cog.jobs.create(1, 2, "Game 1", [10])
+        monkeypatch.setattr(cog, "run_job", run_job)
+        await cog.on_ready()
+        assert len(cog._resumed_jobs) == 1
+        await asyncio.gather(*cog._resumed_jobs, return_exceptions=True)
+        await asyncio.sleep(0)
+        return cog
+
+    cog = asyncio.run(run())
+    assert not cog._resumed_jobs
+    assert "Resumed archive job 1 for Game 1 failed: RuntimeError('Discord is down')" in (
+        capsys.readouterr().out
+    )
+
+
+def test_a_failing_channel_doesnt_stop_the_job(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def archive_job_channel(channel_job, *args):
+        await asyncio.sleep(0)
+        if channel_job.channel_id == 11:
+            # e.g. a 404 on an attachment that was deleted mid archive
+            raise nextcord.HTTPException(SimpleNamespace(status=404, reason="Not Found"), "")
+        return archive_constants.DONE
+
+    async def run():
+        cog = ArchiveCog(FakeBot())
+        monkeypatch.setattr(cog, "archive_job_channel", archive_job_channel)
+        job = cog.jobs.create(1, 2, "Game 1", [10, 11, 12])
+        await cog.run_job(job)
+        return cog, job
+
+    cog, job = asyncio.run(run())
+    assert [channel_job.status for channel_job in job.channels] == [
+        archive_constants.DONE,
+        archive_constants.FAILED,
+        archive_constants.DONE,
+    ]
+    # The job still finished, and told the user which channel it skipped
+    assert cog.jobs.jobs == {} and cog.cancel_tokens == {}
+    assert JobQueue(archive_constants.JOBS_FILE).jobs == {}
+    fields = [field.value for embed in cog.bot.reply_channel.sent for field in embed.fields]
+    assert any("<#11>" in value and "skipped" in value for value in fields)
+    assert "but 1 of its channels failed" in fields[-2]
@@ -0,0 +1,45 @@
+import pytest
+
+from modules.archive.archive_names import NameRegistry, split_extension
+
+
+@pytest.mark.parametrize(
+    "name,expected",
+    [
+        ("img.png", ("img", ".png")),
+        ("notes.v2.final.txt", ("notes.v2.final", ".txt")),
+        ("logs.tar.gz", ("logs", ".tar.gz")),
+        ("archive/images/README", ("archive/images/README", "")),
+    ],
+)
+def test_split_extension(name, expected):
+    assert split_extension(name) == expected
+
+
+def test_claim_numbers_repeats():
+    names = NameRegistry()
+    assert [names.claim("archive/images/img.png") for _ in range(3)] == [
+        "archive/images/img.png",
+        "archive/images/img (1).png",
+        "archive/images/img (2).png",
+    ]
+    # Dots before the extension are kept, unlike splitting on the first dot
+    assert names.claim("a.b.png") == "a.b.png"
+    assert names.claim("a.b.png") == "a.b (1).png"
+
+
+def test_claim_skips_names_already_taken():
+    names = NameRegistry(["img.png", "img (1).png"])
+    names.update(["img (2).png"])
+    assert names.claim("img (1).png") == "img (1) (1).png"
+    assert names.claim("img.png") == "img (3).png"
+    assert names.claim("img.png") == "img (4).png"
+    assert "img (4).png" in names
+    assert len(names) == 6
+
+
+def test_claim_is_not_quadratic():
+    names = NameRegistry()
+    claimed = [names.claim("image.png") for _ in range(20_000)]
+    assert len(set(claimed)) == 20_000
+    assert claimed[-1] == "image (19999).png"
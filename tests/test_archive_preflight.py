@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from modules.archive import archive_constants, archive_preflight
+from modules.archive.archive_jobs import ArchiveCancelled, CancelToken
+
+MB = 1_048_576
+
+
+def make_message(content, sizes=(), display_name="Kev"):
+    """Just enough of a nextcord.Message for the scan"""
+    return SimpleNamespace(
+        author=SimpleNamespace(display_name=display_name),
+        content=content,
+        attachments=[
+            SimpleNamespace(filename=f"{n}.png", size=size, url=f"https://cdn/{n}.png")
+            for n, size in enumerate(sizes)
+        ],
+    )
+
+
+def scan(messages, **kwargs):
+    return asyncio.run(archive_preflight.scan(archive_preflight.replay(messages), **kwargs))
+
+
+def test_scan_adds_up_without_downloading():
+    messages = [make_message("hi", [MB, 2 * MB]), make_message("no files"), make_message("", [5])]
+    preflight = scan(messages, volume_limit=10 * MB)
+
+    assert preflight.messages == 3
+    assert preflight.attachments == 3
+    assert preflight.attachment_bytes == 3 * MB + 5
+    assert preflight.attachments_too_big == 0
+    assert preflight.kept_messages == messages
+    # Each line is the timestamp, the padded name, the content and the attachment names
+    assert preflight.text_log_bytes == (
+        3 * (archive_preflight.TEXT_LOG_LINE_OVERHEAD + 25 + 1) + 2 + 8 + 2 * 6 + 6
+    )
+
+
+def test_scan_counts_names_in_bytes():
+    name = "Ünïcödé Hermione Granger-Weasley"
+    preflight = scan([make_message("hi", display_name=name)])
+    assert preflight.text_log_bytes == (
+        archive_preflight.TEXT_LOG_LINE_OVERHEAD + len(name.encode()) + 2 + 1
+    )
+
+
+def test_scan_skips_attachments_that_never_fit():
+    preflight = scan([make_message("huge", [20 * MB, MB])], volume_limit=10 * MB)
+    assert preflight.attachment_bytes == MB
+    assert preflight.attachments_too_big == 1
+
+
+def test_scan_stops_keeping_messages_past_the_limit():
+    preflight = scan([make_message(str(n)) for n in range(5)], keep_limit=4)
+    assert preflight.messages == 5
+    assert preflight.kept_messages is None
+
+
+@pytest.mark.parametrize(
+    "attachment_bytes, text_log_bytes, strategy, volumes",
+    [
+        (MB, 1000, archive_constants.FULL_ZIP, 1),
+        (30 * MB, 1000, archive_constants.SPLIT_VOLUMES, 4),
+        (500 * MB, 1000, archive_constants.TEXT_ONLY, 1),
+        # The chat log estimate is only trusted to turn a channel away when it's well over
+        (0, 12 * MB, archive_constants.SPLIT_VOLUMES, 2),
+        (0, 20 * MB, archive_constants.TOO_BIG, 3),
+    ],
+)
+def test_plan(attachment_bytes, text_log_bytes, strategy, volumes):
+    preflight = archive_preflight.Preflight(
+        attachment_bytes=attachment_bytes, text_log_bytes=text_log_bytes
+    )
+    assert preflight.plan(10 * MB, export_count=0) == strategy
+    assert preflight.volumes == volumes
+
+
+def test_eta_counts_downloads_and_rereading_history():
+    preflight = archive_preflight.Preflight(attachment_bytes=8 * MB, scan_seconds=3.0)
+    preflight.plan(100 * MB)
+    assert preflight.eta_seconds(download_rate=2 * MB) == 4.0 + 3.0
+
+    preflight.kept_messages = []
+    assert preflight.eta_seconds(download_rate=2 * MB) == 4.0
+    assert "0m 4s" in preflight.describe(download_rate=2 * MB)
+
+    preflight.strategy = archive_constants.TEXT_ONLY
+    assert preflight.eta_seconds(download_rate=2 * MB) == 0.0
+
+
+def test_scan_stops_when_cancelled():
+    cancel = CancelToken()
+    cancel.cancel()
+    with pytest.raises(ArchiveCancelled):
+        scan([make_message("hi")], cancel=cancel)
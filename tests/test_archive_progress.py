@@ -0,0 +1,45 @@
+import asyncio
+
+import nextcord
+
+from modules.archive.archive_downloads import ArchiveStats
+from modules.archive.archive_progress import ProgressReporter
+
+
+class FakeMessage:
+    def __init__(self):
+        self.embeds = []
+        self.edits = []
+
+    async def edit(self, embed):
+        self.edits.append(embed.description)
+
+
+def test_combined_stats():
+    first = ArchiveStats(messages_archived=3, bytes_downloaded=100, last_message_id=5)
+    second = ArchiveStats(messages_archived=4, bytes_downloaded=50, bytes_written=20)
+
+    total = ArchiveStats.combined([first, second])
+    assert total.messages_archived == 7
+    assert total.bytes_downloaded == 150
+    assert total.bytes_written == 20
+    assert total.last_message_id is None
+    assert total.started_at == first.started_at
+    assert "Messages scanned: 7" in total.describe_progress()
+
+
+def test_reporter_only_edits_when_progress_changes():
+    message = FakeMessage()
+    progress = {"done": 0}
+
+    def make_embed():
+        return nextcord.Embed(description=f"{progress['done']} done")
+
+    async def archive():
+        async with ProgressReporter(message, make_embed, interval=0.01):
+            await asyncio.sleep(0.05)
+            progress["done"] = 1
+            await asyncio.sleep(0.05)
+
+    asyncio.run(archive())
+    assert message.edits == ["0 done", "1 done"]
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from modules.archive import archive_constants
+from modules.archive.archive_exporters import BatchWriter
+from modules.archive.archive_jobs import ArchiveCancelled, CancelToken
+from modules.archive.archive_search import SearchIndex, to_match_query
+
+GUILD_ID = 1
+
+
+def make_record(message_id, content, display_name="Kev", name="kev", filenames=()):
+    """A message record as archive_exporters.message_record makes it"""
+    return {
+        "id": message_id,
+        "created_at": "2024-01-02T03:04:05+00:00",
+        "author": {"id": 7, "name": name, "display_name": display_name},
+        "clean_content": content,
+        "attachments": [{"filename": filename} for filename in filenames],
+    }
+
+
+def make_index(tmp_path, channels):
+    index = SearchIndex(str(tmp_path / "index.sqlite3"))
+    for channel_id, (channel_name, records) in enumerate(channels.items()):
+        with index.writer(GUILD_ID, channel_id, channel_name) as writer:
+            for record in records:
+                writer.write(record)
+    return index
+
+
+def test_search_ranks_and_highlights(tmp_path):
+    index = make_index(
+        tmp_path,
+        {
+            "kev-confessional": [
+                make_record(1, "the plan is to vote out the seer"),
+                make_record(2, "plan plan plan"),
+                make_record(3, "nothing to see here"),
+            ]
+        },
+    )
+
+    hits = index.search(GUILD_ID, "plan")
+    assert [hit.message_id for hit in hits] == [2, 1]
+    assert hits[1].snippet == "the **plan** is to vote out the seer"
+    assert hits[1].channel_name == "kev-confessional"
+    # Every word has to match
+    assert [hit.message_id for hit in index.search(GUILD_ID, "plan seer")] == [1]
+    # A page at a time
+    assert [hit.message_id for hit in index.search(GUILD_ID, "plan", limit=1, offset=1)] == [1]
+
+
+def test_search_filters(tmp_path):
+    index = make_index(
+        tmp_path,
+        {
+            "general": [make_record(1, "hello", display_name="Kev", name="kev")],
+            "other": [
+                make_record(2, "hello", display_name="Sam", name="sam"),
+                make_record(3, "see img.png", filenames=["img.png"]),
+            ],
+        },
+    )
+
+    assert [hit.message_id for hit in index.search(GUILD_ID, "hello", author="KEV")] == [1]
+    assert [hit.message_id for hit in index.search(GUILD_ID, "hello", author="sam")] == [2]
+    assert [hit.message_id for hit in index.search(GUILD_ID, "hello", channel_name="#other")] == [2]
+    assert index.search(GUILD_ID + 1, "hello") == []
+    # Attachments can be found by name
+    assert [hit.message_id for hit in index.search(GUILD_ID, "img.png")] == [3]
+
+
+def test_archiving_again_replaces_messages(tmp_path):
+    index = make_index(tmp_path, {"general": [make_record(1, "first draft")]})
+    with index.writer(GUILD_ID, 0, "general") as writer:
+        writer.write(make_record(1, "final draft"))
+
+    assert [hit.snippet for hit in index.search(GUILD_ID, "draft")] == ["final **draft**"]
+
+
+def test_query_syntax_is_searched_as_text(tmp_path):
+    index = make_index(tmp_path, {"general": [make_record(1, 'she said "NOT" again')]})
+
+    assert to_match_query('"NOT" OR') == 'content : ("""NOT""" "OR")'
+    assert [hit.message_id for hit in index.search(GUILD_ID, 'NOT "again')] == [1]
+    assert index.search(GUILD_ID, "   ") == []
+
+
+def test_failed_archive_is_taken_back_out_of_the_index(tmp_path):
+    index = make_index(tmp_path, {"general": [make_record(1, "secret plan v1")]})
+    cancel = CancelToken()
+
+    async def archive():
+        async with BatchWriter(
+            [lambda: index.writer(GUILD_ID, 0, "general")], batch_size=2, cancel=cancel
+        ) as writer:
+            for message_id in range(1, 2 * archive_constants.SEARCH_BATCH_SIZE):
+                await writer.write(make_record(message_id, f"secret plan v{message_id}"))
+            cancel.cancel()
+
+    with pytest.raises(ArchiveCancelled):
+        asyncio.run(archive())
+    # Even the batches already committed are gone, apart from the message indexed before
+    hits = index.search(GUILD_ID, "secret plan")
+    assert [hit.message_id for hit in hits] == [1]
+    assert "v1" in hits[0].snippet
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import zipfile
+from types import SimpleNamespace
+
+import nextcord
+import pytest
+
+from modules.archive.archive_volumes import VolumeWriter, get_compression
+from modules.archive.cog import ArchiveCog
+
+LIMIT = 10_000
+
+
+def test_single_volume_is_not_numbered(tmp_path):
+    zip_path = str(tmp_path / "chan_archive.zip")
+    with VolumeWriter(zip_path, LIMIT) as volumes:
+        volumes.writestr("a.png", b"a" * 100)
+        volumes.writestr("b.png", b"b" * 100)
+    assert volumes.paths == [zip_path]
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.namelist() == ["a.png", "b.png"]
+
+
+@pytest.mark.parametrize("compress_type", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_volumes_stay_under_limit(tmp_path, compress_type):
+    zip_path = str(tmp_path / "chan_archive.zip")
+    names = [f"img ({n}).png" for n in range(20)]
+    with VolumeWriter(zip_path, LIMIT, lambda arcname: (compress_type, None)) as volumes:
+        for name in names:
+            volumes.writestr(name, os.urandom(3_000))
+
+    assert volumes.paths == [
+        str(tmp_path / f"chan_archive_part{n}.zip") for n in range(1, len(volumes.paths) + 1)
+    ]
+    archived = []
+    for path in volumes.paths:
+        assert os.path.getsize(path) <= LIMIT
+        with zipfile.ZipFile(path) as zf:
+            archived.extend(zf.namelist())
+    # Nothing is dropped, and the order is kept across volumes
+    assert archived == names
+
+
+def test_fits(tmp_path):
+    volumes = VolumeWriter(str(tmp_path / "chan_archive.zip"), LIMIT)
+    assert volumes.fits("a.png", LIMIT // 2)
+    assert not volumes.fits("a.png", LIMIT)
+    assert VolumeWriter(str(tmp_path / "unlimited.zip")).fits("a.png", LIMIT * 100)
+
+
+def test_compression_per_entry(tmp_path):
+    assert get_compression("archive/images/IMG.JPG") == (zipfile.ZIP_STORED, None)
+    assert get_compression("archive/images/notes.txt")[0] == zipfile.ZIP_DEFLATED
+
+    zip_path = str(tmp_path / "chan_archive.zip")
+    with VolumeWriter(zip_path) as volumes:
+        volumes.writestr("photo.png", b"a" * 1_000)
+        volumes.writestr("notes.txt", b"a" * 1_000)
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.getinfo("photo.png").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("notes.txt").compress_type == zipfile.ZIP_DEFLATED
+
+
+def make_volumes(tmp_path, sizes):
+    paths = []
+    for n, size in enumerate(sizes, start=1):
+        path = tmp_path / f"chan_archive_part{n}.zip"
+        path.write_bytes(os.urandom(size))
+        paths.append(nextcord.File(str(path)))
+    return paths
+
+
+class FakeDestination:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, file=None, embed=None):
+        self.sent.append((file, embed))
+        return SimpleNamespace(file=file, embed=embed)
+
+
+def test_linked_attachments_are_pointed_out(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cog = ArchiveCog(None)
+    channel = SimpleNamespace(mention="#chan")
+    volumes = make_volumes(tmp_path, [1_000, 1_000])
+    files, embed = cog.get_file_and_embed(
+        channel, LIMIT, volumes, 2_000, None, 100, attachments_linked=2
+    )
+    assert files == volumes
+    assert [field.name for field in embed.fields] == ["Archive Split", "Attachments Linked"]
+    assert "2 attachments in #chan" in embed.fields[1].value
+
+    # Even a single volume isn't sent plainly, so ~close doesn't take it as a complete archive
+    files, embed = cog.get_file_and_embed(
+        channel, LIMIT, volumes[:1], 1_000, None, 100, attachments_linked=1
+    )
+    assert [field.name for field in embed.fields] == ["Attachments Linked"]
+    assert cog.get_file_and_embed(channel, LIMIT, volumes[:1], 1_000, None, 100)[1] is None
+
+    # The warning goes on the last message, which is the one ~close checks
+    destination = FakeDestination()
+    last = asyncio.run(cog.send_archive(destination, volumes, embed, attachments_linked=True))
+    assert [sent_embed for _, sent_embed in destination.sent] == [None, embed]
+    assert last.embed is embed
+
+
+def test_oversized_volume_is_not_sent(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cog = ArchiveCog(None)
+    volumes = make_volumes(tmp_path, [1_000, LIMIT + 1])
+    files, embed = cog.get_file_and_embed(
+        SimpleNamespace(mention="#chan"), LIMIT, volumes, LIMIT + 1_001, None, 100
+    )
+    assert files == []
+    assert embed.fields[0].name == "ERROR: Archive Too Big"
+    assert all(volume.fp.closed for volume in volumes)
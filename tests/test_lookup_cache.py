@@ -0,0 +1,112 @@
+import asyncio
+
+from modules.lookup.lookup_cache import LookupCache, SingleFlight, cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_results_expire():
+    clock = FakeClock()
+    cache = LookupCache(max_size=10, ttl=60, clock=clock)
+    cache.put("a", ["result"])
+    assert cache.get("a") == ["result"]
+    clock.now += 61
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(cache) == 0
+
+
+def test_least_recently_used_is_dropped():
+    cache = LookupCache(max_size=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_saved_results_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.json")
+    clock = FakeClock()
+    cache = LookupCache(max_size=10, ttl=60, path=path, clock=clock)
+    cache.put("old", "page")
+    clock.now += 30
+    cache.put("new", "other page")
+    cache.save()
+    assert not cache.dirty
+
+    clock.now += 40
+    reloaded = LookupCache(max_size=10, ttl=60, path=path, clock=clock)
+    assert reloaded.get("old") is None
+    assert reloaded.get("new") == "other page"
+
+
+def test_cache_key():
+    assert cache_key("  Harry   POTTER ", "wikipedia") == cache_key("harry potter", "wikipedia")
+    assert cache_key("harry potter", "wikipedia") != cache_key("harry potter", "google")
+    # Case matters in nutrimatic patterns
+    assert cache_key(" <CVC> ", "nutrimatic", exact=True) == cache_key("<CVC>", "nutrimatic", True)
+    assert cache_key("<CVC>", "nutrimatic", exact=True) != cache_key("<cvc>", "nutrimatic", True)
+
+
+def test_single_flight_shares_in_flight_fetches():
+    flights = SingleFlight()
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        await asyncio.sleep(0.05)
+        return "page"
+
+    async def lookup():
+        first = await asyncio.gather(*(flights.run("a", fetch) for _ in range(5)))
+        # Once it's done, the next call fetches again
+        second = await flights.run("a", fetch)
+        return first, second
+
+    first, second = asyncio.run(lookup())
+    assert first == ["page"] * 5
+    assert second == "page"
+    assert len(fetches) == 2
+    assert flights.shared == 4
+    assert len(flights) == 0
+
+
+def test_single_flight_survives_a_caller_giving_up():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "page"
+
+    async def lookup():
+        impatient = asyncio.create_task(flights.run("a", fetch))
+        patient = asyncio.create_task(flights.run("a", fetch))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(lookup()) == "page"
+
+
+def test_single_flight_shares_errors():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ConnectionError("down")
+
+    async def lookup():
+        return await asyncio.gather(
+            *(flights.run("a", fetch) for _ in range(3)), return_exceptions=True
+        )
+
+    assert all(isinstance(error, ConnectionError) for error in asyncio.run(lookup()))
@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+
+from modules.lookup import lookup_hpwiki
+
+DUMP = os.path.join(os.path.dirname(__file__), "fixtures", "hpwiki", "dump.xml")
+
+
+def make_index():
+    index = lookup_hpwiki.build_index(DUMP)
+    return lookup_hpwiki.HPWikiIndex(index["articles"], index["aliases"])
+
+
+def test_dump_is_read_for_articles_and_redirects():
+    assert lookup_hpwiki.build_index(DUMP) == {
+        "articles": [
+            "Harry Potter",
+            "Harry Potter and the Philosopher's Stone",
+            "Hedwig",
+            "Hogwarts School of Witchcraft and Wizardry",
+            "Hogwarts: A History",
+        ],
+        # The redirect to a missing page, and the talk and category pages, are left out
+        "aliases": {
+            "Boy Who Lived": "Harry Potter",
+            "Hogwarts": "Hogwarts School of Witchcraft and Wizardry",
+        },
+    }
+
+
+def test_titles_and_aliases_are_found():
+    index = make_index()
+    assert index.find("hedwig") == "Hedwig"
+    assert index.find("Boy who lived") == "Harry Potter"
+    # An alias doesn't hide a title that starts with the same words
+    assert index.find("hogwarts a history") == "Hogwarts: A History"
+    assert index.find("hogwarts") == "Hogwarts School of Witchcraft and Wizardry"
+
+
+def test_prefixes_and_typos_are_matched():
+    index = make_index()
+    assert index.find("harry potter and the phil") == "Harry Potter and the Philosopher's Stone"
+    assert index.find("Hedwg") == "Hedwig"
+    assert index.find("Harry Poter") == "Harry Potter"
+    # Too short to be worth guessing from, and nothing close
+    assert index.find("ha") is None
+    assert index.find("Voldemort") is None
+    assert index.find("?!") is None
+
+
+def test_lookup_gives_the_article_url_and_counts():
+    index = make_index()
+    assert index.lookup("philosopher's stone") is None
+    assert (
+        index.lookup("harry potter and the philosopher's stone")
+        == "https://harrypotter.fandom.com/wiki/Harry_Potter_and_the_Philosopher's_Stone"
+    )
+    assert (index.hits, index.misses) == (1, 1)
+
+
+def test_index_is_built_from_the_command_line(tmp_path):
+    index_path = tmp_path / "hpwiki_index.json"
+    subprocess.run(
+        [sys.executable, "-m", "modules.lookup.lookup_hpwiki", DUMP, str(index_path)],
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(__file__)),
+        capture_output=True,
+    )
+    assert json.loads(index_path.read_text())["aliases"]["Boy Who Lived"] == "Harry Potter"
+    index = lookup_hpwiki.load_index(str(index_path))
+    assert index.find("hedwig") == "Hedwig"
+    assert len(index) == 7
+    assert lookup_hpwiki.load_index(str(tmp_path / "missing.json")) is None
+    assert lookup_hpwiki.load_index(None) is None
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from modules.lookup import lookup_constants, lookup_nutrimatic
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "nutrimatic")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_results_and_end_of_search():
+    results, status = lookup_nutrimatic.parse_results(read_fixture("results.html"))
+    assert results == [("asymptote", 2.519574), ("as ymptote", 1.107731), ("a symptote", 0.983105)]
+    assert status == "No more results found."
+
+
+def test_full_page_is_cut_off_at_the_limit():
+    results, status = lookup_nutrimatic.parse_results(read_fixture("full_page.html"))
+    assert len(results) == lookup_constants.NUTRIMATIC_RESULT_LIMIT
+    assert results[0][0] == "word0"
+    # Weights of 10 and over are read whole
+    assert results[0][1] > 10
+    assert [weight for _, weight in results] == sorted(
+        (weight for _, weight in results), reverse=True
+    )
+    assert status is None
+
+
+@pytest.mark.parametrize(
+    "fixture, status",
+    [
+        ("syntax_error.html", "Syntax error: missing > in <abc"),
+        ("no_results.html", "No results found."),
+    ],
+)
+def test_status_when_there_are_no_results(fixture, status):
+    assert lookup_nutrimatic.parse_results(read_fixture(fixture)) == ([], status)
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from aiohttp import web
+
+from modules.lookup import lookup_constants, lookup_utils
+from modules.lookup.lookup_cache import LookupCache
+
+
+def fake_search(query, num, stop, pause):
+    """Blocks like googlesearch.search does while it pauses between pages"""
+    time.sleep(0.2)
+    yield f"https://example.com/{len(query)}"
+    yield f"https://{lookup_constants.WIKIPEDIA}.org/wiki/{query.split()[0]}"
+
+
+def test_search_returns_the_target_site_result(monkeypatch):
+    monkeypatch.setattr(lookup_utils.googlesearch, "search", fake_search)
+    assert asyncio.run(lookup_utils.search("Hedwig", lookup_constants.WIKI)) == [
+        "https://wikipedia.org/wiki/Hedwig"
+    ]
+
+
+def test_search_reuses_cached_results(monkeypatch):
+    calls = []
+
+    def counting_search(query, **kwargs):
+        calls.append(query)
+        return fake_search(query, **kwargs)
+
+    monkeypatch.setattr(lookup_utils.googlesearch, "search", counting_search)
+    cache = LookupCache(max_size=10, ttl=60)
+
+    async def lookup():
+        first = await lookup_utils.search("Hedwig", lookup_constants.WIKI, cache)
+        second = await lookup_utils.search("  hedwig ", lookup_constants.WIKIPEDIA, cache)
+        return first, second
+
+    first, second = asyncio.run(lookup())
+    assert first == second == ["https://wikipedia.org/wiki/Hedwig"]
+    assert calls == ["Hedwig wikipedia"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_identical_searches_share_one_fetch(monkeypatch):
+    calls = []
+
+    def counting_search(query, **kwargs):
+        calls.append(query)
+        return fake_search(query, **kwargs)
+
+    monkeypatch.setattr(lookup_utils.googlesearch, "search", counting_search)
+
+    async def lookup():
+        return await asyncio.gather(*(lookup_utils.search("Hedwig") for _ in range(3)))
+
+    results = asyncio.run(lookup())
+    assert results == [["https://example.com/6", "https://wikipedia.org/wiki/Hedwig"]] * 3
+    assert calls == ["Hedwig"]
+    assert results[0] is not results[1]
+
+
+def test_searches_run_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(lookup_utils.googlesearch, "search", fake_search)
+    loop_thread = threading.get_ident()
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(threading.get_ident())
+            await asyncio.sleep(0.01)
+
+    async def lookup():
+        ticker = asyncio.create_task(tick())
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(lookup_utils.search(f"query {n}") for n in range(lookup_constants.SEARCH_WORKERS))
+        )
+        elapsed = time.perf_counter() - start
+        ticker.cancel()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(lookup())
+    assert results[1] == ["https://example.com/7", "https://wikipedia.org/wiki/query"]
+    # The searches ran side by side, and the loop kept ticking meanwhile
+    assert elapsed < 0.2 * lookup_constants.SEARCH_WORKERS
+    assert len(ticks) > 5
+    assert set(ticks) == {loop_thread}
+
+
+class NutrimaticStandIn:
+    """A local nutrimatic that echoes the query, taking delay seconds to answer"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.queries = []
+        self.connections = set()
+
+    async def handle(self, request):
+        self.queries.append(request.query["q"])
+        self.connections.add(request.transport.get_extra_info("peername"))
+        await asyncio.sleep(self.delay)
+        return web.Response(text=f"<b>{request.query['q']}</b>", content_type="text/html")
+
+    async def run(self, test):
+        app = web.Application()
+        app.router.add_get("/", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await test(f"http://127.0.0.1:{port}/")
+        finally:
+            await runner.cleanup()
+
+
+def test_nutrimatic_client_reuses_its_connection_and_cache():
+    server = NutrimaticStandIn()
+
+    async def test(base_url):
+        client = lookup_utils.NutrimaticClient(base_url, cache=LookupCache(10, 60))
+        try:
+            return [await client.fetch(query) for query in ["a b", "c&d", "<e+f>#", "a b "]]
+        finally:
+            await client.close()
+
+    pages = asyncio.run(server.run(test))
+    assert pages == ["<b>a b</b>", "<b>c&d</b>", "<b><e+f>#</b>", "<b>a b</b>"]
+    assert len(server.connections) == 1
+    # The repeated pattern came from the cache
+    assert server.queries == ["a b", "c&d", "<e+f>#"]
+
+
+def test_nutrimatic_client_times_out():
+    server = NutrimaticStandIn(delay=1.0)
+
+    async def test(base_url):
+        client = lookup_utils.NutrimaticClient(base_url, timeout=0.1)
+        try:
+            await client.fetch("slow")
+        finally:
+            await client.close()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(server.run(test))
+
+
+def test_nutrimatic_client_shares_identical_queries():
+    server = NutrimaticStandIn(delay=0.1)
+
+    async def test(base_url):
+        client = lookup_utils.NutrimaticClient(base_url)
+        try:
+            return await asyncio.gather(*(client.fetch("<asympote_>") for _ in range(4)))
+        finally:
+            await client.close()
+
+    assert asyncio.run(server.run(test)) == ["<b><asympote_></b>"] * 4
+    assert server.queries == ["<asympote_>"]
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+import nextcord
+
+from utils.search_utils import Pages, PaginatorView
+
+
+class FakeResponse:
+    def __init__(self, edits):
+        self.edits = edits
+
+    async def edit_message(self, embed=None, view=None):
+        # The view reuses its embed, so remember what it said at the time
+        self.edits.append(embed.description if embed is not None else None)
+
+    async def defer(self):
+        self.edits.append("deferred")
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, **kwargs):
+        self.sent.append(kwargs)
+        return SimpleNamespace(edit=None)
+
+
+def make_interaction(edits):
+    return SimpleNamespace(user=SimpleNamespace(id=7), response=FakeResponse(edits))
+
+
+def test_pages_are_rendered_lazily_and_once():
+    rendered = []
+
+    async def page_source(page):
+        rendered.append(page)
+        await asyncio.sleep(0)
+        return f"page {page}" if page <= 2 else None
+
+    async def browse():
+        edits = []
+        channel = FakeChannel()
+        view = PaginatorView(
+            SimpleNamespace(id=7), page_source, nextcord.Embed(title="Results"), timeout=None
+        )
+        await view.start(channel)
+        assert channel.sent[0]["embed"].description == "page 1"
+        for button in (view.next, view.next, view.previous, view.next):
+            await button.callback(make_interaction(edits))
+        return view, edits
+
+    view, edits = asyncio.run(browse())
+    # Page 3 doesn't exist, so the view stayed on page 2 and only disabled next
+    assert edits == ["page 2", None, "page 1", "page 2"]
+    assert view.page == 2 and view.next.disabled
+    # Every click was answered with exactly one edit
+    assert rendered == [1, 2, 3]
+    assert view.embed.title == "Results (pg:2)"
+
+
+def test_only_the_author_can_turn_pages():
+    async def check():
+        view = PaginatorView(
+            SimpleNamespace(id=7), lambda page: "page", nextcord.Embed(title="Results")
+        )
+        return (
+            await view.interaction_check(SimpleNamespace(user=SimpleNamespace(id=7))),
+            await view.interaction_check(SimpleNamespace(user=SimpleNamespace(id=8))),
+        )
+
+    assert asyncio.run(check()) == (True, False)
+
+
+def make_pages(count, endflag=None):
+    ctx = SimpleNamespace(
+        bot=None, message=None, channel=FakeChannel(), author=SimpleNamespace(id=7)
+    )
+    return Pages(
+        ctx,
+        solutions=[f"word{n}" for n in range(count)],
+        weights=[n / 3 for n in range(count)],
+        embedTemp=nextcord.Embed(title="Nutrimatic"),
+        endflag=endflag,
+    )
+
+
+def test_pages_are_sliced_up_front():
+    pages = make_pages(31, endflag="Search complete")
+    assert pages.page_count == 3
+    assert pages.extractData().splitlines()[1] == "word1....................0.333"
+    assert pages.getPage(3) == "word30....................10.0\nSearch complete"
+    assert pages.getPage(4) is None
+    # An exactly full last page still gets the end flag, and no empty page follows it
+    assert (
+        make_pages(30, endflag="Done").getPage(2).endswith("word29....................9.667\nDone")
+    )
+    assert make_pages(30).page_count == 2
+    assert make_pages(0, endflag="No results").getPage(1) == "No results"
+
+
+def test_known_page_count_clamps_navigation_without_edits():
+    async def browse():
+        edits = []
+        pages = make_pages(20)
+        view = PaginatorView(pages.author, pages.getPage, pages.embed, pages.page_count)
+        await view.start(pages.channel)
+        assert view.embed.title == "Nutrimatic (pg:1/2)" and not view.next.disabled
+        for button in (view.next, view.next, view.first, view.first):
+            await button.callback(make_interaction(edits))
+        return view, edits
+
+    view, edits = asyncio.run(browse())
+    # Going past the last page or back to the current one only acknowledges the click
+    assert edits == [
+        "\n".join(f"word{n}....................{round(n / 3, 3)}" for n in range(15, 20)),
+        "deferred",
+        "\n".join(f"word{n}....................{round(n / 3, 3)}" for n in range(15)),
+        "deferred",
+    ]
+    assert view.embed.title == "Nutrimatic (pg:1/2)"
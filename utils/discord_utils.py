@@ -232,7 +232,8 @@ def split_embed(embed: nextcord.Embed) -> List[nextcord.Embed]:
     Returns
         - embed_list (List[nextcord.Embed]):
     """
-    if embed.title == nextcord.Embed.Empty:
+    # Newer nextcord versions leave an empty title as None rather than Embed.Empty
+    if not embed.title:
         embed.title = ""
     EMBED_CHARACTER_LIMIT = 2000
     FIELD_CHARACTER_LIMIT = 1024
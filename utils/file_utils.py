@@ -0,0 +1,11 @@
+import json
+import os
+from typing import Any
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+    """Save data to path as JSON. It's written to a temp file first and moved into place, so a
+    crash partway through leaves the old file rather than half of the new one"""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
@@ -1,9 +1,111 @@
 # from  https://github.com/Moonrise55/Mbot/blob/f4e19df1df9fa4ef1a7730e63aa8009894aa304c/utils/paginator.py#L8
 
-import asyncio
+import inspect
+from typing import Awaitable, Callable, Dict, Optional, Union
 
 import nextcord
 
+# A page source gets a page number, counting from 1, and returns the text of that page, or None
+# if there's no such page. It may be a coroutine function, so pages can be fetched only once
+# they're needed rather than all up front
+PageSource = Callable[[int], Union[Optional[str], Awaitable[Optional[str]]]]
+
+
+class PaginatorView(nextcord.ui.View):
+    """Buttons for paging through results, one embed description per page.
+
+    Pages are rendered by page_source the first time they're shown, and remembered after that.
+    Each click is answered with a single edit of the message, or none if the page stays the
+    same. Only the author can turn the pages, and the buttons are removed once they stop or
+    time out. With a page_count, pages are shown as "pg x/N" and navigation stops at the last.
+    """
+
+    def __init__(
+        self,
+        author: Union[nextcord.User, nextcord.Member],
+        page_source: PageSource,
+        embed: nextcord.Embed,
+        page_count: Optional[int] = None,
+        timeout: float = 120.0,
+    ):
+        super().__init__(timeout=timeout)
+        self.author = author
+        self.page_source = page_source
+        self.page_count = page_count
+        # The last page, once it's known
+        self.last_page = page_count
+        self.embed = embed
+        self.title = embed.title
+        self.page = 1
+        self.message: Optional[nextcord.Message] = None
+        self._rendered: Dict[int, Optional[str]] = {}
+
+    async def render(self, page: int) -> Optional[str]:
+        """Get the text of a page, or None if there's no such page"""
+        if page not in self._rendered:
+            text = self.page_source(page)
+            if inspect.isawaitable(text):
+                text = await text
+            self._rendered[page] = text
+        return self._rendered[page]
+
+    def show(self, page: int, text: Optional[str]) -> None:
+        self.page = page
+        self.embed.description = text
+        if self.page_count is None:
+            self.embed.title = f"{self.title} (pg:{page})"
+        else:
+            self.embed.title = f"{self.title} (pg:{page}/{self.page_count})"
+        self.first.disabled = self.previous.disabled = page == 1
+        self.next.disabled = self.last_page is not None and page >= self.last_page
+
+    async def start(self, channel: nextcord.abc.Messageable) -> None:
+        """Send the first page, with the buttons"""
+        self.show(1, await self.render(1))
+        self.message = await channel.send(embed=self.embed, view=self)
+
+    async def go_to(self, page: int, interaction: nextcord.Interaction) -> None:
+        if self.last_page is not None:
+            page = min(page, self.last_page)
+        # Nothing to change, the click is just acknowledged
+        if page == self.page:
+            await interaction.response.defer()
+            return
+        text = await self.render(page)
+        if text is None:
+            # Past the last page, which is now known
+            self.last_page = self.page
+            self.next.disabled = True
+            await interaction.response.edit_message(view=self)
+            return
+        self.show(page, text)
+        await interaction.response.edit_message(embed=self.embed, view=self)
+
+    async def interaction_check(self, interaction: nextcord.Interaction) -> bool:
+        return interaction.user is not None and interaction.user.id == self.author.id
+
+    @nextcord.ui.button(emoji="\u23EA")
+    async def first(self, button: nextcord.ui.Button, interaction: nextcord.Interaction):
+        await self.go_to(1, interaction)
+
+    @nextcord.ui.button(emoji="\u25C0")
+    async def previous(self, button: nextcord.ui.Button, interaction: nextcord.Interaction):
+        await self.go_to(max(1, self.page - 1), interaction)
+
+    @nextcord.ui.button(emoji="\u25B6")
+    async def next(self, button: nextcord.ui.Button, interaction: nextcord.Interaction):
+        await self.go_to(self.page + 1, interaction)
+
+    @nextcord.ui.button(emoji="\u274C")
+    async def close(self, button: nextcord.ui.Button, interaction: nextcord.Interaction):
+        self.stop()
+        await interaction.response.edit_message(view=None)
+
+    async def on_timeout(self) -> None:
+        if self.message is not None:
+            await self.message.edit(view=None)
+
+
 # set up pagination of results
 
 
@@ -26,92 +128,33 @@ class Pages:
         self.embed = embedTemp
         self.title = embedTemp.title
         self.description = None
-        self.first = True
-        self.loopState = True
-        self.reactAll = [
-            "\u23EA",  # first
-            "\u25C0",  # left
-            "\u25B6",  # right
-            "\u274C",  # stop
-        ]
+        # Every page is rendered up front, as it's only a few hundred lines at most
+        lines = solutions
+        if weights:
+            lines = [
+                f"{solution}....................{round(weight, 3)}"
+                for solution, weight in zip(solutions, weights)
+            ]
+        self.pages = [
+            "\n".join(lines[start : start + self.numsol])
+            for start in range(0, len(lines), self.numsol)
+        ] or [""]
+        if endflag:
+            self.pages[-1] = f"{self.pages[-1]}\n{endflag}" if lines else endflag
+        self.page_count = len(self.pages)
 
     def extractData(self):
-        final = []
-        finalend = []
-        start = (self.page - 1) * self.numsol
-        end = start + self.numsol
-
-        # check if request page empty
-        if start > len(self.solutions):
-            self.page = self.page - 1
-            start = (self.page - 1) * self.numsol
-            end = start + self.numsol
-
-        # check if request page partial
-        if end >= len(self.solutions):
-            end = len(self.solutions)
-            if self.endflag:
-                finalend = self.endflag
-
-        for n in range(start, end):
-            if self.weights:
-                line = self.solutions[n] + "...................." + str(round(self.weights[n], 3))
-            else:
-                line = self.solutions[n]
-            final.append(line)
-        final = "\n".join(final)
-
-        if finalend:
-            final = final + "\n" + finalend
-
-        return final
-
-    async def sendPage(self):
-        final = self.extractData()
-        self.embed.description = final
-        self.embed.title = self.title + " (pg:" + str(self.page) + ")"
-
-        if self.first:
-            self.message = await self.channel.send(embed=self.embed)
-            self.first = False
-        else:
-            await self.message.edit(embed=self.embed)
+        self.page = min(max(self.page, 1), self.page_count)
+        return self.pages[self.page - 1]
 
-        for react in self.reactAll:
-            await self.message.add_reaction(react)
+    def getPage(self, page):
+        """Page source for the paginator"""
+        if not 1 <= page <= self.page_count:
+            return None
+        self.page = page
+        return self.pages[page - 1]
 
     async def pageLoop(self):
-        def check(reaction, user):
-            if user != self.author:
-                return False
-            if str(reaction.emoji) not in self.reactAll:
-                return False
-            if reaction.message.id != self.message.id:
-                return False
-            return True
-
-        while self.loopState:
-            await self.sendPage()
-
-            try:
-                reaction, user = await self.bot.wait_for("reaction_add", check=check, timeout=120.0)
-
-            except asyncio.TimeoutError:
-                await self.message.clear_reactions()
-                self.loopState = False
-                # await self.channel.send('I timed out')
-
-            else:
-                await self.message.remove_reaction(reaction, user)
-                # await self.channel.send(reaction)
-
-                if str(reaction.emoji) == self.reactAll[0]:
-                    self.page = 1
-                elif str(reaction.emoji) == self.reactAll[1]:
-                    if self.page != 1:
-                        self.page = self.page - 1
-                elif str(reaction.emoji) == self.reactAll[2]:
-                    self.page = self.page + 1
-                elif str(reaction.emoji) == self.reactAll[3]:
-                    await self.message.clear_reactions()
-                    self.loopState = False
+        view = PaginatorView(self.author, self.getPage, self.embed, self.page_count)
+        await view.start(self.channel)
+        await view.wait()